@@ -0,0 +1,179 @@
+"""
+Shared OpenWeatherMap call budget for every fetcher process.
+
+A token bucket (per-minute rate) plus a monthly counter, kept in a small JSON
+state file and updated under an exclusive lock file, so the GUI's radar and
+weather jobs see the same budget even though they run as separate processes.
+
+Lower-priority callers keep a reserve free for higher-priority ones and are
+deferred (acquire returns False) instead of blocking for long or failing.
+
+Run `python3 api_budget.py` to print calls used versus budget.
+"""
+import fcntl
+import json
+import os
+import time
+from contextlib import contextmanager
+from datetime import datetime
+import config
+import metrics
+import working_store
+
+STATE_PATH = os.path.join(working_store.directory("weatherdata"), "api_budget.json")
+LOCK_PATH = os.path.join(working_store.directory("weatherdata"), "api_budget.lock")
+
+# Priorities, most important first
+HOME = "home"
+RADAR = "radar"
+REGIONAL = "regional"
+PRIORITIES = (HOME, RADAR, REGIONAL)
+
+# Share of the per-minute bucket / monthly budget each priority must leave for the ones above it
+MINUTE_RESERVE = {HOME: 0.0, RADAR: 0.1, REGIONAL: 0.25}
+MONTH_RESERVE = {HOME: 0.0, RADAR: 0.02, REGIONAL: 0.05}
+
+# How long each priority will wait for a token before being deferred (seconds)
+MAX_WAIT = {HOME: 60, RADAR: 30, REGIONAL: 5}
+
+
+class BudgetDeferred(Exception):
+    """Raised by callers when the budget scheduler deferred a request."""
+
+
+def load_limits():
+    """The budget from settings (free-tier defaults)."""
+    settings = config.get_config()
+    return settings.api_calls_per_minute, settings.api_calls_per_month
+
+
+@contextmanager
+def locked_state(save=True):
+    """Yield the budget state dict under an exclusive cross-process lock, then save it (if `save`).
+
+    The state is rewritten on every call that takes a token, so it's saved
+    without an fsync: it's only a rate limiter, and losing the last few calls
+    to a power cut costs at most a few calls of headroom.
+    """
+    os.makedirs(os.path.dirname(STATE_PATH), exist_ok=True)
+    with open(LOCK_PATH, "a") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            try:
+                with open(STATE_PATH, "r") as f:
+                    state = json.load(f)
+            except (FileNotFoundError, json.JSONDecodeError):
+                state = {}
+            yield state
+            if save:
+                temp_path = f"{STATE_PATH}.tmp"
+                with open(temp_path, "w") as f:
+                    json.dump(state, f)
+                os.replace(temp_path, STATE_PATH)
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def refill(state, per_minute, now):
+    """Bring the bucket and counters in `state` up to date."""
+    month = datetime.now().strftime("%Y-%m")
+    if state.get("month") != month:
+        state["month"] = month
+        state["month_calls"] = 0
+        state["calls_by_priority"] = {priority: 0 for priority in PRIORITIES}
+        state["deferred_by_priority"] = {priority: 0 for priority in PRIORITIES}
+
+    last = state.get("updated", now)
+    tokens = state.get("tokens", float(per_minute))
+    state["tokens"] = min(float(per_minute), tokens + (now - last) * per_minute / 60.0)
+    state["updated"] = now
+    # Call times in the last minute, for the dashboard
+    state["recent_calls"] = [t for t in state.get("recent_calls", []) if now - t < 60]
+
+
+def try_take(priority, count=1):
+    """Take `count` tokens if the budget allows. Returns (taken, seconds to wait before retrying)."""
+    per_minute, per_month = load_limits()
+    now = time.time()
+    with locked_state() as state:
+        refill(state, per_minute, now)
+
+        month_limit = per_month * (1 - MONTH_RESERVE[priority])
+        if state["month_calls"] + count > month_limit:
+            return False, None  # Won't free up until next month
+
+        floor = per_minute * MINUTE_RESERVE[priority]
+        if state["tokens"] - count >= floor:
+            state["tokens"] -= count
+            state["month_calls"] += count
+            state["calls_by_priority"][priority] = state["calls_by_priority"].get(priority, 0) + count
+            state["recent_calls"].extend([now] * count)
+            return True, 0
+
+        if count > per_minute - floor:
+            return False, None  # More than this priority can ever hold at once
+        shortfall = count + floor - state["tokens"]
+        return False, shortfall * 60.0 / per_minute
+
+
+def acquire(priority, count=1, max_wait=None):
+    """Wait for `count` tokens at `priority`. Returns False if the request should be deferred."""
+    max_wait = MAX_WAIT[priority] if max_wait is None else max_wait
+    deadline = time.time() + max_wait
+    while True:
+        taken, retry_in = try_take(priority, count)
+        if taken:
+            metrics.inc("weather_api_calls_total", count, priority=priority)
+            return True
+        if retry_in is None or time.time() + retry_in > deadline:
+            record_deferred(priority)
+            metrics.inc("weather_api_deferred_total", count, priority=priority)
+            return False
+        time.sleep(retry_in)
+
+
+def record_deferred(priority):
+    per_minute, _ = load_limits()
+    with locked_state() as state:
+        refill(state, per_minute, time.time())
+        deferred = state["deferred_by_priority"]
+        deferred[priority] = deferred.get(priority, 0) + 1
+
+
+def throttled():
+    """Empty the bucket after the server answered 429, so every process backs off."""
+    per_minute, _ = load_limits()
+    with locked_state() as state:
+        refill(state, per_minute, time.time())
+        state["tokens"] = 0.0
+
+
+def status():
+    """Return a snapshot of calls used versus budget."""
+    per_minute, per_month = load_limits()
+    with locked_state(save=False) as state:
+        refill(state, per_minute, time.time())
+        return {
+            "tokens_available": round(state["tokens"], 1),
+            "calls_last_minute": len(state["recent_calls"]),
+            "per_minute_budget": per_minute,
+            "month": state["month"],
+            "month_calls": state["month_calls"],
+            "per_month_budget": per_month,
+            "calls_by_priority": dict(state["calls_by_priority"]),
+            "deferred_by_priority": dict(state["deferred_by_priority"]),
+        }
+
+
+def main():
+    info = status()
+    print(f"Last minute: {info['calls_last_minute']}/{info['per_minute_budget']} calls "
+          f"({info['tokens_available']} tokens available)")
+    month_pct = 100 * info["month_calls"] / info["per_month_budget"] if info["per_month_budget"] else 0
+    print(f"Month {info['month']}: {info['month_calls']}/{info['per_month_budget']} calls ({month_pct:.1f}%)")
+    for priority in PRIORITIES:
+        print(f"  {priority:<9} calls: {info['calls_by_priority'].get(priority, 0):>8}  "
+              f"deferred: {info['deferred_by_priority'].get(priority, 0):>6}")
+
+if __name__ == "__main__":
+    main()
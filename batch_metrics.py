@@ -0,0 +1,207 @@
+"""
+Derived weather metrics for many observations at once.
+
+Works on column arrays (one NumPy array per field) and computes every
+derived field in a single vectorized pass. The formulas mirror the scalar
+helpers in get_weather.py (calculate_dew_point, wind_direction_cardinal) and
+the scalar references below (scalar_heat_index, scalar_wind_chill), and
+produce the same values.
+
+Run `python3 batch_metrics.py --bench` to check results against the scalar
+versions and time both for growing batch sizes.
+"""
+import math
+import time
+import numpy as np
+from history_store import FIELDS as HISTORY_FIELDS
+
+CARDINAL_DIRECTIONS = np.array(['N', 'NE', 'E', 'SE', 'S', 'SW', 'W', 'NW'])
+
+HPA_TO_INHG = 0.02953
+METERS_PER_MILE = 1609.34
+MPH_TO_KMH = 1.609344
+MPH_TO_MS = 0.44704
+
+
+def column(values):
+    """Float array from a sequence, with None as NaN."""
+    return np.array([math.nan if value is None else value for value in values], dtype=float)
+
+
+def columns_from_responses(responses):
+    """Column arrays from a list of raw OWM current-weather responses."""
+    return {
+        'temperature': column([r['main'].get('temp') for r in responses]),
+        'humidity_percent': column([r['main'].get('humidity') for r in responses]),
+        'pressure_hpa': column([r['main'].get('pressure') for r in responses]),
+        'wind_speed_mph': column([r.get('wind', {}).get('speed', 0) for r in responses]),
+        'wind_deg': column([r.get('wind', {}).get('deg', 0) for r in responses]),
+        'visibility_m': column([r.get('visibility', 0) for r in responses]),
+    }
+
+
+def columns_from_history(records):
+    """Column arrays from history_store records (timestamp, *history_store.FIELDS)."""
+    table = np.array(records, dtype=float).reshape(-1, len(HISTORY_FIELDS) + 1)
+    columns = {'timestamp': table[:, 0]}
+    for index, field in enumerate(HISTORY_FIELDS, start=1):
+        columns[field] = table[:, index]
+    columns['pressure_hpa'] = columns.pop('pressure_inhg') / HPA_TO_INHG
+    return columns
+
+
+def dew_point(temp, humidity):
+    """Dew point (F), same formula and rounding as get_weather.calculate_dew_point."""
+    temp_c = (temp - 32) * 5 / 9
+    a = 17.27
+    b = 237.7
+    alpha = (a * temp_c) / (b + temp_c) + (humidity / 100.0)
+    return np.round((b * alpha) / (a - alpha) * 9 / 5 + 32, 2)
+
+
+def heat_index(temp, humidity):
+    """Heat index (F), same as scalar_heat_index."""
+    simple = 0.5 * (temp + 61.0 + (temp - 68.0) * 1.2 + humidity * 0.094)
+    full = (-42.379 + 2.04901523 * temp + 10.14333127 * humidity
+            - 0.22475541 * temp * humidity - 0.00683783 * temp * temp
+            - 0.05481717 * humidity * humidity + 0.00122874 * temp * temp * humidity
+            + 0.00085282 * temp * humidity * humidity - 0.00000199 * temp * temp * humidity * humidity)
+
+    dry = (humidity < 13) & (temp >= 80) & (temp <= 112)
+    with np.errstate(invalid='ignore'):  # sqrt of a negative outside the dry range; masked out below
+        dry_adjustment = ((13 - humidity) / 4) * np.sqrt((17 - np.abs(temp - 95)) / 17)
+    humid = (humidity > 85) & (temp >= 80) & (temp <= 87)
+    humid_adjustment = ((humidity - 85) / 10) * ((87 - temp) / 5)
+    full = np.where(dry, full - dry_adjustment, np.where(humid, full + humid_adjustment, full))
+
+    return np.round(np.where((simple + temp) / 2 < 80, simple, full), 2)
+
+
+def wind_chill(temp, wind_speed):
+    """Wind chill (F), same as scalar_wind_chill."""
+    wind_factor = np.power(np.maximum(wind_speed, 0), 0.16)
+    chill = 35.74 + 0.6215 * temp - 35.75 * wind_factor + 0.4275 * temp * wind_factor
+    return np.round(np.where((temp > 50) | (wind_speed < 3), temp, chill), 2)
+
+
+def wind_direction_cardinal(degrees):
+    """Cardinal directions, same rounding as get_weather.wind_direction_cardinal."""
+    return CARDINAL_DIRECTIONS[np.round(degrees / 45).astype(int) % 8]
+
+
+def compute_metrics(columns):
+    """All derived fields for a batch of observations, one array per field."""
+    temp = columns['temperature']
+    humidity = columns['humidity_percent']
+    wind_speed = columns['wind_speed_mph']
+    heat = heat_index(temp, humidity)
+    chill = wind_chill(temp, wind_speed)
+    return {
+        'dewpoint': dew_point(temp, humidity),
+        'heat_index': heat,
+        'wind_chill': chill,
+        'feels_like': np.where(chill < temp, chill, np.where(temp >= 80, heat, temp)),
+        'wind_direction': wind_direction_cardinal(np.nan_to_num(columns['wind_deg'])),
+        'temperature_c': (temp - 32) * 5 / 9,
+        'wind_speed_kmh': wind_speed * MPH_TO_KMH,
+        'wind_speed_ms': wind_speed * MPH_TO_MS,
+        'pressure_inhg': columns['pressure_hpa'] * HPA_TO_INHG,
+        'visibility_miles': columns.get('visibility_m', np.zeros_like(temp)) / METERS_PER_MILE,
+    }
+
+
+# Scalar references for the bench (the one-observation-at-a-time way)
+
+def scalar_heat_index(temp, humidity):
+    """Heat index (F): NWS Rothfusz regression with its low/high humidity adjustments."""
+    simple = 0.5 * (temp + 61.0 + (temp - 68.0) * 1.2 + humidity * 0.094)
+    if (simple + temp) / 2 < 80:
+        return round(simple, 2)
+    heat_index = (-42.379 + 2.04901523 * temp + 10.14333127 * humidity
+                  - 0.22475541 * temp * humidity - 0.00683783 * temp * temp
+                  - 0.05481717 * humidity * humidity + 0.00122874 * temp * temp * humidity
+                  + 0.00085282 * temp * humidity * humidity - 0.00000199 * temp * temp * humidity * humidity)
+    if humidity < 13 and 80 <= temp <= 112:
+        heat_index -= ((13 - humidity) / 4) * math.sqrt((17 - abs(temp - 95)) / 17)
+    elif humidity > 85 and 80 <= temp <= 87:
+        heat_index += ((humidity - 85) / 10) * ((87 - temp) / 5)
+    return round(heat_index, 2)
+
+
+def scalar_wind_chill(temp, wind_speed):
+    """Wind chill (F): NWS formula, only defined at or below 50F with at least 3 mph of wind."""
+    if temp > 50 or wind_speed < 3:
+        return round(temp, 2)
+    wind_factor = wind_speed ** 0.16
+    return round(35.74 + 0.6215 * temp - 35.75 * wind_factor + 0.4275 * temp * wind_factor, 2)
+
+
+def random_columns(count, seed=0):
+    """Plausible random observations for benchmarking."""
+    rng = np.random.default_rng(seed)
+    return {
+        'temperature': rng.uniform(-30, 115, count).round(2),
+        'humidity_percent': rng.integers(1, 101, count).astype(float),
+        'pressure_hpa': rng.uniform(960, 1050, count).round(0),
+        'wind_speed_mph': rng.uniform(0, 60, count).round(2),
+        'wind_deg': rng.integers(0, 360, count).astype(float),
+        'visibility_m': rng.uniform(0, 10000, count).round(0),
+    }
+
+
+def check_against_scalar(count=20000):
+    """Compare the batch results with the scalar versions. Returns the number of mismatches."""
+    import get_weather  # Needs settings.json, like the fetch scripts
+    columns = random_columns(count, seed=1)
+    metrics = compute_metrics(columns)
+    mismatches = 0
+    for i in range(count):
+        temp = columns['temperature'][i]
+        humidity = columns['humidity_percent'][i]
+        expected = (
+            get_weather.calculate_dew_point(temp, humidity),
+            scalar_heat_index(temp, humidity),
+            scalar_wind_chill(temp, columns['wind_speed_mph'][i]),
+            get_weather.wind_direction_cardinal(columns['wind_deg'][i]),
+        )
+        actual = (metrics['dewpoint'][i], metrics['heat_index'][i], metrics['wind_chill'][i], metrics['wind_direction'][i])
+        for want, got in zip(expected, actual):
+            if isinstance(want, str):
+                mismatches += want != got
+            else:
+                mismatches += not math.isclose(want, got, rel_tol=0, abs_tol=1e-9)
+    return mismatches
+
+
+def bench():
+    mismatches = check_against_scalar()
+    print(f"Scalar check: {mismatches} mismatches in 20000 random observations")
+
+    import get_weather
+    print(f"{'locations':>10}{'batch ms':>12}{'scalar ms':>12}{'speedup':>10}")
+    for count in (10, 100, 1000, 10000, 100000):
+        columns = random_columns(count)
+        start = time.perf_counter()
+        compute_metrics(columns)
+        batch_ms = (time.perf_counter() - start) * 1000
+
+        temps = columns['temperature'].tolist()
+        humidities = columns['humidity_percent'].tolist()
+        winds = columns['wind_speed_mph'].tolist()
+        degrees = columns['wind_deg'].tolist()
+        start = time.perf_counter()
+        for temp, humidity, wind, deg in zip(temps, humidities, winds, degrees):
+            get_weather.calculate_dew_point(temp, humidity)
+            scalar_heat_index(temp, humidity)
+            scalar_wind_chill(temp, wind)
+            get_weather.wind_direction_cardinal(deg)
+        scalar_ms = (time.perf_counter() - start) * 1000
+        print(f"{count:>10}{batch_ms:>12.2f}{scalar_ms:>12.2f}{scalar_ms / batch_ms:>9.1f}x")
+    return mismatches
+
+
+if __name__ == "__main__":
+    import sys
+    if "--bench" in sys.argv:
+        sys.exit(1 if bench() else 0)
+    print(__doc__)
@@ -0,0 +1,251 @@
+"""
+Typed, validated settings shared by every module.
+
+settings.json is parsed once per process into a frozen Config; call
+get_config() wherever a setting is needed instead of reading the file.
+Long-running processes (the GUI) call reload(), which re-parses only when
+the file actually changed and keeps the last good config if the new file
+is invalid. weather_data.ConfigWatcher does that whenever the file is saved.
+"""
+import json
+import os
+from dataclasses import dataclass, fields
+from types import MappingProxyType
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+# WEATHER_SETTINGS points this process, and the scripts it starts, at another file
+SETTINGS_PATH = os.environ.get("WEATHER_SETTINGS", os.path.join(SCRIPT_DIR, "settings.json"))
+
+# Old spellings still accepted in settings.json -> field name
+ALIASES = {
+    "radar_refesh_min": "radar_refresh_min",
+    "weather_refesh_min": "weather_refresh_min",
+}
+
+LOCATION_FIELDS = {"city": str, "lat": (int, float), "lon": (int, float)}
+
+
+class ConfigError(ValueError):
+    """settings.json is unreadable or has an invalid value."""
+
+
+@dataclass(frozen=True)
+class Config:
+    # Display
+    debug: bool = False
+    slide_debug: int = -1  # Slide number to pin in debug mode, -1 to cycle
+    cycle_interval: int = 5000  # ms per slide
+    debug_hud: bool = True  # Frame-time overlay in debug mode (see frame_stats.py)
+    debug_stats_log_sec: float = 30  # How often debug mode logs the same stats
+
+    # Location and radar map
+    api_key: str = ""
+    lat: float = 47.6
+    lon: float = -122.3
+    zoom_miles: float = 200
+    weather_map_disp_layer: str = "clouds_animated"
+    regional_lat_lons: tuple = ()  # Read-only {"city", "lat", "lon"} mappings
+
+    # Refresh (see refresh_scheduler.py)
+    radar_refresh_min: int = 60
+    weather_refresh_min: int = 30
+    adaptive_refresh: bool = True  # Move between the fastest and slowest intervals with the weather
+    radar_refresh_fastest_min: int = 10
+    radar_refresh_slowest_min: int = 120
+    weather_refresh_fastest_min: int = 10
+    weather_refresh_slowest_min: int = 60
+    radar_job_timeout_sec: float = 600  # A run taking longer is killed
+    weather_job_timeout_sec: float = 300
+
+    # Framebuffer output (see framebuffer.py); "" uses a normal window
+    framebuffer_device: str = ""
+    framebuffer_bits_per_pixel: int = 32  # For plain files; devices report their own
+    framebuffer_interval_ms: int = 100
+
+    # Shared caching proxy (see owm_proxy.py); "" fetches from OWM directly
+    owm_base_url: str = ""
+    proxy_port: int = 8780
+    proxy_tile_ttl_sec: float = 600
+    proxy_cache_max_mb: float = 32  # On-disk response cache bound
+
+    # RAM working store (see working_store.py); "" writes straight to the SD card
+    working_store_dir: str = ""
+    checkpoint_interval_min: int = 60
+
+    # Metrics (see metrics.py); port 0 turns the endpoint off
+    metrics_port: int = 9110
+    metrics_flush_sec: float = 30
+
+    # Freshness (see freshness.py); slides mark data older than this stale, 0 never does
+    weather_freshness_budget_min: int = 90
+    radar_freshness_budget_min: int = 180
+
+    # On-demand profiling (see profiler.py)
+    profile_window_sec: float = 60
+    profile_interval_ms: float = 10
+
+    # LAN frame server (see frame_server.py)
+    frame_server_port: int = 8765
+    frame_server_interval_ms: int = 100
+
+    # Fetching
+    request_timeout_sec: float = 10
+    regional_concurrency: int = 8
+    regional_deadline_sec: float = 60
+    observation_cache_ttl_sec: float = 600
+    dedupe_grid_decimals: int = 2
+    api_calls_per_minute: int = 60
+    api_calls_per_month: int = 1000000
+
+
+def positive(value):
+    return None if value > 0 else "must be positive"
+
+
+# Extra checks beyond the type; each returns an error message or None
+CHECKS = {
+    "cycle_interval": positive,
+    "debug_stats_log_sec": positive,
+    "lat": lambda value: None if -90 <= value <= 90 else "must be between -90 and 90",
+    "lon": lambda value: None if -180 <= value <= 180 else "must be between -180 and 180",
+    "zoom_miles": positive,
+    "radar_refresh_min": positive,
+    "weather_refresh_min": positive,
+    "radar_refresh_fastest_min": positive,
+    "radar_refresh_slowest_min": positive,
+    "weather_refresh_fastest_min": positive,
+    "weather_refresh_slowest_min": positive,
+    "radar_job_timeout_sec": positive,
+    "weather_job_timeout_sec": positive,
+    "framebuffer_bits_per_pixel": lambda value: None if value in (16, 32) else "must be 16 or 32",
+    "framebuffer_interval_ms": positive,
+    "proxy_port": lambda value: None if 0 < value < 65536 else "must be a TCP port number",
+    "proxy_tile_ttl_sec": lambda value: None if value >= 0 else "must not be negative",
+    "proxy_cache_max_mb": positive,
+    "checkpoint_interval_min": positive,
+    "metrics_port": lambda value: None if 0 <= value < 65536 else "must be a TCP port number, or 0",
+    "metrics_flush_sec": positive,
+    "weather_freshness_budget_min": lambda value: None if value >= 0 else "must not be negative",
+    "radar_freshness_budget_min": lambda value: None if value >= 0 else "must not be negative",
+    "profile_window_sec": positive,
+    "profile_interval_ms": positive,
+    "frame_server_port": lambda value: None if 0 < value < 65536 else "must be a TCP port number",
+    "frame_server_interval_ms": positive,
+    "request_timeout_sec": positive,
+    "regional_concurrency": positive,
+    "regional_deadline_sec": positive,
+    "observation_cache_ttl_sec": lambda value: None if value >= 0 else "must not be negative",
+    "dedupe_grid_decimals": lambda value: None if 0 <= value <= 6 else "must be between 0 and 6",
+    "api_calls_per_minute": positive,
+    "api_calls_per_month": positive,
+}
+
+
+def check_type(name, value, expected_type):
+    # bool is an int subclass, but true/false is never a valid number here
+    if expected_type is bool:
+        ok = isinstance(value, bool)
+    elif expected_type is float:
+        ok = isinstance(value, (int, float)) and not isinstance(value, bool)
+    else:
+        ok = isinstance(value, expected_type) and not (expected_type is int and isinstance(value, bool))
+    if not ok:
+        raise ConfigError(f"'{name}' should be {expected_type.__name__}, got {type(value).__name__}")
+
+
+def parse_locations(value):
+    if not isinstance(value, list):
+        raise ConfigError(f"'regional_lat_lons' should be a list, got {type(value).__name__}")
+    locations = []
+    for index, entry in enumerate(value):
+        if not isinstance(entry, dict):
+            raise ConfigError(f"'regional_lat_lons' entry {index} should be an object")
+        for key, expected_type in LOCATION_FIELDS.items():
+            if not isinstance(entry.get(key), expected_type) or isinstance(entry.get(key), bool):
+                raise ConfigError(f"'regional_lat_lons' entry {index} needs a valid '{key}'")
+        locations.append(MappingProxyType(dict(entry)))
+    return tuple(locations)
+
+
+def parse(settings):
+    """Build a Config from a settings dict. Raises ConfigError on invalid values."""
+    if not isinstance(settings, dict):
+        raise ConfigError("settings.json should contain an object")
+    types = {field.name: field.type for field in fields(Config)}
+    values = {}
+    for key, value in settings.items():
+        name = ALIASES.get(key, key)
+        if name not in types:
+            print(f"Ignoring unknown setting '{key}'.")
+            continue
+        if name in values and key in ALIASES:
+            continue  # The correctly spelled key wins
+        if name == "regional_lat_lons":
+            value = parse_locations(value)
+        else:
+            check_type(name, value, types[name])
+            problem = CHECKS.get(name, lambda value: None)(value)
+            if problem:
+                raise ConfigError(f"'{name}' {problem} (got {value!r})")
+        values[name] = value
+    return Config(**values)
+
+
+def load(path=SETTINGS_PATH):
+    """Read and validate a settings file. Raises ConfigError (FileNotFoundError if it's missing)."""
+    with open(path, "r") as f:
+        try:
+            settings = json.load(f)
+        except json.JSONDecodeError as e:
+            raise ConfigError(f"{path}: {e}") from None
+    return parse(settings)
+
+
+def file_signature(path):
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return (stat.st_mtime_ns, stat.st_size)
+
+
+_config = None
+_signature = None
+
+def reload(path=SETTINGS_PATH):
+    """Re-read settings if the file changed since the last load; return the current config.
+
+    The config is only replaced when the file parsed cleanly; compare it
+    with the previous one (==) to see whether any setting changed.
+    """
+    global _config, _signature
+    signature = file_signature(path)
+    if _config is not None and signature == _signature:
+        return _config
+    _signature = signature
+    try:
+        _config = load(path)
+    except FileNotFoundError:
+        print(f"{path} not found. Using default settings.")
+        _config = _config or Config()
+    except ConfigError as e:
+        if _config is None:
+            print(f"Invalid settings: {e}. Using default settings.")
+            _config = Config()
+        else:
+            print(f"Invalid settings: {e}. Keeping the previous settings.")
+    return _config
+
+
+def get_config():
+    """The current config, loaded on first use."""
+    return _config if _config is not None else reload()
+
+
+def require_api_key(config=None):
+    """Exit with an error if no API key is configured (for the fetch scripts)."""
+    config = config or get_config()
+    if not config.api_key:
+        print("Error: API key is missing in settings.json.")
+        exit(1)
+    return config.api_key
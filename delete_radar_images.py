@@ -1,4 +1,5 @@
 import os
+import working_store
 
 def delete_images(directory, extensions):
     """
@@ -23,7 +24,7 @@ def delete_images(directory, extensions):
                     print(f"Error deleting file {file_path}: {e}")
 
 # Define the folder and extensions
-weathertiles_folder = "./weathertiles"
+weathertiles_folder = working_store.directory("weathertiles")
 
 #Disabling this for dev work (I'm not failing gracefully when I don't have weather gifs)
 #file_extensions_to_delete = [".gif", ".png"]
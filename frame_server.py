@@ -0,0 +1,474 @@
+"""
+LAN frame server: one node renders the slides, any number of displays show them.
+
+The server runs the full app (fetchers, radar render, slides) offscreen,
+renders the window on a fixed interval and, when something changed,
+publishes a new frame. Thin clients long-poll it over HTTP and only
+decode and display, so API calls and rendering happen once however many
+displays there are.
+
+Protocol (GET /frame?since=SEQ&wait=SECONDS):
+    204                 no new frame within `wait` seconds
+    200 + FRAME_HEADER  followed by a PNG of the changed rectangle
+        magic    4s  b"WXF1"
+        version  H   1
+        flags    H   KEYFRAME when the PNG is the whole frame
+        seq      Q   frame sequence number
+        x, y, w, h   4H  where the PNG goes
+        length   I   PNG length
+A client that is exactly one frame behind gets just the changed
+rectangle; any other client (new, or fell behind) gets a full keyframe.
+GET /status returns server stats as JSON.
+
+`serve` listens on every interface (0.0.0.0), so displays anywhere on the
+LAN can connect; there is no authentication.
+
+Usage:
+    python3 frame_server.py serve [--port 8765]
+    python3 frame_server.py client http://renderer:8765 [--framebuffer /dev/fb0]
+    python3 frame_server.py client http://127.0.0.1:8765 --snapshot frame.png
+    python3 frame_server.py selftest     # server and client on localhost
+"""
+import os
+import sys
+import json
+import struct
+import threading
+import time
+import numpy as np
+import requests
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+from PyQt5.QtWidgets import QApplication, QWidget
+from PyQt5.QtGui import QImage, QPainter, QColor, QCursor
+from PyQt5.QtCore import QObject, QTimer, QBuffer, QByteArray, QIODevice, QRect, Qt, QCoreApplication, pyqtSignal
+
+MAGIC = b"WXF1"
+VERSION = 1
+KEYFRAME = 1
+FRAME_HEADER = struct.Struct("<4sHHQHHHHI")
+
+MAX_WAIT_SEC = 30  # Longest long-poll the server allows
+RETRY_SEC = 2  # Client pause after a failed request
+
+
+def encode_png(image):
+    buffer = QBuffer()
+    buffer.open(QIODevice.WriteOnly)
+    image.save(buffer, "PNG")
+    return bytes(buffer.data())
+
+
+def pack_frame(flags, seq, rect, png):
+    return FRAME_HEADER.pack(MAGIC, VERSION, flags, seq, rect.x(), rect.y(), rect.width(), rect.height(), len(png)) + png
+
+
+def unpack_frame(payload):
+    """(flags, seq, QRect, png bytes) from a /frame response body. Raises ValueError if it's malformed."""
+    if len(payload) < FRAME_HEADER.size:
+        raise ValueError("frame too short")
+    magic, version, flags, seq, x, y, w, h, length = FRAME_HEADER.unpack_from(payload)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError("not a version 1 frame")
+    png = payload[FRAME_HEADER.size:]
+    if len(png) != length:
+        raise ValueError("frame length mismatch")
+    return flags, seq, QRect(x, y, w, h), png
+
+
+def changed_rect(previous, current):
+    """Bounding rectangle of the pixels that differ between two same-size RGB32 images, or None."""
+    def pixels(image):
+        bits = image.constBits()
+        bits.setsize(image.sizeInBytes())
+        return np.frombuffer(bits, dtype=np.uint32).reshape(image.height(), image.bytesPerLine() // 4)
+
+    diff = pixels(previous)[:, :previous.width()] != pixels(current)[:, :current.width()]
+    rows = np.flatnonzero(diff.any(axis=1))
+    if not len(rows):
+        return None
+    columns = np.flatnonzero(diff.any(axis=0))
+    return QRect(int(columns[0]), int(rows[0]), int(columns[-1] - columns[0] + 1), int(rows[-1] - rows[0] + 1))
+
+
+class FrameStore:
+    """The latest frame and the delta that produced it, shared with the HTTP threads."""
+
+    def __init__(self):
+        self.condition = threading.Condition()
+        self.seq = 0
+        self.image = None  # Latest full frame (QImage, never modified after publishing)
+        self.delta = None  # (rect, png) from frame seq - 1 to seq
+        self.keyframe = None  # (seq, png) cache of the encoded full frame
+
+        # Stats
+        self.frames_sent = 0
+        self.keyframes_sent = 0
+        self.bytes_sent = 0
+        self.clients = {}  # Client address -> last request time
+
+    def publish(self, image, rect, png):
+        with self.condition:
+            first = self.image is None
+            self.seq += 1
+            self.image = image
+            self.delta = None if first else (rect, png)
+            self.condition.notify_all()
+
+    def wait_for_frame(self, since, wait):
+        """The response body for a client that has frame `since`, or None if nothing newer arrives in time."""
+        deadline = time.monotonic() + wait
+        with self.condition:
+            while self.image is None or self.seq <= since:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return None
+                self.condition.wait(remaining)
+            seq, image, delta, keyframe = self.seq, self.image, self.delta, self.keyframe
+
+        if since == seq - 1 and delta is not None:
+            rect, png = delta
+            flags = 0
+        else:
+            if keyframe is not None and keyframe[0] == seq:
+                png = keyframe[1]
+            else:
+                # Encoded without the lock, so publish() on the GUI thread never waits for it
+                png = encode_png(image)
+                with self.condition:
+                    if self.keyframe is None or self.keyframe[0] < seq:
+                        self.keyframe = (seq, png)
+            rect = image.rect()
+            flags = KEYFRAME
+
+        with self.condition:
+            self.keyframes_sent += flags & KEYFRAME
+            self.frames_sent += 1
+            self.bytes_sent += FRAME_HEADER.size + len(png)
+        return pack_frame(flags, seq, rect, png)
+
+    def status(self):
+        with self.condition:
+            now = time.time()
+            return {
+                "seq": self.seq,
+                "frames_sent": self.frames_sent,
+                "keyframes_sent": self.keyframes_sent,
+                "bytes_sent": self.bytes_sent,
+                "clients": sorted(address for address, seen in self.clients.items() if now - seen < 2 * MAX_WAIT_SEC),
+            }
+
+
+class FrameRequestHandler(BaseHTTPRequestHandler):
+    store = None  # Set by FrameServer
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+        with self.store.condition:
+            self.store.clients[self.client_address[0]] = time.time()
+
+        if url.path == "/frame":
+            try:
+                since = int(query.get("since", ["-1"])[0])
+                wait = min(float(query.get("wait", ["0"])[0]), MAX_WAIT_SEC)
+            except ValueError:
+                self.send_error(400, "since and wait must be numbers")
+                return
+            body = self.store.wait_for_frame(since, wait)
+            if body is None:
+                self.send_response(204)
+                self.end_headers()
+                return
+            self.send_body(body, "application/octet-stream")
+        elif url.path == "/status":
+            self.send_body(json.dumps(self.store.status()).encode("utf-8"), "application/json")
+        else:
+            self.send_error(404)
+
+    def send_body(self, body, content_type):
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        try:
+            self.wfile.write(body)
+        except (BrokenPipeError, ConnectionResetError):
+            pass  # Client went away mid long-poll; it starts over from a keyframe
+
+    def log_message(self, format, *args):
+        pass  # One line per long-poll would flood the log
+
+
+class FrameServer(QObject):
+    """Renders a widget on a fixed interval and serves changed frames over HTTP."""
+
+    def __init__(self, widget, port, interval_ms=100, host="0.0.0.0", parent=None):
+        super().__init__(parent)
+        self.widget = widget
+        self.store = FrameStore()
+        self.previous = None
+        self.render_ms = 0.0
+
+        handler = type("Handler", (FrameRequestHandler,), {"store": self.store})
+        self.httpd = ThreadingHTTPServer((host, port), handler)
+        self.httpd.daemon_threads = True
+        self.http_thread = threading.Thread(target=self.httpd.serve_forever, name="frame-server", daemon=True)
+        self.http_thread.start()
+        print(f"Frame server listening on {host}:{self.httpd.server_address[1]}")
+
+        self.timer = QTimer(self)
+        self.timer.timeout.connect(self.render_frame)
+        self.timer.start(interval_ms)
+
+        app = QCoreApplication.instance()
+        if app is not None:
+            app.aboutToQuit.connect(self.stop)
+
+    def render_frame(self):
+        """Render the widget and publish a frame if anything changed."""
+        if not self.widget.isVisible():
+            return  # Not shown yet (WeatherApp.show_when_loaded)
+        start = time.perf_counter()
+        image = QImage(self.widget.size(), QImage.Format_RGB32)
+        image.fill(QColor(Qt.black))
+        painter = QPainter(image)
+        self.widget.render(painter)
+        painter.end()
+
+        if self.previous is None:
+            self.store.publish(image, image.rect(), None)
+        else:
+            rect = changed_rect(self.previous, image)
+            if rect is not None:
+                # Encoded once here, whatever the number of clients
+                self.store.publish(image, rect, encode_png(image.copy(rect)))
+        self.previous = image
+        self.render_ms = (time.perf_counter() - start) * 1000
+
+    def stop(self):
+        self.timer.stop()
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+class FrameClient(QObject):
+    """Long-polls a frame server on a background thread and keeps the assembled frame."""
+
+    frame_changed = pyqtSignal(QRect)  # Queued to the GUI thread
+
+    def __init__(self, url, parent=None):
+        super().__init__(parent)
+        self.url = url.rstrip("/")
+        self.image = None
+        self.seq = -1
+        self.running = True
+        self.lock = threading.Lock()  # Guards self.image between the poll thread and painting
+        self.thread = threading.Thread(target=self.poll, name="frame-client", daemon=True)
+        self.thread.start()
+
+        app = QCoreApplication.instance()
+        if app is not None:
+            app.aboutToQuit.connect(self.stop)
+
+    def poll(self):
+        session = requests.Session()
+        while self.running:
+            try:
+                response = session.get(f"{self.url}/frame", params={"since": self.seq, "wait": MAX_WAIT_SEC},
+                                       timeout=MAX_WAIT_SEC + 10)
+                response.raise_for_status()
+                if response.status_code == 204:
+                    continue
+                self.apply(*unpack_frame(response.content))
+            except (requests.RequestException, ValueError) as e:
+                print(f"Frame server request failed: {e}")
+                self.seq = -1  # Start over from a keyframe
+                time.sleep(RETRY_SEC)
+
+    def apply(self, flags, seq, rect, png):
+        """Decode a frame and paint it into the assembled image."""
+        tile = QImage.fromData(QByteArray(png), "PNG")
+        if tile.isNull():
+            raise ValueError("undecodable PNG")
+        with self.lock:
+            if flags & KEYFRAME or self.image is None:
+                self.image = tile.convertToFormat(QImage.Format_RGB32)
+            else:
+                painter = QPainter(self.image)
+                painter.drawImage(rect.topLeft(), tile)
+                painter.end()
+        self.seq = seq
+        self.frame_changed.emit(rect)
+
+    def copy_image(self):
+        with self.lock:
+            return self.image.copy() if self.image is not None else None
+
+    def stop(self):
+        self.running = False
+
+
+class FrameView(QWidget):
+    """Full-screen display of a FrameClient's frames."""
+
+    def __init__(self, client, debug=False):
+        super().__init__()
+        self.client = client
+        self.setFixedSize(720, 480)
+        if not debug:
+            self.setWindowFlags(Qt.FramelessWindowHint)
+            QApplication.setOverrideCursor(QCursor(Qt.BlankCursor))
+        client.frame_changed.connect(self.update)
+
+    def paintEvent(self, event):
+        painter = QPainter(self)
+        with self.client.lock:
+            if self.client.image is None:
+                painter.fillRect(self.rect(), Qt.black)
+            else:
+                painter.drawImage(0, 0, self.client.image)
+
+
+def serve(port, interval_ms):
+    os.environ["QT_QPA_PLATFORM"] = "offscreen"  # The renderer needs no display of its own
+    app = QApplication(sys.argv)
+    from weather_gui import WeatherApp
+    window = WeatherApp()
+    window.setAttribute(Qt.WA_DontShowOnScreen)
+    window.show_when_loaded()
+    window.frame_server = FrameServer(window, port, interval_ms, parent=window)
+    sys.exit(app.exec_())
+
+
+def run_client(url, framebuffer_device=None, snapshot=None):
+    import config
+    settings = config.get_config()
+    if framebuffer_device or snapshot:
+        os.environ["QT_QPA_PLATFORM"] = "offscreen"
+    app = QApplication(sys.argv)
+    client = FrameClient(url)
+
+    if snapshot:
+        # Save the first complete frame and exit (for checking a server without a display)
+        def save(_rect):
+            client.copy_image().save(snapshot)
+            print(f"Saved frame {client.seq} to {snapshot}")
+            app.quit()
+        client.frame_changed.connect(save)
+    elif framebuffer_device:
+        from framebuffer import FramebufferWriter, framebuffer_geometry
+        width, height, bits_per_pixel, stride = framebuffer_geometry(
+            framebuffer_device, 720, 480, settings.framebuffer_bits_per_pixel)
+        writer = FramebufferWriter(framebuffer_device, width, height, bits_per_pixel, stride)
+        screen = QImage(width, height, QImage.Format_RGB32)
+        screen.fill(QColor(Qt.black))
+
+        def write(_rect):
+            painter = QPainter(screen)
+            with client.lock:
+                painter.drawImage(0, 0, client.image)
+            painter.end()
+            writer.write(screen)
+        client.frame_changed.connect(write)
+    else:
+        view = FrameView(client, settings.debug)
+        view.show()
+    sys.exit(app.exec_())
+
+
+def selftest():
+    """Serve a test widget on localhost and check a keyframe, a delta and a client that fell behind."""
+    os.environ["QT_QPA_PLATFORM"] = "offscreen"
+    app = QApplication(sys.argv)
+
+    class Pattern(QWidget):
+        """A square that moves one step to the right per step."""
+
+        def __init__(self):
+            super().__init__()
+            self.setFixedSize(720, 480)
+            self.step = 0
+
+        def paintEvent(self, event):
+            painter = QPainter(self)
+            painter.fillRect(self.rect(), Qt.darkBlue)
+            painter.fillRect(20 + 40 * self.step, 200, 30, 30, Qt.yellow)
+
+    widget = Pattern()
+    widget.setAttribute(Qt.WA_DontShowOnScreen)
+    widget.show()
+    server = FrameServer(widget, 0, host="127.0.0.1")
+    server.timer.stop()  # Frames are rendered by hand below
+    base = f"http://127.0.0.1:{server.httpd.server_address[1]}"
+
+    def fetch(since, wait=1):
+        response = requests.get(f"{base}/frame", params={"since": since, "wait": wait}, timeout=wait + 5)
+        return None if response.status_code == 204 else unpack_frame(response.content)
+
+    def step():
+        widget.step += 1
+        server.render_frame()
+
+    # A new client gets a keyframe of the whole window
+    server.render_frame()
+    flags, seq, rect, png = fetch(-1)
+    screen = QImage.fromData(QByteArray(png), "PNG").convertToFormat(QImage.Format_RGB32)
+    ok = bool(flags & KEYFRAME) and rect == widget.rect()
+    print(f"New client -> {'keyframe' if flags & KEYFRAME else 'delta'} {rect.width()}x{rect.height()}, seq {seq}")
+
+    # One frame behind: just the rectangle around the old and new square
+    step()
+    flags, seq, rect, png = fetch(seq)
+    painter = QPainter(screen)
+    painter.drawImage(rect.topLeft(), QImage.fromData(QByteArray(png), "PNG"))
+    painter.end()
+    print(f"One frame behind -> {'keyframe' if flags & KEYFRAME else 'delta'} "
+          f"{rect.width()}x{rect.height()} at ({rect.x()}, {rect.y()}), seq {seq}")
+    ok = ok and not flags & KEYFRAME and rect == QRect(20, 200, 70, 30)
+    ok = ok and changed_rect(screen, server.previous) is None
+    print(f"Assembled frame matches the server's: {changed_rect(screen, server.previous) is None}")
+
+    # Fell behind by two frames: a keyframe again
+    step()
+    step()
+    flags, behind_seq, rect, _ = fetch(seq)
+    print(f"Two frames behind -> {'keyframe' if flags & KEYFRAME else 'delta'} "
+          f"{rect.width()}x{rect.height()}, seq {behind_seq}")
+    ok = ok and bool(flags & KEYFRAME) and behind_seq == seq + 2
+
+    # Up to date: the long-poll times out
+    ok = ok and fetch(behind_seq, wait=0.2) is None
+
+    print(f"Server stats: {server.store.status()}")
+    server.stop()
+    app.quit()
+    print("Self-test passed." if ok else "Self-test FAILED.")
+    return ok
+
+
+def main():
+    import argparse
+    import config
+    settings = config.get_config()
+    parser = argparse.ArgumentParser(description="Serve rendered slides to thin clients, or be one.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    serve_parser = subparsers.add_parser("serve", help="Run the app offscreen and serve its frames")
+    serve_parser.add_argument("--port", type=int, default=settings.frame_server_port)
+    serve_parser.add_argument("--interval-ms", type=int, default=settings.frame_server_interval_ms)
+    client_parser = subparsers.add_parser("client", help="Display frames from a server")
+    client_parser.add_argument("url", help="e.g. http://renderer.local:8765")
+    client_parser.add_argument("--framebuffer", help="Write frames to this framebuffer device or file")
+    client_parser.add_argument("--snapshot", help="Save the first frame to this PNG and exit")
+    subparsers.add_parser("selftest", help="Check a server and client on localhost")
+    args = parser.parse_args()
+
+    if args.command == "selftest":
+        exit(0 if selftest() else 1)
+    if args.command == "serve":
+        serve(args.port, args.interval_ms)
+    else:
+        run_client(args.url, args.framebuffer, args.snapshot)
+
+if __name__ == "__main__":
+    main()
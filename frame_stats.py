@@ -0,0 +1,169 @@
+"""
+Frame-time statistics and the on-screen HUD for debug mode.
+
+With debug on, WeatherApp feeds a FrameStats every slide paint and every
+radar frame change, and FrameStats runs its own one-second probe timer
+alongside the slide clocks. It keeps rolling windows of
+
+    paint     paint time per slide (ms), and paints per second
+    clock     how late each one-second tick fired (ms), and how many
+              seconds the on-screen clock would have skipped
+    radar     how far each slide2 animation frame ran over its GIF delay (ms)
+
+and reports them as p50/p95/max: drawn by FrameStatsOverlay in a corner of
+the window (debug_hud) and logged every debug_stats_log_sec.
+"""
+import time
+from collections import deque
+from PyQt5.QtWidgets import QWidget
+from PyQt5.QtGui import QFont, QFontMetrics, QPainter
+from PyQt5.QtCore import QObject, QTimer, Qt, pyqtSignal
+import config
+
+WINDOW = 300  # Samples kept per statistic
+RATE_WINDOW_SEC = 10  # Paints per second are averaged over this long
+CLOCK_TICK_MS = 1000  # Same interval (and timer type) as the slide clocks
+HUD_REFRESH_MS = 1000
+
+HUD_FONT_SIZE = 9
+HUD_MARGIN = 4
+HUD_PADDING = 4
+
+
+class RollingStats:
+    """The last `size` samples, with nearest-rank percentiles."""
+
+    def __init__(self, size=WINDOW):
+        self.samples = deque(maxlen=size)
+
+    def add(self, value):
+        self.samples.append(value)
+
+    def percentiles(self, *ranks):
+        """The given percentiles (0-100) of the window, or None when it's empty."""
+        if not self.samples:
+            return None
+        ordered = sorted(self.samples)
+        return [ordered[min(len(ordered) - 1, int(len(ordered) * rank / 100))] for rank in ranks]
+
+    def summary(self, unit="ms"):
+        """'p50 1.2 p95 3.4 max 8.0 ms', or 'no samples'."""
+        values = self.percentiles(50, 95, 100)
+        if values is None:
+            return "no samples"
+        return "p50 {:.1f} p95 {:.1f} max {:.1f} {}".format(*values, unit)
+
+
+class FrameStats(QObject):
+    """Collects paint, clock tick and radar frame timings and logs them."""
+
+    updated = pyqtSignal()  # Once a second, for the overlay
+
+    def __init__(self, slide_names, parent=None):
+        super().__init__(parent)
+        self.paint_ms = {name: RollingStats() for name in slide_names}
+        self.paint_times = {name: deque() for name in slide_names}  # Within the last RATE_WINDOW_SEC
+        self.clock_lag_ms = RollingStats()
+        self.dropped_ticks = 0
+        self.radar_overrun_ms = RollingStats()
+
+        # Fires like the slide clocks do; how late it runs is how late they run
+        self.last_tick = time.monotonic()
+        self.last_tick_second = int(time.time())
+        self.clock_timer = QTimer(self)
+        self.clock_timer.timeout.connect(self.on_clock_tick)
+        self.clock_timer.start(CLOCK_TICK_MS)
+
+        self.refresh_timer = QTimer(self)
+        self.refresh_timer.timeout.connect(self.updated.emit)
+        self.refresh_timer.start(HUD_REFRESH_MS)
+
+        self.log_timer = QTimer(self)
+        self.log_timer.timeout.connect(self.log)
+        self.log_timer.start(int(config.get_config().debug_stats_log_sec * 1000))
+
+    def set_log_interval(self, seconds):
+        self.log_timer.start(int(seconds * 1000))
+
+    def paint(self, slide_name, seconds):
+        """Record one paint of a slide."""
+        now = time.monotonic()
+        self.paint_ms[slide_name].add(seconds * 1000)
+        times = self.paint_times[slide_name]
+        times.append(now)
+        while times and times[0] < now - RATE_WINDOW_SEC:
+            times.popleft()
+
+    def paint_rate(self, slide_name):
+        """Paints per second over the last RATE_WINDOW_SEC."""
+        times = self.paint_times[slide_name]
+        while times and times[0] < time.monotonic() - RATE_WINDOW_SEC:
+            times.popleft()
+        return len(times) / RATE_WINDOW_SEC
+
+    def on_clock_tick(self):
+        now = time.monotonic()
+        self.clock_lag_ms.add((now - self.last_tick) * 1000 - CLOCK_TICK_MS)
+        self.last_tick = now
+        # A clock showing seconds skips one whenever two ticks straddle more than one second
+        second = int(time.time())
+        self.dropped_ticks += max(0, second - self.last_tick_second - 1)
+        self.last_tick_second = second
+
+    def radar_frame(self, scheduled_ms, actual_ms):
+        """Record one slide2 animation frame change (RadarAnimationPlayer.frame_paced)."""
+        self.radar_overrun_ms.add(actual_ms - scheduled_ms)
+
+    def lines(self):
+        """The report, one line per statistic."""
+        lines = [f"{name} paint {stats.summary()}, {self.paint_rate(name):.1f}/s"
+                 for name, stats in self.paint_ms.items()]
+        lines.append(f"clock lag {self.clock_lag_ms.summary()}, {self.dropped_ticks} dropped")
+        lines.append(f"radar frames late {self.radar_overrun_ms.summary()}")
+        return lines
+
+    def log(self):
+        print("Frame stats: " + "; ".join(self.lines()))
+
+
+class FrameStatsOverlay(QWidget):
+    """The FrameStats report in the window's bottom-left corner.
+
+    Opaque, so refreshing it never makes Qt repaint the slide underneath
+    (which would show up in the very paint statistics it displays).
+    """
+
+    def __init__(self, stats, parent):
+        super().__init__(parent)
+        self.stats = stats
+        self.lines = []
+        self.font = QFont("Monospace", HUD_FONT_SIZE)
+        self.font.setStyleHint(QFont.TypeWriter)
+        self.setAttribute(Qt.WA_OpaquePaintEvent)
+        self.setAttribute(Qt.WA_TransparentForMouseEvents)
+        stats.updated.connect(self.refresh)
+        self.refresh()
+
+    def refresh(self):
+        lines = self.stats.lines()
+        if lines != self.lines:
+            self.lines = lines
+            metrics = QFontMetrics(self.font)
+            width = max(metrics.horizontalAdvance(line) for line in lines) + 2 * HUD_PADDING
+            height = metrics.lineSpacing() * len(lines) + 2 * HUD_PADDING
+            if width > self.width() or height != self.height():
+                # Only ever grow, since uncovering part of the slide repaints it
+                width = max(width, self.width())
+                parent = self.parentWidget()
+                self.setGeometry(HUD_MARGIN, parent.height() - height - HUD_MARGIN, width, height)
+                self.raise_()
+            self.update()
+
+    def paintEvent(self, event):
+        painter = QPainter(self)
+        painter.fillRect(self.rect(), Qt.black)
+        painter.setFont(self.font)
+        painter.setPen(Qt.green)
+        metrics = painter.fontMetrics()
+        for index, line in enumerate(self.lines):
+            painter.drawText(HUD_PADDING, HUD_PADDING + metrics.ascent() + index * metrics.lineSpacing(), line)
@@ -0,0 +1,256 @@
+"""
+Direct Linux framebuffer output, bypassing X and the compositor.
+
+The app runs on Qt's offscreen platform, and FramebufferBackend renders
+the window into an XRGB8888 QImage and writes just the rows that changed
+since the last frame to /dev/fbN. For RGB565 framebuffers only those rows
+are converted, through precomputed per-channel lookup tables.
+
+The target can be a plain file, so output can be checked on a machine
+without a display:
+
+    python3 weather_gui.py --framebuffer /tmp/fb.raw
+    python3 framebuffer.py dump /tmp/fb.raw fb.png --size 720x480 --bpp 16
+"""
+import fcntl
+import os
+import re
+import struct
+import time
+import numpy as np
+from PyQt5.QtGui import QImage, QPainter, QColor
+from PyQt5.QtCore import QObject, QTimer, Qt, QCoreApplication
+
+# Pixel formats we can write, by bits per pixel. Format_RGB32 is 0xffRRGGBB
+# in native (little endian) order, i.e. XRGB8888; Format_RGB16 is RGB565.
+FORMATS = {
+    32: QImage.Format_RGB32,
+    16: QImage.Format_RGB16,
+}
+
+# XRGB8888 -> RGB565, indexed by each channel's byte (truncating, like Qt's conversion)
+CHANNEL = np.arange(256, dtype=np.uint16)
+RGB565_RED = (CHANNEL >> 3) << 11
+RGB565_GREEN = (CHANNEL >> 2) << 5
+RGB565_BLUE = CHANNEL >> 3
+
+# linux/fb.h: ioctl for struct fb_var_screeninfo, which starts with
+# xres, yres, xres_virtual, yres_virtual, xoffset, yoffset, bits_per_pixel
+FBIOGET_VSCREENINFO = 0x4600
+FB_VAR_SCREENINFO_SIZE = 160
+
+
+def read_sysfs(device, name):
+    """A value from /sys/class/graphics/fbN/<name>, or None if it's unavailable."""
+    path = os.path.join("/sys/class/graphics", os.path.basename(device), name)
+    try:
+        with open(path, "r") as f:
+            return f.read().strip()
+    except OSError:
+        return None
+
+
+def read_screeninfo(device):
+    """(xres, yres, xres_virtual, bits_per_pixel) from FBIOGET_VSCREENINFO, or None."""
+    try:
+        fd = os.open(device, os.O_RDONLY)
+    except OSError:
+        return None
+    try:
+        info = fcntl.ioctl(fd, FBIOGET_VSCREENINFO, bytes(FB_VAR_SCREENINFO_SIZE))
+    except OSError:
+        return None
+    finally:
+        os.close(fd)
+    xres, yres, xres_virtual, _, _, _, bits_per_pixel = struct.unpack_from("7I", info)
+    return xres, yres, xres_virtual, bits_per_pixel
+
+
+def framebuffer_geometry(device, default_width, default_height, default_bits_per_pixel):
+    """(width, height, bits_per_pixel, stride) of a framebuffer device.
+
+    Width and height are the visible resolution; the virtual size (which may
+    be twice as tall, for page flipping) only matters for the stride. For a
+    plain file (or a device without that info) the defaults are used, with
+    rows packed back to back.
+    """
+    width, height, bits_per_pixel = default_width, default_height, default_bits_per_pixel
+    stride = None
+    if re.fullmatch(r"/dev/fb\d+", device):
+        virtual_width = None
+        info = read_screeninfo(device)
+        if info is not None:
+            width, height, virtual_width, bits_per_pixel = info
+        else:
+            # sysfs: the current mode (or the first listed), e.g. "U:720x480p-60", and the virtual size
+            mode = re.search(r"(\d+)x(\d+)", read_sysfs(device, "mode") or read_sysfs(device, "modes") or "")
+            if mode:
+                width, height = int(mode.group(1)), int(mode.group(2))
+            size = read_sysfs(device, "virtual_size")
+            if size:
+                virtual_width = int(size.split(",")[0])
+            bits_per_pixel = int(read_sysfs(device, "bits_per_pixel") or bits_per_pixel)
+        stride = int(read_sysfs(device, "stride") or 0) or None
+        if stride is None and virtual_width:
+            stride = virtual_width * bits_per_pixel // 8
+    if bits_per_pixel not in FORMATS:
+        raise ValueError(f"{device}: unsupported pixel format ({bits_per_pixel} bpp); need 16 or 32")
+    return width, height, bits_per_pixel, stride or width * bits_per_pixel // 8
+
+
+class FramebufferWriter:
+    """Writes QImages to a framebuffer (or file), only touching rows that changed.
+
+    Frames are compared as XRGB8888; only the rows that changed are
+    converted to the framebuffer's format.
+    """
+
+    def __init__(self, device, width, height, bits_per_pixel, stride=None):
+        if bits_per_pixel not in FORMATS:
+            raise ValueError(f"unsupported pixel format ({bits_per_pixel} bpp); need 16 or 32")
+        self.device = device
+        self.width = width
+        self.height = height
+        self.bits_per_pixel = bits_per_pixel
+        self.row_bytes = width * bits_per_pixel // 8
+        self.stride = stride or self.row_bytes
+        self.previous = None  # Rows as last written, XRGB8888, (height, width * 4) uint8
+
+        self.fd = os.open(device, os.O_RDWR | os.O_CREAT, 0o644)
+        if not device.startswith("/dev/"):
+            os.ftruncate(self.fd, self.stride * height)
+
+        # Stats
+        self.frames = 0
+        self.rows_written = 0
+        self.bytes_written = 0
+
+    def rows(self, image):
+        """The image's pixel rows as XRGB8888, a (height, width * 4) array."""
+        if image.format() != QImage.Format_RGB32:
+            image = image.convertToFormat(QImage.Format_RGB32)
+        bits = image.constBits()
+        bits.setsize(image.sizeInBytes())
+        # Copy: the QImage may be reused (and repainted) for the next frame
+        table = np.frombuffer(bits, dtype=np.uint8).reshape(image.height(), image.bytesPerLine())
+        return table[:self.height, :self.width * 4].copy()
+
+    def encode(self, rows):
+        """XRGB8888 rows in the framebuffer's format, as a (rows, row_bytes) array."""
+        if self.bits_per_pixel == 32:
+            return rows
+        pixels = rows.reshape(len(rows), self.width, 4)  # B, G, R, X bytes
+        packed = RGB565_RED[pixels[..., 2]] | RGB565_GREEN[pixels[..., 1]] | RGB565_BLUE[pixels[..., 0]]
+        return packed.view(np.uint8).reshape(len(rows), self.row_bytes)
+
+    def write(self, image):
+        """Write the rows of `image` that differ from the last frame. Returns the number of rows written."""
+        rows = self.rows(image)
+        if self.previous is None or self.previous.shape != rows.shape:
+            dirty = np.arange(rows.shape[0])
+        else:
+            dirty = np.flatnonzero((rows != self.previous).any(axis=1))
+        self.previous = rows
+        self.frames += 1
+        if not len(dirty):
+            return 0
+
+        # Write each run of consecutive dirty rows with one call when rows are packed
+        runs = np.split(dirty, np.flatnonzero(np.diff(dirty) != 1) + 1)
+        for run in runs:
+            first, last = int(run[0]), int(run[-1]) + 1
+            encoded = self.encode(rows[first:last])
+            if self.stride == self.row_bytes:
+                self.bytes_written += os.pwrite(self.fd, encoded.tobytes(), first * self.stride)
+            else:
+                for offset, row in enumerate(range(first, last)):
+                    self.bytes_written += os.pwrite(self.fd, encoded[offset].tobytes(), row * self.stride)
+        self.rows_written += len(dirty)
+        return len(dirty)
+
+    def close(self):
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+
+
+class FramebufferBackend(QObject):
+    """Renders a widget into the framebuffer on a fixed interval.
+
+    The widget should have Qt.WA_DontShowOnScreen set and be shown, so its
+    slides run their timers and animations as usual without a real window.
+    """
+
+    def __init__(self, widget, device, bits_per_pixel=32, interval_ms=100, parent=None):
+        super().__init__(parent)
+        self.widget = widget
+        width, height, bits_per_pixel, stride = framebuffer_geometry(
+            device, widget.width(), widget.height(), bits_per_pixel)
+        self.writer = FramebufferWriter(device, width, height, bits_per_pixel, stride)
+        print(f"Framebuffer output: {device} {width}x{height} {bits_per_pixel} bpp, stride {stride}")
+
+        # XRGB8888 targets need no conversion; RGB565 rows are converted as they're written
+        self.image = QImage(width, height, QImage.Format_RGB32)
+        self.image.fill(QColor(Qt.black))
+        self.render_ms = 0.0
+
+        self.timer = QTimer(self)
+        self.timer.timeout.connect(self.push_frame)
+        self.timer.start(interval_ms)
+
+        app = QCoreApplication.instance()
+        if app is not None:
+            app.aboutToQuit.connect(self.stop)
+
+    def push_frame(self):
+        if not self.widget.isVisible():
+            return  # Not shown yet (WeatherApp.show_when_loaded)
+        start = time.perf_counter()
+        painter = QPainter(self.image)
+        self.widget.render(painter)
+        painter.end()
+        self.writer.write(self.image)
+        self.render_ms = (time.perf_counter() - start) * 1000
+
+    def stats(self):
+        writer = self.writer
+        return {
+            "frames": writer.frames,
+            "rows_written": writer.rows_written,
+            "bytes_written": writer.bytes_written,
+            "last_frame_ms": round(self.render_ms, 2),
+        }
+
+    def stop(self):
+        self.timer.stop()
+        self.writer.close()
+
+
+def read_frame(path, width, height, bits_per_pixel, stride=None):
+    """Read a frame back from a framebuffer file as a QImage (for checking output)."""
+    stride = stride or width * bits_per_pixel // 8
+    with open(path, "rb") as f:
+        data = f.read(stride * height)
+    # QImage doesn't own the buffer; copy() detaches it before `data` goes away
+    return QImage(data, width, height, stride, FORMATS[bits_per_pixel]).copy()
+
+
+def main():
+    import argparse
+    parser = argparse.ArgumentParser(description="Framebuffer output tools.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    dump = subparsers.add_parser("dump", help="Convert a framebuffer file (or device) to PNG")
+    dump.add_argument("source")
+    dump.add_argument("png")
+    dump.add_argument("--size", default="720x480", help="WIDTHxHEIGHT for plain files (default: 720x480)")
+    dump.add_argument("--bpp", type=int, default=32, choices=sorted(FORMATS), help="Bits per pixel (default: 32)")
+    args = parser.parse_args()
+
+    width, height = (int(value) for value in args.size.split("x"))
+    width, height, bits_per_pixel, stride = framebuffer_geometry(args.source, width, height, args.bpp)
+    image = read_frame(args.source, width, height, bits_per_pixel, stride)
+    image.save(args.png)
+    print(f"Saved {width}x{height} {bits_per_pixel} bpp frame to {args.png}")
+
+if __name__ == "__main__":
+    main()
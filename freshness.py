@@ -0,0 +1,192 @@
+"""
+Provenance timestamps from the upstream observation to the pixels on screen.
+
+Every artifact a fetcher publishes carries a provenance record (epoch seconds):
+
+    observed_at   upstream observation time (OWM `dt`); radar tiles carry
+                  none, so radar counts from the tile fetch
+    fetched_at    when the response arrived (or was first cached)
+    written_at    when the artifact was written out
+
+Data files keep it under a "provenance" key; radar GIFs keep it as JSON in a
+GIF comment extension, so it is replaced atomically along with the frames.
+The GUI adds when it picked the new artifact up and when it was first
+painted, and a FreshnessTracker per source turns that into the
+weather_freshness_seconds histogram, one series per hop:
+
+    fetch    observed -> fetched
+    publish  fetched -> written (for radar: plot, crop and GIF)
+    pickup   written -> loaded by the GUI
+    paint    loaded -> first painted on screen
+    total    observed (or fetched) -> first painted
+
+Artifacts written before this process started (the ones the GUI loads at
+startup) aren't observed: their pickup would be the downtime, not latency.
+
+Slides draw a stale marker (draw_stale_marker) while their data is older
+than its budget (weather_freshness_budget_min, radar_freshness_budget_min).
+"""
+import json
+import time
+import config
+import metrics
+
+HOPS = (("fetch", "observed_at", "fetched_at"),
+        ("publish", "fetched_at", "written_at"),
+        ("pickup", "written_at", "loaded_at"),
+        ("paint", "loaded_at", "shown_at"))
+
+# What an artifact's age is counted from, best first
+ORIGINS = (("observed_at", "observation"), ("fetched_at", "fetch"), ("written_at", "write"))
+
+# Artifacts written before this count as leftovers from an earlier run
+PROCESS_STARTED_AT = time.time()
+
+# Marker shown while the data is older than its freshness budget
+STALE_FONT_SIZE = 16
+STALE_Y = 22
+
+# GIF block introducer and extension label (GIF89a spec)
+GIF_EXTENSION = 0x21
+GIF_COMMENT = 0xFE
+
+
+def provenance(observed_at, fetched_at):
+    """A provenance record for an artifact about to be built (None for anything unknown)."""
+    return {"observed_at": observed_at, "fetched_at": fetched_at, "written_at": None}
+
+
+def mark_written(data):
+    """Stamp written_at on a data dict's provenance (if it has one) just before publishing it."""
+    if isinstance(data.get("provenance"), dict):
+        data["provenance"]["written_at"] = time.time()
+    return data
+
+
+def read_gif_comment(path):
+    """The first comment extension in a GIF (bytes), or None.
+
+    Only the blocks before the first frame are walked, so this reads a few
+    hundred bytes however big the animation is.
+    """
+    try:
+        with open(path, "rb") as f:
+            header = f.read(13)  # Signature and logical screen descriptor
+            if len(header) < 13 or not header.startswith(b"GIF"):
+                return None
+            if header[10] & 0x80:  # Global color table follows
+                f.seek(3 * 2 ** ((header[10] & 0x07) + 1), 1)
+            while True:
+                introducer = f.read(1)
+                if not introducer or introducer[0] != GIF_EXTENSION:
+                    return None  # The first frame (or junk) comes before any comment
+                label = f.read(1)
+                chunks = []
+                while True:
+                    size = f.read(1)
+                    if not size or size[0] == 0:
+                        break
+                    chunks.append(f.read(size[0]))
+                if label and label[0] == GIF_COMMENT:
+                    return b"".join(chunks)
+    except OSError:
+        return None
+
+
+def read_gif_provenance(path):
+    """The provenance record written into a radar GIF, or None."""
+    comment = read_gif_comment(path)
+    try:
+        record = json.loads(comment.decode("utf-8")) if comment else None
+    except (UnicodeDecodeError, ValueError):
+        return None
+    return record if isinstance(record, dict) else None
+
+
+def budget_sec(source):
+    """The latency budget for a source ("home", "regional" or "radar"); 0 means none."""
+    settings = config.get_config()
+    if source == "radar":
+        return settings.radar_freshness_budget_min * 60
+    return settings.weather_freshness_budget_min * 60
+
+
+def draw_stale_marker(slide, painter, label):
+    """Draw a slide's stale data marker centered in its top band, if `label` isn't empty.
+
+    `slide` is a slide widget (custom_font_family, draw_text_with_outline).
+    """
+    if not label:
+        return
+    # Qt only here, so the fetchers can import this module without it
+    from PyQt5.QtCore import Qt
+    from PyQt5.QtGui import QFont, QFontMetrics
+    font = QFont(slide.custom_font_family, STALE_FONT_SIZE)
+    font.setBold(True)
+    x = (slide.width() - QFontMetrics(font).horizontalAdvance(label)) // 2
+    slide.draw_text_with_outline(painter, label, x, STALE_Y, STALE_FONT_SIZE, 1, Qt.yellow)
+
+
+def format_age(seconds):
+    """'45s', '12m' or '2h05m'."""
+    seconds = int(seconds)
+    if seconds < 60:
+        return f"{seconds}s"
+    if seconds < 3600:
+        return f"{seconds // 60}m"
+    return f"{seconds // 3600}h{seconds % 3600 // 60:02d}m"
+
+
+class FreshnessTracker:
+    """Follows the artifact a slide shows for one source, from pickup to first paint."""
+
+    def __init__(self, source):
+        self.source = source
+        self.provenance = None  # As loaded from the artifact
+        self.record = None  # Provenance plus loaded_at and shown_at
+        self.shown = True  # Nothing new to report until something is loaded
+
+    def loaded(self, record, loaded_at=None):
+        """A new artifact was picked up; `record` is its provenance (None if it has none)."""
+        self.provenance = record
+        self.record = dict(record) if record else {}
+        self.record["loaded_at"] = time.time() if loaded_at is None else loaded_at
+        self.shown = False
+
+    def painted(self):
+        """Call from paintEvent: the first paint after a pickup records the hops."""
+        if self.shown:
+            return
+        self.shown = True
+        record = self.record
+        record["shown_at"] = time.time()
+        if record.get("written_at") is not None and record["written_at"] < PROCESS_STARTED_AT:
+            return  # Loaded at startup; its hops measure how long we were down
+        lags = {}
+        for hop, start, end in HOPS:
+            if record.get(start) is not None and record.get(end) is not None:
+                lags[hop] = max(0.0, record[end] - record[start])
+        origin, event = self.origin()
+        if origin is not None:
+            lags["total"] = max(0.0, record["shown_at"] - origin)
+        for hop, seconds in lags.items():
+            metrics.observe("weather_freshness_seconds", seconds, source=self.source, hop=hop)
+        if origin is not None:
+            detail = ", ".join(f"{hop} {seconds:.1f} s" for hop, seconds in lags.items() if hop != "total")
+            print(f"Freshness: {self.source} on screen {format_age(lags['total'])} after {event} ({detail}).")
+
+    def origin(self):
+        """(time, event) the shown artifact's age counts from, or (None, None)."""
+        for key, event in ORIGINS:
+            if self.record and self.record.get(key) is not None:
+                return self.record[key], event
+        return None, None
+
+    def stale_label(self):
+        """'STALE 2h05m' while the shown artifact is older than its budget, else ''."""
+        budget = budget_sec(self.source)
+        origin, _ = self.origin()
+        if not budget or origin is None:
+            return ""
+        age = time.time() - origin
+        return f"STALE {format_age(age)}" if age > budget else ""
@@ -17,38 +17,28 @@ import schedule
 from datetime import datetime
 import glob
 import json
+import api_budget
+import config
+import freshness
+import metrics
+import profiler
+import hashlib
+import refresh_scheduler
+import working_store
+from owm_proxy import proxied, proxy_enabled, priority_headers
 
 TILE_SIZE = 256  # Tile dimensions in pixels
 WEB_MERCATOR_EPSG = 3857  # Web Mercator projection
 MILES_TO_METERS = 1609.34  # Conversion factor
 
-# Load settings from JSON
-def load_settings(file_path):
-    try:
-        with open(file_path, 'r') as file:
-            settings = json.load(file)
-            return settings
-    except FileNotFoundError:
-        print(f"Error: Settings file '{file_path}' not found.")
-        exit(1)
-    except json.JSONDecodeError:
-        print(f"Error: Failed to decode JSON in settings file '{file_path}'.")
-        exit(1)
-
 # Load settings
-settings_path = "./settings.json"  # Path to your settings.json file
-settings = load_settings(settings_path)
+settings = config.get_config()
 
 # Extract values from settings
-API_KEY = settings.get("api_key")
-latitude = settings.get("lat", 47.6)  # Default: Seattle latitude
-longitude = settings.get("lon", -122.3)  # Default: Seattle longitude
-radius_miles = settings.get("zoom_miles", 200)  # Default: 200 miles
-
-# Validate critical settings
-if not API_KEY:
-    print("Error: API key is missing in settings.json.")
-    exit(1)
+API_KEY = config.require_api_key(settings)
+latitude = settings.lat
+longitude = settings.lon
+radius_miles = settings.zoom_miles
 
 # Example: Verify loaded settings
 print(f"Loaded settings: Latitude={latitude}, Longitude={longitude}, Radius Miles={radius_miles}, API Key={API_KEY}")
@@ -128,7 +118,7 @@ def get_tiles_in_square(lat, lon, radius_miles, zoom):
 def fetch_specific_local_tiles(tiles, zoom, layer, timestamp):
     print(f"fetch_specific_local_tiles for layer: {layer}")
     # Ensure the output folder exists
-    output_folder = "./weathertiles/"
+    output_folder = working_store.directory("weathertiles")
     os.makedirs(output_folder, exist_ok=True)
 
     # Calculate local mosaic dimensions
@@ -141,13 +131,24 @@ def fetch_specific_local_tiles(tiles, zoom, layer, timestamp):
     height = (y_tile_max - y_tile_min + 1) * TILE_SIZE
     mosaic = Image.new("RGBA", (width, height))
 
+    # Take the whole run's worth of tile calls up front, so a deferred run keeps the previous GIF.
+    # Through the proxy, the proxy charges its own budget for upstream calls instead.
+    charged = not proxy_enabled()
+    if charged and not api_budget.acquire(api_budget.RADAR, count=len(tiles)):
+        print("API budget deferred this radar run; keeping the previous frames.")
+        return None
+
     for x, y in tiles:
-        tile_url = f"https://tile.openweathermap.org/map/{layer}/{zoom}/{x}/{y}.png?appid={API_KEY}"
+        tile_url = proxied(f"https://tile.openweathermap.org/map/{layer}/{zoom}/{x}/{y}.png?appid={API_KEY}")
         print(f"Fetching tile ({x}, {y}) from {tile_url}")
 
         for attempt in range(3):  # Retry up to 3 times
+            if attempt > 0 and charged and not api_budget.acquire(api_budget.RADAR):
+                print(f"API budget deferred retrying tile ({x}, {y}).")
+                break
             try:
-                response = requests.get(tile_url, timeout=10)  # Set timeout
+                with metrics.timer("weather_fetch_seconds", source="radar_tile"):
+                    response = requests.get(tile_url, headers=priority_headers(api_budget.RADAR), timeout=10)
                 if response.status_code == 200:
                     tile_image = Image.open(BytesIO(response.content))
 
@@ -158,8 +159,14 @@ def fetch_specific_local_tiles(tiles, zoom, layer, timestamp):
                     # Paste the tile onto the mosaic
                     mosaic.paste(tile_image, (x_pixel, y_pixel))
                     break  # Exit retry loop on success
+                elif response.status_code == 429 and response.headers.get("X-Cache") == "deferred":
+                    # Like a deferred acquire above: a mosaic with holes would replace good frames
+                    print(f"The proxy's API budget deferred tile ({x}, {y}); keeping the previous frames.")
+                    return None
                 else:
                     print(f"Failed to fetch tile ({x}, {y}): HTTP {response.status_code}")
+                    if response.status_code == 429:
+                        api_budget.throttled()  # Make every fetcher back off
                     break  # No need to retry if server responded
             except requests.exceptions.SSLError as e:
                 print(f"SSL Error fetching tile ({x}, {y}): {e}")
@@ -246,6 +253,19 @@ def fetch_all_layers(tiles, zoom, lat, lon, radius_miles, weather_map_disp_layer
     # Generate a timestamp for the filenames
     timestamp = datetime.now().strftime("%Y%m%d%H%M%S")
 
+    # Fetch the mosaic for the specified layer
+    with metrics.timer("weather_render_stage_seconds", stage="tiles"):
+        fetched = fetch_specific_local_tiles(tiles, zoom, layer_key, timestamp)
+    if fetched is None:
+        return
+    mosaic, x_tile_min, y_tile_min = fetched
+    # Tiles carry no observation time; the frame's age counts from here
+    provenance = freshness.provenance(None, time.time())
+    plot_started = time.perf_counter()
+
+    # Lets the refresh scheduler tell a changing radar from a static one
+    refresh_scheduler.record_radar_tiles(hashlib.sha1(mosaic.tobytes()).hexdigest())
+
     # Load boundaries once to overlay
     boundaries = load_boundaries()
 
@@ -254,9 +274,6 @@ def fetch_all_layers(tiles, zoom, lat, lon, radius_miles, weather_map_disp_layer
     state_boundaries = boundaries[boundaries["type"] == "state"]
     county_boundaries = boundaries[boundaries["type"] == "county"]
 
-    # Fetch the mosaic for the specified layer
-    mosaic, x_tile_min, y_tile_min = fetch_specific_local_tiles(tiles, zoom, layer_key, timestamp)
-
     # Calculate the extent for the local mosaic
     tile_size_meters = 40075016.68 / (2**zoom)
     extent = (
@@ -301,26 +318,34 @@ def fetch_all_layers(tiles, zoom, lat, lon, radius_miles, weather_map_disp_layer
     ax.axis("off")
 
     # Save the combined image to the appropriate subfolder
-    layer_folder = os.path.join("./weathertiles/", subfolder)
+    layer_folder = os.path.join(working_store.directory("weathertiles"), subfolder)
     os.makedirs(layer_folder, exist_ok=True)  # Ensure the subfolder exists
     output_filename = os.path.join(layer_folder, f"{timestamp}_{layer_name}.png")
+    # Render to a temp file; the frame only appears under its .png name once it's cropped, so
+    # the GIF builder and working store checkpoints never pick up a half-written one
+    render_path = f"{output_filename}.render.tmp"
     print(f"Saving combined mosaic to {output_filename}")
-    fig.savefig(output_filename, bbox_inches="tight", pad_inches=0, dpi=300, facecolor="black")
+    fig.savefig(render_path, format="png", bbox_inches="tight", pad_inches=0, dpi=300, facecolor="black")
     plt.close(fig)  # Free memory
+    metrics.observe("weather_render_stage_seconds", time.perf_counter() - plot_started, stage="plot")
 
     # Resize and crop the image to 720x480
-    crop_to_aspect_ratio(output_filename, target_width=720, target_height=360)
+    with metrics.timer("weather_render_stage_seconds", stage="crop"):
+        crop_to_aspect_ratio(output_filename, target_width=720, target_height=360, source_path=render_path)
 
     # Generate a GIF for the specified layer with a 2-second delay between frames
-    generate_gif_from_images(layer_folder, "animated", delay_between_frames=500)
+    with metrics.timer("weather_render_stage_seconds", stage="gif"):
+        generate_gif_from_images(layer_folder, "animated", delay_between_frames=500,
+                                 frame_provenance={output_filename: provenance})
 
 
 
-def crop_to_aspect_ratio(image_path, target_width, target_height):
+def crop_to_aspect_ratio(image_path, target_width, target_height, source_path=None):
     print(f"Cropping {image_path} to aspect ratio {target_width}:{target_height}")
     
-    # Open the image
-    img = Image.open(image_path)
+    # Open the image (the rendered frame, when it isn't at image_path yet)
+    source_path = source_path or image_path
+    img = Image.open(source_path)
     original_width, original_height = img.size
     target_aspect = target_width / target_height
     original_aspect = original_width / original_height
@@ -370,8 +395,12 @@ def crop_to_aspect_ratio(image_path, target_width, target_height):
     # Draw the filled text
     draw.text(text_position, time_str, font=font, fill=fill_color)
 
-    # Save the updated image
-    cropped_img.save(image_path)
+    # Save the updated image, via a temp file so readers never see a torn frame
+    temp_path = f"{image_path}.tmp"
+    cropped_img.save(temp_path, format="PNG")
+    os.replace(temp_path, image_path)
+    if source_path != image_path:
+        os.remove(source_path)
     print(f"Cropped, resized, and annotated image saved to {image_path}")
 
     # Check and delete old images if count exceeds 10
@@ -386,7 +415,7 @@ def crop_to_aspect_ratio(image_path, target_width, target_height):
             os.remove(file)
             print(f"Deleted old image: {file}")
 
-def generate_gif_from_images(parent_folder, output_filename_suffix, delay_between_frames=2000):
+def generate_gif_from_images(parent_folder, output_filename_suffix, delay_between_frames=2000, frame_provenance=None):
     """
     Generate a GIF from all .png files in subfolders of the parent folder's parent directory.
     
@@ -394,6 +423,8 @@ def generate_gif_from_images(parent_folder, output_filename_suffix, delay_betwee
         parent_folder (str): The subfolder path that needs to step up one level.
         output_filename_suffix (str): The suffix to add to the GIF filename (e.g., 'animated').
         delay_between_frames (int): Delay between frames in milliseconds (default: 2000ms).
+        frame_provenance (dict): PNG path -> provenance record (see freshness.py). A GIF
+            whose newest frame is listed carries that record in a comment.
     """
     # Step up one level to the parent directory
     actual_parent_folder = os.path.dirname(parent_folder)
@@ -429,34 +460,33 @@ def generate_gif_from_images(parent_folder, output_filename_suffix, delay_betwee
         subfolder_name = os.path.basename(subfolder)
         gif_output_path = os.path.join(actual_parent_folder, f"{subfolder_name}_{output_filename_suffix}.gif")
 
-        # Save as GIF with a delay between frames
+        # Save as GIF with a delay between frames. Write a temp file and rename it
+        # into place, so the GUI (which shows whatever GIF is there at startup)
+        # never sees a half-written one.
+        temp_path = f"{gif_output_path}.tmp"
+        extra = {}
+        provenance = (frame_provenance or {}).get(png_files[-1])
+        if provenance is not None:
+            provenance["written_at"] = time.time()
+            extra["comment"] = json.dumps(provenance).encode("utf-8")
         images[0].save(
-            gif_output_path,
+            temp_path,
+            format="GIF",
             save_all=True,
             append_images=images[1:],
             duration=delay_between_frames,
             loop=0,
+            **extra,
         )
+        os.replace(temp_path, gif_output_path)
         print(f"GIF saved to {gif_output_path}")
 
 def main():
     start_time = time.time()  # Record the start time
-
-    # Load settings
-    settings_path = "./settings.json"  # Path to your settings.json file
-    settings = load_settings(settings_path)
+    profiler.install()  # SIGUSR1 or `python3 profiler.py start` profiles this run
 
     # Extract values from settings
-    API_KEY = settings.get("api_key")
-    latitude = settings.get("lat", 47.6)  # Default: Seattle latitude
-    longitude = settings.get("lon", -122.3)  # Default: Seattle longitude
-    radius_miles = settings.get("zoom_miles", 200)  # Default: 200 miles
-    weather_map_disp_layer = settings.get("weather_map_disp_layer")
-
-    # Validate critical settings
-    if not API_KEY:
-        print("Error: API key is missing in settings.json.")
-        exit(1)
+    weather_map_disp_layer = settings.weather_map_disp_layer
 
     # Calculate the appropriate zoom level
     zoom = calculate_zoom(radius_miles)
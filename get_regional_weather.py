@@ -1,35 +1,94 @@
-import json
 import requests
+from requests.adapters import HTTPAdapter
 import os
-from datetime import datetime
-import pytz  # To handle time zone conversion more robustly
-
-# Load settings
-with open('settings.json', 'r') as f:
-    settings = json.load(f)
-
-API_KEY = settings['api_key']
-OUTPUT_PATH = 'weatherdata/regional_weather.json'
-LAT_LONS = settings['regional_lat_lons']
+from concurrent.futures import ThreadPoolExecutor, wait
+from get_weather import convert_to_local_time
+import api_budget
+import snapshot_format
+from history_store import HistoryStore, location_key
+import batch_metrics
+import config
+import freshness
+import metrics
+from owm_proxy import proxied, proxy_enabled, priority_headers
+import working_store
+
+settings = config.get_config()
+
+API_KEY = settings.api_key
+OUTPUT_PATH = os.path.join(working_store.directory("weatherdata"), "regional_weather.json")
+LAT_LONS = settings.regional_lat_lons
+
+# Fetch tuning
+MAX_CONCURRENCY = settings.regional_concurrency  # Requests in flight at once
+REQUEST_TIMEOUT = settings.request_timeout_sec  # Per request (connect and read)
+RUN_DEADLINE = settings.regional_deadline_sec  # Whole refresh; unfinished cities count as failed
 
 # Ensure the output directory exists
 os.makedirs(os.path.dirname(OUTPUT_PATH), exist_ok=True)
 
 # OpenWeatherMap endpoint
-CURRENT_WEATHER_URL = "http://api.openweathermap.org/data/2.5/weather"
+CURRENT_WEATHER_URL = proxied("http://api.openweathermap.org/data/2.5/weather")
 
 # Fetch weather data for a given latitude and longitude
-def fetch_weather(lat, lon):
+def fetch_weather(lat, lon, session=requests, timeout=REQUEST_TIMEOUT, priority=api_budget.REGIONAL):
+    # Through the proxy, the proxy charges its own budget for upstream calls, at our priority
+    if not proxy_enabled() and not api_budget.acquire(priority):
+        raise api_budget.BudgetDeferred(f"API budget deferred {priority} request for ({lat}, {lon})")
     params = {
         'lat': lat,
         'lon': lon,
         'appid': API_KEY,
         'units': 'imperial',  # Use 'imperial' for Fahrenheit, mph, etc.
     }
-    response = requests.get(CURRENT_WEATHER_URL, params=params)
+    with metrics.timer("weather_fetch_seconds", source=priority):  # weather_service fetches home here too
+        response = session.get(CURRENT_WEATHER_URL, params=params, headers=priority_headers(priority),
+                               timeout=timeout)
+    if response.status_code == 429:
+        if response.headers.get("X-Cache") == "deferred":
+            raise api_budget.BudgetDeferred(f"The proxy's API budget deferred {priority} request for ({lat}, {lon})")
+        api_budget.throttled()  # Make every fetcher back off
     response.raise_for_status()
     return response.json()
 
+# Session whose keep-alive pool is big enough for every worker thread
+def make_session(pool_size):
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+# Fetch every location in parallel. Returns one entry per location, in the
+# same order: the raw response data, or the exception that stopped it.
+def fetch_all_weather(locations, concurrency=MAX_CONCURRENCY, timeout=REQUEST_TIMEOUT, deadline=RUN_DEADLINE):
+    if not locations:
+        return []
+    concurrency = max(1, min(concurrency, len(locations)))
+    session = make_session(concurrency)
+    executor = ThreadPoolExecutor(max_workers=concurrency)
+    futures = [
+        executor.submit(
+            fetch_weather, entry['lat'], entry['lon'], session, timeout,
+            entry.get('priority', api_budget.REGIONAL),
+        )
+        for entry in locations
+    ]
+
+    # Stop waiting at the deadline; queued requests are cancelled and
+    # in-flight ones are abandoned (their own timeout still bounds them)
+    done, _ = wait(futures, timeout=deadline)
+    executor.shutdown(wait=False, cancel_futures=True)
+
+    results = []
+    for future in futures:
+        if future in done:
+            error = future.exception()
+            results.append(error if error is not None else future.result())
+        else:
+            results.append(TimeoutError(f"not finished within the {deadline}s deadline"))
+    return results
+
 # Parse weather data to extract required fields
 def parse_weather(data):
     weather = {
@@ -39,39 +98,32 @@ def parse_weather(data):
     }
     return weather
 
-# Convert UTC observation time to the system's local time zone
-def convert_to_local_time(utc_timestamp):
-    # Create a UTC datetime object
-    utc_time = datetime.utcfromtimestamp(utc_timestamp).replace(tzinfo=pytz.utc)
-    # Convert to local time zone
-    local_time = utc_time.astimezone()
-    # Format with local time zone abbreviation
-    return local_time.strftime('%Y-%m-%d %H:%M:%S %Z')
-
-# Main function to fetch weather for all regional lat/lons
-def main():
-    print("Fetching regional weather data...")
+# Build the regional output from one fetch result (raw data or exception) per location
+def build_regional_weather(locations, results):
     regional_weather = []
+    parsed = []  # (index in regional_weather, raw response) for cities that parsed
 
     # Placeholder for observation time
     observation_time = None
 
-    for entry in LAT_LONS:
+    for entry, result in zip(locations, results):
         city = entry['city']
-        lat = entry['lat']
-        lon = entry['lon']
 
         try:
-            print(f"Fetching weather for {city} (Lat: {lat}, Lon: {lon})...")
-            raw_data = fetch_weather(lat, lon)
-            
+            if isinstance(result, Exception):
+                raise result
+
             # Set observation time based on the first valid fetch
             if observation_time is None:
-                observation_time = convert_to_local_time(raw_data['dt'])
+                observation_time = convert_to_local_time(result['dt'])
 
-            parsed_data = parse_weather(raw_data)
+            parsed_data = parse_weather(result)
+            parsed.append((len(regional_weather), result))
             regional_weather.append(parsed_data)
-        except requests.RequestException as e:
+
+            # Keep a history per configured city
+            HistoryStore(location_key(city)).append_response(result)
+        except (requests.RequestException, api_budget.BudgetDeferred, TimeoutError, KeyError, IndexError) as e:
             print(f"Error fetching weather for {city}: {e}")
             regional_weather.append({
                 'location': city,
@@ -79,18 +131,38 @@ def main():
                 'temperature': None,
             })
 
+    # Derived fields for every city in one vectorized pass
+    if parsed:
+        columns = batch_metrics.columns_from_responses([result for _, result in parsed])
+        derived = batch_metrics.compute_metrics(columns)
+        for row, (index, _) in enumerate(parsed):
+            regional_weather[index].update({
+                'feels_like': round(float(derived['feels_like'][row]), 1),
+                'dewpoint': float(derived['dewpoint'][row]),
+                'humidity_percent': float(columns['humidity_percent'][row]),
+                'wind_speed_mph': round(float(columns['wind_speed_mph'][row]), 1),
+                'wind_direction': str(derived['wind_direction'][row]),
+            })
+
     # Combine observation time with weather data
-    output_data = {
+    return {
         'observation_time': observation_time,
         'regional_weather': regional_weather,
     }
 
-    # Save the regional weather data to a JSON file
+# Save the regional weather data to a JSON file
+def save_regional_weather(output_data):
     print("Saving regional weather data to file...")
-    with open(OUTPUT_PATH, 'w') as f:
-        json.dump(output_data, f, indent=4)
+    # JSON for people, binary snapshot for the slides; both replaced atomically
+    snapshot_format.publish(OUTPUT_PATH, freshness.mark_written(output_data))
 
     print("Regional weather data saved successfully.")
 
+# Main function to fetch weather for all regional lat/lons
+def main():
+    # The shared service does the fetching so responses are cached and deduplicated
+    import weather_service
+    weather_service.run(home=False, regional=True)
+
 if __name__ == "__main__":
     main()
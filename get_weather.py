@@ -1,26 +1,28 @@
-import json
 import requests
 import os
 from datetime import datetime, timezone, timedelta
 import time
 import pytz
+import snapshot_format
+import icon_atlas
+import config
+import freshness
+from owm_proxy import proxied
+import working_store
 
-# Load settings
-with open('settings.json', 'r') as f:
-    settings = json.load(f)
+settings = config.get_config()
 
-API_KEY = settings['api_key']
-LAT = settings['lat']
-LON = settings['lon']
-OUTPUT_PATH = 'weatherdata/home_weather.json'
-ICON_DIR = 'weatherdata/icons/'
+API_KEY = settings.api_key
+LAT = settings.lat
+LON = settings.lon
+OUTPUT_PATH = os.path.join(working_store.directory("weatherdata"), "home_weather.json")
+ICON_DIR = os.path.join(working_store.directory("weatherdata"), "icons")
 
 # Ensure directories exist
 os.makedirs(os.path.dirname(OUTPUT_PATH), exist_ok=True)
 os.makedirs(ICON_DIR, exist_ok=True)
 
-# OpenWeatherMap endpoints
-CURRENT_WEATHER_URL = "http://api.openweathermap.org/data/2.5/weather"
+REQUEST_TIMEOUT = settings.request_timeout_sec
 
 # Convert wind direction from degrees to cardinal directions
 def wind_direction_cardinal(degrees):
@@ -38,19 +40,6 @@ def calculate_dew_point(temp, humidity):
     dew_point_f = dew_point_c * 9 / 5 + 32  # Convert Celsius back to Fahrenheit
     return round(dew_point_f, 2)
 
-# Fetch current weather data
-def fetch_weather():
-    params = {
-        'lat': LAT,
-        'lon': LON,
-        'appid': API_KEY,
-        'units': 'imperial',  # Use 'imperial' for Fahrenheit, mph, etc.
-    }
-
-    response = requests.get(CURRENT_WEATHER_URL, params=params)
-    response.raise_for_status()
-    return response.json()
-
 # Convert UTC observation time to the system's local time zone
 def convert_to_local_time(utc_timestamp):
     # Create a UTC datetime object
@@ -60,24 +49,9 @@ def convert_to_local_time(utc_timestamp):
     # Format with local time zone abbreviation
     return local_time.strftime('%Y-%m-%d %H:%M:%S %Z')
 
-# Parse weather data
-def parse_weather(data):
-    # Read previous pressure from output file if it exists
-    if os.path.exists(OUTPUT_PATH):
-        with open(OUTPUT_PATH, 'r') as f:
-            previous_data = json.load(f)
-            previous_pressure = previous_data.get('pressure_inhg', None)
-    else:
-        previous_pressure = None
-
+# Parse weather data; pressure_trend comes from the home history (None until there's 3 hours of it)
+def parse_weather(data, pressure_trend=None):
     current_pressure = data['main']['pressure'] * 0.02953  # Convert hPa to inHg
-    pressure_trend = "steady"
-
-    if previous_pressure is not None:
-        if current_pressure > previous_pressure:
-            pressure_trend = "up"
-        elif current_pressure < previous_pressure:
-            pressure_trend = "down"
 
     temperature = data['main']['temp']
     humidity = data['main']['humidity']
@@ -95,7 +69,7 @@ def parse_weather(data):
         'ceiling_feet': data.get('clouds', {}).get('all', 0) * 100,
         'visibility_miles': data.get('visibility', 0) / 1609.34,
         'pressure_inhg': current_pressure,
-        'pressure_trend': pressure_trend,
+        'pressure_trend': pressure_trend or "steady",
         'icon_url': f"http://openweathermap.org/img/wn/{data['weather'][0]['icon']}@2x.png",
         'observation_time': observation_time,  # Include time zone
         'location': data.get('name', 'Unknown'),
@@ -112,7 +86,7 @@ def save_icon(icon_url, icon_name):
         return
     try:
         print(f"Downloading icon: {icon_name}")
-        response = requests.get(icon_url)
+        response = requests.get(proxied(icon_url), timeout=REQUEST_TIMEOUT)
         response.raise_for_status()
         with open(icon_path, 'wb') as f:
             f.write(response.content)
@@ -121,23 +95,27 @@ def save_icon(icon_url, icon_name):
         print(f"Error downloading icon '{icon_name}': {e}")
 
 
-# Main function
-def main():
-    print("Fetching weather data...")
-    weather_data = fetch_weather()
-
-    print("Parsing weather data...")
-    parsed_data = parse_weather(weather_data)
-
+# Save parsed weather data and make sure its icon is on disk
+def save_weather(parsed_data):
     print("Saving weather data to file...")
-    with open(OUTPUT_PATH, 'w') as f:
-        json.dump(parsed_data, f, indent=4)
+    # JSON for people, binary snapshot for the slides; both replaced atomically
+    snapshot_format.publish(OUTPUT_PATH, freshness.mark_written(parsed_data))
 
     print("Downloading weather icon...")
     icon_name = f"{parsed_data['icon_url'].split('/')[-1]}"
     save_icon(parsed_data['icon_url'], icon_name)
 
+    # One-time: fetch the rest of the icon set and pre-scale it for the slides
+    icon_atlas.ensure_atlas()
+
     print("Weather data and icon saved successfully.")
 
+# Main function
+def main():
+    # The shared service does the fetching so responses are cached and deduplicated
+    import weather_service
+    if not weather_service.run(home=True, regional=False):
+        exit(1)
+
 if __name__ == "__main__":
     main()
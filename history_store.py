@@ -0,0 +1,181 @@
+"""
+Compact observation history, one fixed-size ring file per location.
+
+Each file is a small header followed by `capacity` fixed-width records, so
+appending is two small writes at a known offset and the file never grows
+past its preallocated size. Records are appended in time order, so window
+queries binary-search the timestamps.
+"""
+import bisect
+import fcntl
+import math
+import os
+import re
+import struct
+import working_store
+
+HISTORY_DIR = os.path.join(working_store.directory("weatherdata"), "history")
+
+# 30 days of half-hourly observations
+DEFAULT_CAPACITY = 1440
+
+MAGIC = b"WXH1"
+VERSION = 1
+HEADER = struct.Struct("<4sHIII")  # magic, version, capacity, head (next write slot), count
+
+# timestamp, then the float fields below; NaN marks a missing value
+FIELDS = ("temperature", "pressure_inhg", "humidity_percent", "wind_speed_mph", "wind_deg", "gusts_mph")
+RECORD = struct.Struct("<d" + "f" * len(FIELDS))
+
+HPA_TO_INHG = 0.02953
+
+# 3-hour pressure tendency (inHg) below which the trend counts as steady
+STEADY_TENDENCY_INHG = 0.02
+
+
+def location_key(name):
+    """File-safe key for a location name ("New York City" -> "new_york_city")."""
+    return re.sub(r"[^a-z0-9]+", "_", name.lower()).strip("_") or "unknown"
+
+
+def observation_from_response(data):
+    """Pull the stored fields out of a raw OWM current-weather response."""
+    main = data.get("main", {})
+    wind = data.get("wind", {})
+    pressure = main.get("pressure")
+    return {
+        "timestamp": data["dt"],
+        "temperature": main.get("temp"),
+        "pressure_inhg": pressure * HPA_TO_INHG if pressure is not None else None,
+        "humidity_percent": main.get("humidity"),
+        "wind_speed_mph": wind.get("speed"),
+        "wind_deg": wind.get("deg"),
+        "gusts_mph": wind.get("gust"),
+    }
+
+
+class HistoryStore:
+    """Fixed-size ring of observations for one location."""
+
+    def __init__(self, key, directory=HISTORY_DIR, capacity=DEFAULT_CAPACITY):
+        self.path = os.path.join(directory, f"{key}.bin")
+        os.makedirs(directory, exist_ok=True)
+        if not os.path.exists(self.path):
+            self.create(capacity)
+
+    def create(self, capacity):
+        temp_path = f"{self.path}.tmp"
+        with open(temp_path, "wb") as f:
+            f.write(HEADER.pack(MAGIC, VERSION, capacity, 0, 0))
+            f.truncate(HEADER.size + capacity * RECORD.size)  # Preallocate (sparse) record space
+        os.replace(temp_path, self.path)
+
+    def read_header(self, f):
+        f.seek(0)
+        magic, version, capacity, head, count = HEADER.unpack(f.read(HEADER.size))
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{self.path} is not a version {VERSION} history file")
+        return capacity, head, count
+
+    def append(self, observation):
+        """Append an observation dict (see observation_from_response). O(1).
+
+        Observations not newer than the last stored one are skipped, so a
+        cached response that is recorded twice only counts once.
+        """
+        values = [observation.get(field) for field in FIELDS]
+        record = RECORD.pack(
+            float(observation["timestamp"]),
+            *(math.nan if value is None else float(value) for value in values),
+        )
+        with open(self.path, "r+b") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            capacity, head, count = self.read_header(f)
+            if count:
+                last_slot = (head - 1) % capacity
+                f.seek(HEADER.size + last_slot * RECORD.size)
+                last_timestamp = RECORD.unpack(f.read(RECORD.size))[0]
+                if observation["timestamp"] <= last_timestamp:
+                    return False
+            f.seek(HEADER.size + head * RECORD.size)
+            f.write(record)
+            f.seek(0)
+            f.write(HEADER.pack(MAGIC, VERSION, capacity, (head + 1) % capacity, min(count + 1, capacity)))
+        return True
+
+    def append_response(self, data):
+        """Append a raw OWM current-weather response."""
+        return self.append(observation_from_response(data))
+
+    def records(self):
+        """All stored records, oldest first, as tuples of (timestamp, *FIELDS)."""
+        with open(self.path, "rb") as f:
+            fcntl.flock(f, fcntl.LOCK_SH)
+            capacity, head, count = self.read_header(f)
+            body = f.read(capacity * RECORD.size)
+        records = list(RECORD.iter_unpack(body))
+        if count < capacity:
+            return records[:count]
+        return records[head:] + records[:head]  # Unroll the ring
+
+    def window(self, since, records=None):
+        """Records with timestamp >= since, oldest first."""
+        records = self.records() if records is None else records
+        start = bisect.bisect_left(records, since, key=lambda record: record[0])
+        return records[start:]
+
+    def series(self, field, since=0):
+        """(timestamp, value) pairs for one field, skipping missing values; handy for sparklines."""
+        index = FIELDS.index(field) + 1
+        return [
+            (record[0], record[index])
+            for record in self.window(since)
+            if not math.isnan(record[index])
+        ]
+
+    def tendency(self, field, hours=3):
+        """Change in `field` over the last `hours`, or None without enough history.
+
+        Compares the latest value with the one closest to `hours` before it,
+        which must be within half an hour of that time.
+        """
+        records = self.records()
+        if len(records) < 2:
+            return None
+        index = FIELDS.index(field) + 1
+        latest = records[-1]
+        target = latest[0] - hours * 3600
+        position = bisect.bisect_left(records, target, key=lambda record: record[0])
+        candidates = records[max(0, position - 1):position + 1]
+        past = min(candidates, key=lambda record: abs(record[0] - target))
+        if abs(past[0] - target) > 1800 or past is latest:
+            return None
+        change = latest[index] - past[index]
+        return None if math.isnan(change) else change
+
+    def min_max(self, field, since):
+        """(min, max) of `field` since a timestamp, or None if there are no values."""
+        values = [value for _, value in self.series(field, since)]
+        return (min(values), max(values)) if values else None
+
+    def rolling_mean(self, field, hours, now=None):
+        """Mean of `field` over the last `hours` (ending at the latest record by default)."""
+        records = self.records()
+        if not records:
+            return None
+        end = records[-1][0] if now is None else now
+        index = FIELDS.index(field) + 1
+        values = [record[index] for record in self.window(end - hours * 3600, records) if not math.isnan(record[index])]
+        return sum(values) / len(values) if values else None
+
+
+def pressure_trend(store):
+    """'up', 'down' or 'steady' from the 3-hour pressure tendency, or None without enough history."""
+    change = store.tendency("pressure_inhg", hours=3)
+    if change is None:
+        return None
+    if change >= STEADY_TENDENCY_INHG:
+        return "up"
+    if change <= -STEADY_TENDENCY_INHG:
+        return "down"
+    return "steady"
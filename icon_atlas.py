@@ -0,0 +1,141 @@
+"""
+Pre-warmed, pre-scaled weather icon atlas.
+
+Downloads the full OpenWeatherMap icon set in parallel (skipping icons
+already on disk), scales every icon to each size the slides draw it at,
+and packs them into one atlas image plus a JSON index of source rects:
+
+    weatherdata/icons/atlas.png
+    weatherdata/icons/atlas.json   {"sizes": {"175": {"01d": [x, y, w, h], ...}}}
+
+Run `python3 icon_atlas.py` to (re)build it; the weather service builds it
+once automatically when it's missing or incomplete.
+"""
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+import requests
+from PIL import Image
+import metrics
+import snapshot_format
+from owm_proxy import proxied
+import working_store
+
+ICON_DIR = os.path.join(working_store.directory("weatherdata"), "icons")
+ATLAS_IMAGE_PATH = os.path.join(ICON_DIR, "atlas.png")
+ATLAS_INDEX_PATH = os.path.join(ICON_DIR, "atlas.json")
+
+ICON_URL = "http://openweathermap.org/img/wn/{code}@2x.png"
+
+# Every OWM condition icon, day and night
+ICON_CODES = [
+    f"{number}{time_of_day}"
+    for number in ("01", "02", "03", "04", "09", "10", "11", "13", "50")
+    for time_of_day in ("d", "n")
+]
+
+# Sizes (square, in pixels) the slides draw icons at
+ATLAS_SIZES = (175,)  # slide3's current conditions icon
+
+ATLAS_COLUMNS = 6
+DOWNLOAD_WORKERS = 6
+REQUEST_TIMEOUT = 10
+
+
+def icon_code(icon_name_or_url):
+    """'http://.../13n@2x.png' or '13n@2x.png' -> '13n'."""
+    return os.path.basename(icon_name_or_url).split("@")[0].split(".")[0]
+
+
+def icon_path(code):
+    return os.path.join(ICON_DIR, f"{code}@2x.png")
+
+
+def download_icon(session, code):
+    """Download one icon unless it's already on disk. Returns True if it's available."""
+    path = icon_path(code)
+    if os.path.exists(path):
+        return True
+    # Icons are static files, not API calls, so they don't count against the API budget
+    try:
+        with metrics.timer("weather_fetch_seconds", source="icon"):
+            response = session.get(proxied(ICON_URL.format(code=code)), timeout=REQUEST_TIMEOUT)
+        response.raise_for_status()
+    except requests.RequestException as e:
+        print(f"Error downloading icon '{code}': {e}")
+        return False
+    snapshot_format.write_atomic(path, response.content)
+    print(f"Icon '{code}' downloaded successfully.")
+    return True
+
+
+def prewarm():
+    """Fetch every missing icon in parallel. Returns the codes available on disk."""
+    os.makedirs(ICON_DIR, exist_ok=True)
+    with requests.Session() as session, ThreadPoolExecutor(max_workers=DOWNLOAD_WORKERS) as executor:
+        available = list(executor.map(lambda code: download_icon(session, code), ICON_CODES))
+    return [code for code, ok in zip(ICON_CODES, available) if ok]
+
+
+def build_atlas(codes, sizes=ATLAS_SIZES):
+    """Scale `codes` to every size and pack them into one atlas image and index."""
+    rows_per_size = -(-len(codes) // ATLAS_COLUMNS)  # Ceiling division
+    width = ATLAS_COLUMNS * max(sizes)
+    height = sum(rows_per_size * size for size in sizes)
+    atlas = Image.new("RGBA", (width, height), (0, 0, 0, 0))
+
+    index = {"sizes": {}}
+    y_offset = 0
+    for size in sizes:
+        rects = {}
+        for position, code in enumerate(codes):
+            with Image.open(icon_path(code)) as icon:
+                icon = icon.convert("RGBA")
+                # Same fit as Qt.KeepAspectRatio
+                scale = size / max(icon.width, icon.height)
+                scaled = icon.resize((round(icon.width * scale), round(icon.height * scale)), Image.LANCZOS)
+            x = (position % ATLAS_COLUMNS) * size
+            y = y_offset + (position // ATLAS_COLUMNS) * size
+            atlas.paste(scaled, (x, y))
+            rects[code] = [x, y, scaled.width, scaled.height]
+        index["sizes"][str(size)] = rects
+        y_offset += rows_per_size * size
+
+    # Image first, so a reader that sees the new index also gets the new image
+    temp_image_path = f"{ATLAS_IMAGE_PATH}.tmp.png"
+    atlas.save(temp_image_path, optimize=True)
+    os.replace(temp_image_path, ATLAS_IMAGE_PATH)
+    snapshot_format.write_atomic(ATLAS_INDEX_PATH, json.dumps(index, indent=4).encode("utf-8"))
+    print(f"Icon atlas with {len(codes)} icons at sizes {list(sizes)} saved to {ATLAS_IMAGE_PATH}")
+    return index
+
+
+def load_index():
+    """The atlas index, or None if there is no atlas yet."""
+    try:
+        with open(ATLAS_INDEX_PATH, "r") as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+
+
+def ensure_atlas():
+    """Build the atlas if it's missing or doesn't cover every icon and size yet."""
+    index = load_index()
+    if index is not None and os.path.exists(ATLAS_IMAGE_PATH):
+        complete = all(
+            set(ICON_CODES) <= set(index["sizes"].get(str(size), {}))
+            for size in ATLAS_SIZES
+        )
+        if complete:
+            return index
+    codes = prewarm()
+    if not codes:
+        return index
+    if index is not None and all(set(codes) == set(index["sizes"].get(str(size), {})) for size in ATLAS_SIZES):
+        return index  # Still offline for the missing icons; nothing new to pack
+    return build_atlas(codes)
+
+
+if __name__ == "__main__":
+    build_atlas(prewarm())
@@ -0,0 +1,327 @@
+"""
+Counters, gauges and histograms shared by every process, scraped over HTTP.
+
+Each process records into an in-memory registry (a dict update under a
+lock, so hot paths pay a few microseconds) and flush() merges whatever
+changed since the last flush into weatherdata/metrics/<component>.json,
+under a lock file. Counters and histograms add up across processes and
+runs; gauges keep the latest value. Every process flushes at exit, and
+long-running ones (the GUI, the proxy) also call start_flusher().
+
+serve() exposes the merged files in the Prometheus text format on
+localhost; the GUI starts it on metrics_port. Radar frame and data file
+ages are computed from the files at scrape time.
+
+    curl -s localhost:9110/metrics
+    python3 metrics.py            print the current metrics
+    python3 metrics.py serve      serve them without the GUI
+"""
+import atexit
+import bisect
+import fcntl
+import json
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import config
+import working_store
+
+METRICS_DIR = os.path.join(working_store.directory("weatherdata"), "metrics")
+LOCK_PATH = os.path.join(METRICS_DIR, "metrics.lock")
+
+# The file this process flushes into: the script name (weather_gui, get_radar, ...)
+COMPONENT = os.path.splitext(os.path.basename(sys.argv[0] if sys.argv and sys.argv[0] else "python"))[0]
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+JOB_BUCKETS = (1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+PAINT_BUCKETS = (0.001, 0.002, 0.005, 0.01, 0.02, 0.05, 0.1, 0.25)
+FRESHNESS_BUCKETS = (0.1, 0.5, 1, 5, 15, 60, 300, 600, 1800, 3600, 7200, 14400, 43200)
+
+# name -> (type, help, histogram buckets)
+METRICS = {
+    "weather_fetch_seconds": ("histogram", "OpenWeatherMap request latency, by source.", LATENCY_BUCKETS),
+    "weather_api_calls_total": ("counter", "API calls granted by the budget, by priority.", None),
+    "weather_api_deferred_total": ("counter", "API calls the budget deferred, by priority.", None),
+    "weather_cache_requests_total": ("counter", "Cache lookups, by cache and result.", None),
+    "weather_render_stage_seconds": ("histogram", "Radar run stage times, by stage.", LATENCY_BUCKETS),
+    "weather_job_runs_total": ("counter", "Refresh job runs, by job and result.", None),
+    "weather_job_seconds": ("histogram", "Refresh job run time, by job.", JOB_BUCKETS),
+    "weather_paint_seconds": ("histogram", "Slide paint time, by slide.", PAINT_BUCKETS),
+    "weather_freshness_seconds": ("histogram", "Data age at each pipeline hop when it first reaches the screen, "
+                                  "by source and hop (see freshness.py).", FRESHNESS_BUCKETS),
+    "weather_frame_age_seconds": ("gauge", "Seconds since each radar layer GIF was written.", None),
+    "weather_data_age_seconds": ("gauge", "Seconds since each data file was published.", None),
+}
+
+
+def escape(value):
+    """A label value as the text format wants it."""
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def series_key(name, labels):
+    """'name{a="1",b="2"}', the key a series is stored and exported under."""
+    if not labels:
+        return name
+    text = ",".join(f'{label}="{escape(value)}"' for label, value in sorted(labels.items()))
+    return f"{name}{{{text}}}"
+
+
+def split_key(key):
+    """(name, label text without braces) from a series key."""
+    name, _, rest = key.partition("{")
+    return name, rest[:-1]
+
+
+class Registry:
+    """This process's changes since the last flush."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counters = {}  # key -> increment
+        self.gauges = {}  # key -> [value, set_at]
+        self.histograms = {}  # key -> per-bucket counts..., then sum, count
+
+    def inc(self, name, value, labels):
+        key = series_key(name, labels)
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def set_gauge(self, name, value, labels):
+        key = series_key(name, labels)
+        with self.lock:
+            self.gauges[key] = [value, time.time()]
+
+    def observe(self, name, value, labels):
+        buckets = METRICS[name][2]
+        key = series_key(name, labels)
+        with self.lock:
+            entry = self.histograms.get(key)
+            if entry is None:
+                entry = self.histograms[key] = [0] * len(buckets) + [0.0, 0]
+            index = bisect.bisect_left(buckets, value)  # First bucket whose upper bound holds the value
+            if index < len(buckets):
+                entry[index] += 1
+            entry[-2] += value
+            entry[-1] += 1
+
+    def take(self):
+        """Hand over everything recorded since the last call and start afresh."""
+        with self.lock:
+            changes = {"counters": self.counters, "gauges": self.gauges, "histograms": self.histograms}
+            self.counters, self.gauges, self.histograms = {}, {}, {}
+        return changes
+
+
+_registry = Registry()
+
+
+def inc(name, value=1, **labels):
+    """Add to a counter."""
+    _registry.inc(name, value, labels)
+
+
+def set_gauge(name, value, **labels):
+    _registry.set_gauge(name, value, labels)
+
+
+def observe(name, value, **labels):
+    """Record one histogram sample (seconds, for the *_seconds metrics)."""
+    _registry.observe(name, value, labels)
+
+
+@contextmanager
+def timer(name, **labels):
+    """Observe how long the `with` block took."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        _registry.observe(name, time.perf_counter() - start, labels)
+
+
+def empty_file():
+    return {"counters": {}, "gauges": {}, "histograms": {}}
+
+
+def load_file(path):
+    try:
+        with open(path, "r") as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return empty_file()
+
+
+def merge(into, changes):
+    """Add `changes` (as from Registry.take or another file) into `into`."""
+    for key, value in changes["counters"].items():
+        into["counters"][key] = into["counters"].get(key, 0) + value
+    for key, entry in changes["gauges"].items():
+        if key not in into["gauges"] or entry[1] >= into["gauges"][key][1]:
+            into["gauges"][key] = entry
+    for key, entry in changes["histograms"].items():
+        existing = into["histograms"].get(key)
+        if existing is None or len(existing) != len(entry):
+            into["histograms"][key] = list(entry)  # New, or the buckets changed
+        else:
+            into["histograms"][key] = [a + b for a, b in zip(existing, entry)]
+    return into
+
+
+def flush():
+    """Merge this process's changes into its component file.
+
+    Written via a temp file and rename but without an fsync: this runs every
+    metrics_flush_sec and at every exit, and a power cut costs at most the
+    last interval's counts.
+    """
+    changes = _registry.take()
+    if not any(changes.values()):
+        return
+    path = os.path.join(METRICS_DIR, f"{COMPONENT}.json")
+    try:
+        os.makedirs(METRICS_DIR, exist_ok=True)
+        with open(LOCK_PATH, "a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            merged = merge(load_file(path), changes)
+            temp_path = f"{path}.tmp"  # Only one writer at a time, under the lock
+            with open(temp_path, "w") as f:
+                json.dump(merged, f)
+            os.replace(temp_path, path)
+    except OSError as e:
+        print(f"Couldn't write metrics to {path}: {e}")
+
+atexit.register(flush)
+
+
+_flusher = None
+
+def start_flusher(interval_sec=None):
+    """Flush every metrics_flush_sec on a background thread (for long-running processes)."""
+    global _flusher
+    if _flusher is not None:
+        return
+
+    def run():
+        while True:
+            time.sleep(interval_sec or config.get_config().metrics_flush_sec)
+            flush()
+
+    _flusher = threading.Thread(target=run, name="metrics-flush", daemon=True)
+    _flusher.start()
+
+
+def file_ages(now=None):
+    """Age gauges computed from file mtimes: radar GIFs per layer and the data files."""
+    now = time.time() if now is None else now
+    gauges = {}
+    tiles_dir = working_store.directory("weathertiles")
+    data_dir = working_store.directory("weatherdata")
+    try:
+        gif_names = [name for name in os.listdir(tiles_dir) if name.endswith(".gif")]
+    except FileNotFoundError:
+        gif_names = []
+    paths = [("weather_frame_age_seconds", {"layer": name[:-len(".gif")]}, os.path.join(tiles_dir, name))
+             for name in gif_names]
+    paths += [("weather_data_age_seconds", {"file": name}, os.path.join(data_dir, name))
+              for name in ("home_weather.json", "regional_weather.json")]
+    for name, labels, path in paths:
+        try:
+            gauges[series_key(name, labels)] = [round(now - os.stat(path).st_mtime, 1), now]
+        except FileNotFoundError:
+            continue
+    return gauges
+
+
+def collect():
+    """Every component file merged, plus this process's unflushed changes and the file ages."""
+    flush()
+    merged = empty_file()
+    try:
+        file_names = sorted(name for name in os.listdir(METRICS_DIR) if name.endswith(".json"))
+    except FileNotFoundError:
+        file_names = []
+    for file_name in file_names:
+        merge(merged, load_file(os.path.join(METRICS_DIR, file_name)))
+    merged["gauges"].update(file_ages())
+    return merged
+
+
+def format_number(value):
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+def render(merged):
+    """The Prometheus text exposition of merged metrics."""
+    lines = []
+    for name, (kind, help_text, buckets) in METRICS.items():
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+        if kind == "histogram":
+            for key, entry in sorted(merged["histograms"].items()):
+                series_name, labels = split_key(key)
+                if series_name != name or len(entry) != len(buckets) + 2:
+                    continue
+                prefix = f"{labels}," if labels else ""
+                cumulative = 0
+                for bound, count in zip(buckets, entry):
+                    cumulative += count
+                    lines.append(f'{name}_bucket{{{prefix}le="{format_number(bound)}"}} {cumulative}')
+                lines.append(f'{name}_bucket{{{prefix}le="+Inf"}} {entry[-1]}')
+                suffix = f"{{{labels}}}" if labels else ""
+                lines.append(f"{name}_sum{suffix} {format_number(entry[-2])}")
+                lines.append(f"{name}_count{suffix} {entry[-1]}")
+        else:
+            values = merged["counters"] if kind == "counter" else {
+                key: entry[0] for key, entry in merged["gauges"].items()}
+            for key, value in sorted(values.items()):
+                if split_key(key)[0] == name:
+                    lines.append(f"{key} {format_number(value)}")
+    return "\n".join(lines) + "\n"
+
+
+class MetricsRequestHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = render(collect()).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        try:
+            self.wfile.write(body)
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+    def log_message(self, format, *args):
+        pass  # A scrape every few seconds would flood the log
+
+
+def serve(port=None, host="127.0.0.1"):
+    """Serve /metrics on a background thread. Returns the server."""
+    port = config.get_config().metrics_port if port is None else port
+    server = ThreadingHTTPServer((host, port), MetricsRequestHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True).start()
+    print(f"Metrics on http://{host}:{server.server_address[1]}/metrics")
+    return server
+
+
+def main():
+    if len(sys.argv) > 1 and sys.argv[1] == "serve":
+        serve()
+        try:
+            while True:
+                time.sleep(3600)
+        except KeyboardInterrupt:
+            pass
+        return
+    print(render(collect()), end="")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,458 @@
+"""
+Shared caching proxy for OpenWeatherMap, for fleets of displays in one area.
+
+Point every display's fetchers at one proxy with the owm_base_url setting
+(e.g. "http://weather-proxy.local:8780"); they then request
+<base>/data/2.5/weather, <base>/map/<layer>/<z>/<x>/<y>.png and
+<base>/img/wn/<icon>.png instead of the OWM hosts. The proxy:
+
+  - keys the cache without `appid` and with coordinates rounded to the
+    dedupe grid (dedupe_grid_decimals), so nearby displays share entries
+  - coalesces concurrent identical requests into one upstream call
+  - serves fresh-enough responses from memory, then from disk, so a
+    restarted proxy doesn't refetch everything
+  - only caches successful responses, and keeps the disk cache under
+    proxy_cache_max_mb (and ICON_TTL_SEC old), oldest first
+  - charges its own API budget (api_budget.py) for every upstream weather
+    or tile call, at the priority the display sends in X-Budget-Priority,
+    and answers 429 with X-Cache: deferred when the budget defers one;
+    displays using the proxy skip their own budget
+
+Usage:
+    python3 owm_proxy.py serve [--port 8780] [--upstream URL]
+    python3 owm_proxy.py fake-upstream [--port 8781]   # canned OWM responses for testing
+    python3 owm_proxy.py selftest                      # proxy + fake upstream on localhost
+"""
+import hashlib
+import json
+import os
+import struct
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qsl, urlencode
+import requests
+import api_budget
+import config
+import metrics
+import snapshot_format
+import working_store
+
+CACHE_DIR = os.path.join(working_store.directory("weatherdata"), "proxy_cache")
+
+# Real OWM host for each URL shape the proxy understands
+UPSTREAMS = {
+    "/data/": "http://api.openweathermap.org",
+    "/map/": "https://tile.openweathermap.org",
+    "/img/": "http://openweathermap.org",
+}
+
+ICON_TTL_SEC = 30 * 24 * 60 * 60  # Icons never change
+MEMORY_ENTRIES = 512  # Tiles are ~10-30 KB each
+DISK_MAX_AGE_SEC = ICON_TTL_SEC  # Nothing older is ever served
+PRUNE_INTERVAL_SEC = 60 * 60
+
+# Budget priority an upstream miss is charged at when the display doesn't send one, lowest
+# that fits so unlabelled requests can't use up the reserves; icons are static files, not API calls
+BUDGET_PRIORITY = {"weather": api_budget.REGIONAL, "tile": api_budget.RADAR}
+PRIORITY_HEADER = "X-Budget-Priority"
+
+# Disk entry: fetched_at, status, content-type length, then content type and body
+DISK_HEADER = struct.Struct("<dHH")
+
+
+def proxy_enabled():
+    """Whether requests go through a proxy, which keeps the API budget instead of the fetchers."""
+    return bool(config.get_config().owm_base_url)
+
+
+def proxied(url):
+    """`url` rewritten to go through the proxy in owm_base_url, or unchanged if none is set."""
+    base = config.get_config().owm_base_url
+    if not base:
+        return url
+    parts = urlsplit(url)
+    return base.rstrip("/") + parts.path + (f"?{parts.query}" if parts.query else "")
+
+
+def priority_headers(priority):
+    """Headers telling the proxy which budget priority to charge a request at (none without a proxy)."""
+    return {PRIORITY_HEADER: priority} if proxy_enabled() else {}
+
+
+def classify(path, query, grid_decimals):
+    """(kind, cache key, upstream query) for a request, or None if it isn't an OWM shape we know."""
+    params = dict(parse_qsl(query))
+    params.pop("appid", None)
+    if path == "/data/2.5/weather":
+        try:
+            # Ask upstream for the rounded point, so the cached answer is the same for the whole cell
+            params["lat"] = f"{round(float(params['lat']), grid_decimals):.{grid_decimals}f}"
+            params["lon"] = f"{round(float(params['lon']), grid_decimals):.{grid_decimals}f}"
+        except (KeyError, ValueError):
+            return None
+        return "weather", path + "?" + urlencode(sorted(params.items())), params
+    parts = path.strip("/").split("/")
+    if path.startswith("/map/") and len(parts) == 5 and parts[4].endswith(".png"):
+        return "tile", path, {}
+    if path.startswith("/img/wn/") and path.endswith(".png"):
+        return "icon", path, {}
+    return None
+
+
+class ResponseCache:
+    """Responses by key in memory (LRU) and on disk, each with the time it was fetched."""
+
+    def __init__(self, directory=CACHE_DIR, memory_entries=MEMORY_ENTRIES, max_bytes=None, max_age=DISK_MAX_AGE_SEC):
+        self.directory = directory
+        self.memory_entries = memory_entries
+        self.max_bytes = config.get_config().proxy_cache_max_mb * 1024 * 1024 if max_bytes is None else max_bytes
+        self.max_age = max_age
+        self.memory = OrderedDict()  # key -> (fetched_at, status, content_type, body)
+        self.lock = threading.Lock()
+        self.last_prune = 0.0
+        os.makedirs(directory, exist_ok=True)
+
+    def disk_path(self, key):
+        return os.path.join(self.directory, hashlib.sha1(key.encode("utf-8")).hexdigest() + ".bin")
+
+    def get(self, key, ttl):
+        """(entry, "memory" | "disk") if a fresh entry exists, else (None, None)."""
+        now = time.time()
+        with self.lock:
+            entry = self.memory.get(key)
+            if entry is not None and now - entry[0] < ttl:
+                self.memory.move_to_end(key)
+                return entry, "memory"
+        entry = self.read_disk(key)
+        if entry is not None and now - entry[0] < ttl:
+            self.remember(key, entry)
+            return entry, "disk"
+        return None, None
+
+    def put(self, key, entry):
+        self.remember(key, entry)
+        fetched_at, status, content_type, body = entry
+        content_type = content_type.encode("utf-8")
+        payload = DISK_HEADER.pack(fetched_at, status, len(content_type)) + content_type + body
+        snapshot_format.write_atomic(self.disk_path(key), payload)
+        with self.lock:
+            due = time.time() - self.last_prune >= PRUNE_INTERVAL_SEC
+            if due:
+                self.last_prune = time.time()
+        if due:
+            threading.Thread(target=self.prune, name="proxy-cache-prune", daemon=True).start()
+
+    def prune(self):
+        """Delete disk entries older than max_age, then the oldest until the rest fit in max_bytes.
+
+        Returns the number of files deleted.
+        """
+        now = time.time()
+        files = []
+        for name in os.listdir(self.directory):
+            if not name.endswith(".bin"):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            files.append((stat.st_mtime, stat.st_size, path))
+        files.sort()  # Oldest (by write time, i.e. fetch time) first
+        total = sum(size for _, size, _ in files)
+        deleted = 0
+        for mtime, size, path in files:
+            if now - mtime < self.max_age and total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+            deleted += 1
+        if deleted:
+            print(f"Proxy cache: pruned {deleted} entries, {total / 1024 / 1024:.1f} MB left")
+        return deleted
+
+    def remember(self, key, entry):
+        with self.lock:
+            self.memory[key] = entry
+            self.memory.move_to_end(key)
+            while len(self.memory) > self.memory_entries:
+                self.memory.popitem(last=False)
+
+    def read_disk(self, key):
+        try:
+            with open(self.disk_path(key), "rb") as f:
+                payload = f.read()
+        except FileNotFoundError:
+            return None
+        if len(payload) < DISK_HEADER.size:
+            return None
+        fetched_at, status, type_length = DISK_HEADER.unpack_from(payload)
+        content_type = payload[DISK_HEADER.size:DISK_HEADER.size + type_length].decode("utf-8")
+        return fetched_at, status, content_type, payload[DISK_HEADER.size + type_length:]
+
+
+class OWMProxy:
+    """Cache lookups, request coalescing and upstream fetches, shared by the handler threads."""
+
+    def __init__(self, upstream=None, cache=None, settings=None):
+        settings = settings or config.get_config()
+        self.upstream = upstream  # Overrides UPSTREAMS (e.g. a fake upstream) when set
+        self.api_key = settings.api_key
+        self.grid_decimals = settings.dedupe_grid_decimals
+        self.ttl = {
+            "weather": settings.observation_cache_ttl_sec,
+            "tile": settings.proxy_tile_ttl_sec,
+            "icon": ICON_TTL_SEC,
+        }
+        self.cache = cache or ResponseCache()
+        self.session = requests.Session()
+        self.timeout = settings.request_timeout_sec
+        self.in_flight = {}  # key -> Future of the upstream entry
+        self.lock = threading.Lock()
+        self.stats = {"memory_hits": 0, "disk_hits": 0, "upstream_calls": 0, "coalesced": 0, "errors": 0, "deferred": 0}
+
+    def count(self, name):
+        with self.lock:
+            self.stats[name] += 1
+
+    def handle(self, path, query, priority=None):
+        """(status, content_type, body, source) for a proxied GET, charged at `priority` on a miss."""
+        classified = classify(path, query, self.grid_decimals)
+        if classified is None:
+            return 404, "text/plain", b"Not an OpenWeatherMap URL this proxy understands\n", "none"
+        if priority is not None and priority not in api_budget.PRIORITIES:
+            return 400, "text/plain", f"Unknown {PRIORITY_HEADER}: {priority}\n".encode("utf-8"), "none"
+        kind, key, upstream_params = classified
+
+        entry, source = self.cache.get(key, self.ttl[kind])
+        if entry is not None:
+            self.count(f"{source}_hits")
+            return entry[1], entry[2], entry[3], source
+
+        with self.lock:
+            future = self.in_flight.get(key)
+            leader = future is None
+            if leader:
+                future = self.in_flight[key] = Future()
+            else:
+                self.stats["coalesced"] += 1
+        if leader:
+            try:
+                # The previous leader for this key may have finished since we looked
+                entry, _ = self.cache.get(key, self.ttl[kind])
+                future.set_result(entry or self.fetch(kind, path, query, upstream_params, key, priority))
+            except Exception as e:
+                future.set_exception(e)
+            finally:
+                with self.lock:
+                    del self.in_flight[key]
+        try:
+            _, status, content_type, body = future.result()
+        except api_budget.BudgetDeferred as e:
+            self.count("deferred")
+            return 429, "text/plain", f"{e}\n".encode("utf-8"), "deferred"
+        except requests.RequestException as e:
+            self.count("errors")
+            return 502, "text/plain", f"Upstream request failed: {e}\n".encode("utf-8"), "error"
+        return status, content_type, body, "upstream" if leader else "coalesced"
+
+    def fetch(self, kind, path, query, upstream_params, key, priority=None):
+        params = dict(parse_qsl(query))
+        params.update(upstream_params)  # Rounded coordinates for current weather
+        if kind != "icon" and not params.get("appid"):
+            params["appid"] = self.api_key  # The caller's key if it sent one, else the proxy's own
+        host = self.upstream or next(host for prefix, host in UPSTREAMS.items() if path.startswith(prefix))
+        # Charged here, on a miss, so each upstream call counts once however many displays asked
+        if kind not in BUDGET_PRIORITY:
+            priority = None
+        elif priority is None:
+            priority = BUDGET_PRIORITY[kind]
+        if priority is not None and not api_budget.acquire(priority, max_wait=self.timeout):
+            raise api_budget.BudgetDeferred(f"API budget deferred this {kind} request")
+        self.count("upstream_calls")
+        response = self.session.get(host.rstrip("/") + path, params=params, timeout=self.timeout)
+        if response.status_code == 429:
+            api_budget.throttled()
+        entry = (time.time(), response.status_code, response.headers.get("Content-Type", "application/octet-stream"),
+                 response.content)
+        if response.status_code == 200:
+            self.cache.put(key, entry)
+        return entry
+
+    def status(self):
+        with self.lock:
+            return dict(self.stats, in_flight=len(self.in_flight), memory_entries=len(self.cache.memory))
+
+
+def make_handler(proxy):
+    class ProxyHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            parts = urlsplit(self.path)
+            if parts.path == "/_status":
+                status, content_type, body, source = 200, "application/json", json.dumps(proxy.status()).encode(), "status"
+            else:
+                status, content_type, body, source = proxy.handle(parts.path, parts.query,
+                                                                  self.headers.get(PRIORITY_HEADER))
+                metrics.inc("weather_cache_requests_total",
+                            cache="proxy_tiles" if parts.path.startswith("/map/") else "proxy", result=source)
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            self.send_header("X-Cache", source)
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+    return ProxyHandler
+
+
+def start_server(handler, port, host="0.0.0.0"):
+    """Serve `handler` on a background thread; returns the server."""
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+class FakeUpstreamHandler(BaseHTTPRequestHandler):
+    """Canned OWM responses, slow enough that concurrent requests overlap."""
+
+    calls = 0
+    delay_sec = 0.2
+    lock = threading.Lock()
+
+    def do_GET(self):
+        with FakeUpstreamHandler.lock:
+            FakeUpstreamHandler.calls += 1
+        time.sleep(self.delay_sec)
+        parts = urlsplit(self.path)
+        params = dict(parse_qsl(parts.query))
+        if parts.path == "/data/2.5/weather":
+            body = json.dumps({
+                "coord": {"lat": float(params.get("lat", 0)), "lon": float(params.get("lon", 0))},
+                "weather": [{"description": "clear sky", "icon": "01d"}],
+                "main": {"temp": 50.0, "humidity": 40, "pressure": 1015},
+                "wind": {"speed": 5.0, "deg": 180},
+                "visibility": 10000,
+                "dt": int(time.time()),
+                "name": "Fake",
+            }).encode("utf-8")
+            content_type = "application/json"
+        elif parts.path.endswith(".png"):
+            body = b"\x89PNG\r\n\x1a\n" + parts.path.encode("utf-8")  # Not a real image; the proxy doesn't care
+            content_type = "image/png"
+        else:
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def selftest():
+    """Run the proxy against the fake upstream on localhost and check caching and coalescing."""
+    import tempfile
+    from concurrent.futures import ThreadPoolExecutor
+    fake = start_server(FakeUpstreamHandler, 0, "127.0.0.1")
+    upstream = f"http://127.0.0.1:{fake.server_address[1]}"
+    with tempfile.TemporaryDirectory() as cache_dir:
+        # Keep the test's budget charges out of the real budget
+        api_budget.STATE_PATH = os.path.join(cache_dir, "api_budget.json")
+        api_budget.LOCK_PATH = os.path.join(cache_dir, "api_budget.lock")
+        proxy = OWMProxy(upstream=upstream, cache=ResponseCache(cache_dir))
+        server = start_server(make_handler(proxy), 0, "127.0.0.1")
+        base = f"http://127.0.0.1:{server.server_address[1]}"
+
+        # Ten displays a few hundred metres apart, with different keys, all at once
+        urls = [f"{base}/data/2.5/weather?lat={39.7392 + i * 0.0004}&lon=-104.9903&units=imperial&appid=key{i}"
+                for i in range(10)]
+        with ThreadPoolExecutor(max_workers=10) as executor:
+            sources = list(executor.map(
+                lambda url: requests.get(url, headers={PRIORITY_HEADER: api_budget.HOME}).headers["X-Cache"], urls))
+        print(f"10 concurrent nearby weather requests -> {FakeUpstreamHandler.calls} upstream call(s); {sources}")
+        ok = FakeUpstreamHandler.calls == 1
+
+        sources = [requests.get(f"{base}/map/clouds_new/6/12/24.png?appid=a").headers["X-Cache"] for _ in range(3)]
+        print(f"Same tile 3 times -> {sources}")
+        ok = ok and sources == ["upstream", "memory", "memory"]
+
+        # A fresh proxy on the same cache directory serves from disk
+        restarted = OWMProxy(upstream=upstream, cache=ResponseCache(cache_dir))
+        _, _, _, source = restarted.handle("/map/clouds_new/6/12/24.png", "appid=b")
+        print(f"Same tile after a restart -> {source}")
+        ok = ok and source == "disk"
+
+        status, _, _, _ = proxy.handle("/somewhere/else", "")
+        ok = ok and status == 404
+        status, _, _, _ = proxy.handle("/data/2.5/weather", "lat=40&lon=-105", "urgent")
+        ok = ok and status == 400
+
+        # An unlabelled weather miss is charged at the lowest priority
+        proxy.handle("/data/2.5/weather", "lat=40&lon=-105")
+
+        # Only the upstream misses were charged, each at its request's priority
+        charged = api_budget.status()["calls_by_priority"]
+        print(f"Budget charged: {charged}")
+        ok = ok and charged == {api_budget.HOME: 1, api_budget.RADAR: 1, api_budget.REGIONAL: 1}
+
+        # A budget that's used up defers upstream misses, but not cache hits
+        api_budget.throttled()
+        proxy.timeout = 0  # Don't wait for a token
+        status, _, _, source = proxy.handle("/map/clouds_new/6/12/25.png", "appid=a")
+        print(f"New tile with no budget left -> {status} {source}")
+        ok = ok and (status, source) == (429, "deferred")
+        ok = ok and proxy.handle("/map/clouds_new/6/12/24.png", "appid=a")[3] == "memory"
+
+        # Pruning keeps the disk cache under its size bound, dropping the oldest first
+        cache = ResponseCache(cache_dir, max_bytes=0)
+        deleted = cache.prune()
+        print(f"Pruned {deleted} disk entries down to 0 bytes")
+        ok = ok and deleted == 3 and not [name for name in os.listdir(cache_dir) if name.endswith(".bin")]
+        print(f"Proxy stats: {proxy.status()}")
+        server.shutdown()
+    fake.shutdown()
+    print("Self-test passed." if ok else "Self-test FAILED.")
+    return ok
+
+
+def main():
+    import argparse
+    settings = config.get_config()
+    parser = argparse.ArgumentParser(description="Caching OpenWeatherMap proxy.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    serve = subparsers.add_parser("serve", help="Run the proxy")
+    serve.add_argument("--port", type=int, default=settings.proxy_port)
+    serve.add_argument("--upstream", help="Send every request to this base URL instead of the OWM hosts")
+    fake = subparsers.add_parser("fake-upstream", help="Serve canned OWM responses")
+    fake.add_argument("--port", type=int, default=settings.proxy_port + 1)
+    subparsers.add_parser("selftest", help="Check the proxy against the fake upstream on localhost")
+    args = parser.parse_args()
+
+    if args.command == "selftest":
+        exit(0 if selftest() else 1)
+    if args.command == "serve":
+        server = start_server(make_handler(OWMProxy(upstream=args.upstream)), args.port)
+        metrics.start_flusher()
+        print(f"OWM proxy listening on port {args.port}" + (f", upstream {args.upstream}" if args.upstream else ""))
+    else:
+        server = start_server(FakeUpstreamHandler, args.port)
+        print(f"Fake OWM upstream listening on port {args.port}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+if __name__ == "__main__":
+    main()
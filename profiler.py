@@ -0,0 +1,233 @@
+"""
+On-demand sampling profiler for the GUI and the fetch jobs.
+
+Nothing is traced while it's off: a process that called install() only has a
+SIGUSR1 handler and a thread that stats the control file once a second.
+While it's on, a background thread takes every thread's Python stack every
+profile_interval_ms and counts them, so the Qt event loop never runs any of
+it. When the window ends (or the process exits) the counts are written as
+collapsed stacks, one "frame;frame;frame count" line per stack, ready for
+flamegraph.pl or speedscope:
+
+    weatherdata/profiles/<process>[-<job>]-<pid>-<time>.folded
+
+Every stack starts with the process (and job) tag and the thread name. Time
+spent inside Qt or other C code shows up under the Python frame that called
+into it (app.exec_ for an idle GUI).
+
+Turn it on with either
+
+    kill -USR1 <pid>                  toggle one process for profile_window_sec
+    python3 profiler.py start [SEC]   every process that is (or starts) running
+                                      in the next SEC seconds (default profile_window_sec)
+    python3 profiler.py stop          end a `start` early
+    python3 profiler.py               list the profiles written so far
+
+A process sent SIGUSR1 before it called install() is killed (the default
+action), so only signal the GUI and jobs, not other scripts.
+"""
+import atexit
+import collections
+import json
+import os
+import signal
+import sys
+import threading
+import time
+from datetime import datetime
+import config
+import snapshot_format
+import working_store
+from metrics import COMPONENT
+
+PROFILE_DIR = os.path.join(working_store.directory("weatherdata"), "profiles")
+REQUEST_PATH = os.path.join(PROFILE_DIR, "request.json")  # {"until": epoch seconds}
+
+REQUEST_POLL_SEC = 1
+
+# JobRunner names the job a script runs for
+JOB = os.environ.get("WEATHER_JOB", "")
+TAG = f"{COMPONENT}-{JOB}" if JOB else COMPONENT
+
+
+class Sampler:
+    """Samples every other thread's stack until `until` or stop()."""
+
+    def __init__(self, until, interval_sec):
+        self.until = until
+        self.interval_sec = interval_sec
+        self.stacks = collections.Counter()
+        self.samples = 0
+        self.labels = {}  # code object -> frame label
+        self.stop_event = threading.Event()
+        self.thread = threading.Thread(target=self.run, name="profiler", daemon=True)
+
+    def start(self):
+        self.thread.start()
+
+    def stop(self, wait=False):
+        self.stop_event.set()
+        if wait:
+            self.thread.join(timeout=5)
+
+    def label(self, code):
+        label = self.labels.get(code)
+        if label is None:
+            label = self.labels[code] = f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+        return label
+
+    def collapse(self, thread_name, frame):
+        """'tag;thread;outermost;...;innermost' for one thread's stack."""
+        labels = []
+        while frame is not None:
+            labels.append(self.label(frame.f_code))
+            frame = frame.f_back
+        labels.append(thread_name.replace(";", ":").replace(" ", "_"))
+        labels.append(TAG)
+        return ";".join(reversed(labels))
+
+    def run(self):
+        started = time.time()
+        own_ident = threading.get_ident()
+        while not self.stop_event.is_set() and time.time() < self.until:
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident != own_ident:
+                    self.stacks[self.collapse(names.get(ident, str(ident)), frame)] += 1
+            self.samples += 1
+            self.stop_event.wait(self.interval_sec)
+        self.write(time.time() - started)
+
+    def write(self, duration):
+        if not self.stacks:
+            return
+        path = os.path.join(PROFILE_DIR, f"{TAG}-{os.getpid()}-{datetime.now():%Y%m%d-%H%M%S}.folded")
+        payload = "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+        try:
+            snapshot_format.write_atomic(path, payload.encode("utf-8"))
+        except OSError as e:
+            print(f"Couldn't write the profile to {path}: {e}")
+            return
+        print(f"Profile: {self.samples} samples over {duration:.1f} s written to {path}")
+
+
+_lock = threading.Lock()
+_sampler = None
+_requested_until = None  # The control file request the current sampler serves, if any
+_toggle_requested = False  # Set by the SIGUSR1 handler, acted on by watch_requests
+
+
+def active():
+    return _sampler is not None and _sampler.thread.is_alive()
+
+
+def start(seconds=None, until=None):
+    """Start sampling this process for `seconds` (default profile_window_sec) or until `until`."""
+    global _sampler
+    settings = config.get_config()
+    with _lock:
+        if active():
+            return
+        if until is None:
+            until = time.time() + (seconds or settings.profile_window_sec)
+        _sampler = Sampler(until, settings.profile_interval_ms / 1000)
+        _sampler.start()
+    print(f"Profiling {TAG} (pid {os.getpid()}) for {until - time.time():.0f} s.")
+
+
+def stop(wait=False):
+    """Stop sampling and write what was collected."""
+    with _lock:
+        sampler = _sampler
+    if sampler is not None and sampler.thread.is_alive():
+        sampler.stop(wait)
+
+
+def toggle(signum=None, frame=None):
+    """SIGUSR1 handler: only sets a flag, which watch_requests acts on within REQUEST_POLL_SEC.
+
+    The handler runs on the main thread between any two bytecodes, possibly
+    while that thread holds _lock or is inside print(), so starting or
+    stopping the sampler from here could deadlock or raise.
+    """
+    global _toggle_requested
+    _toggle_requested = True
+
+
+def read_request():
+    """The `until` of the control file request, or None."""
+    try:
+        with open(REQUEST_PATH, "r") as f:
+            until = json.load(f).get("until")
+    except (FileNotFoundError, ValueError, AttributeError):
+        return None
+    return until if isinstance(until, (int, float)) else None
+
+
+def watch_requests():
+    """Follow the control file (start when a request covers now, stop when it's withdrawn)
+    and carry out SIGUSR1 toggles."""
+    global _requested_until, _toggle_requested
+    last_signature = False  # Never matches, so the first pass reads the file
+    while True:
+        if _toggle_requested:
+            _toggle_requested = False
+            if active():
+                stop()
+            else:
+                start()
+        signature = config.file_signature(REQUEST_PATH)
+        if signature != last_signature:
+            last_signature = signature
+            until = read_request()
+            if until is not None and until > time.time():
+                _requested_until = until
+                start(until=until)
+            elif _requested_until is not None:
+                _requested_until = None
+                stop()  # Withdrawn early
+        time.sleep(REQUEST_POLL_SEC)
+
+
+_installed = False
+
+def install():
+    """Let this process be profiled on demand (SIGUSR1 or the control file). Call from the main thread."""
+    global _installed
+    if _installed:
+        return
+    _installed = True
+    signal.signal(signal.SIGUSR1, toggle)
+    threading.Thread(target=watch_requests, name="profiler-requests", daemon=True).start()
+    atexit.register(stop, True)  # A job that exits mid-window still writes its profile
+
+
+def main():
+    import argparse
+    parser = argparse.ArgumentParser(description="On-demand sampling profiler for the GUI and fetch jobs.")
+    parser.add_argument("command", nargs="?", default="list", choices=("start", "stop", "list"))
+    parser.add_argument("seconds", nargs="?", type=float, help="how long `start` profiles for")
+    args = parser.parse_args()
+
+    if args.command == "start":
+        seconds = args.seconds or config.get_config().profile_window_sec
+        payload = json.dumps({"until": time.time() + seconds}).encode("utf-8")
+        snapshot_format.write_atomic(REQUEST_PATH, payload)
+        print(f"Profiling every process for the next {seconds:.0f} s; profiles go to {PROFILE_DIR}")
+    elif args.command == "stop":
+        try:
+            os.remove(REQUEST_PATH)
+        except FileNotFoundError:
+            pass
+    else:
+        try:
+            names = sorted(name for name in os.listdir(PROFILE_DIR) if name.endswith(".folded"))
+        except FileNotFoundError:
+            names = []
+        for name in names:
+            print(os.path.join(PROFILE_DIR, name))
+        if not names:
+            print(f"No profiles in {PROFILE_DIR} yet.")
+
+if __name__ == "__main__":
+    main()
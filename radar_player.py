@@ -0,0 +1,222 @@
+import os
+import time
+from PyQt5.QtWidgets import QWidget
+from PyQt5.QtGui import QImage, QImageReader, QPainter, QPixmap
+from PyQt5.QtCore import QObject, QThread, QTimer, QSize, QCoreApplication, pyqtSignal, pyqtSlot
+from weather_data import CoalescingWatcher
+from freshness import FreshnessTracker, read_gif_provenance
+
+# Used when the GIF doesn't specify a frame delay
+DEFAULT_FRAME_DELAY_MS = 500
+
+
+def gif_provenance(path, stat=None):
+    """The provenance get_radar wrote into a GIF; just its mtime for GIFs without one."""
+    record = read_gif_provenance(path)
+    if record is None:
+        try:
+            record = {"written_at": (stat or os.stat(path)).st_mtime}
+        except FileNotFoundError:
+            return None
+    return record
+
+
+class FrameDecoder(QObject):
+    """Decodes every frame of an animation up front. Lives on a worker thread."""
+
+    decoded = pyqtSignal(object, object, object)  # list of QImage, list of delays (ms), provenance
+    first_decoded = pyqtSignal(object, object)  # First QImage and provenance, ahead of `decoded`
+    finished = pyqtSignal()  # Emitted after every decode request, changed or not
+
+    def __init__(self):
+        super().__init__()
+        self.signature = None  # (path, mtime_ns, size) of the last decoded file
+        self.reported_missing = False
+
+    @pyqtSlot(str)
+    def decode(self, path):
+        try:
+            self.decode_if_changed(path)
+        finally:
+            self.finished.emit()
+
+    def decode_if_changed(self, path):
+        """Decode `path` if it changed since the last decode."""
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            if not self.reported_missing:  # Report once, not on every check
+                print(f"Error: File '{path}' does not exist.")
+                self.reported_missing = True
+            return
+        self.reported_missing = False
+        signature = (path, stat.st_mtime_ns, stat.st_size)
+        if signature == self.signature:
+            return
+
+        provenance = gif_provenance(path, stat)
+        reader = QImageReader(path)
+        images = []
+        delays = []
+        while reader.canRead():
+            image = reader.read()
+            if image.isNull():
+                break
+            delay = reader.nextImageDelay()
+            # Convert once here so turning it into a QPixmap on the GUI thread is cheap
+            images.append(image.convertToFormat(QImage.Format_ARGB32_Premultiplied))
+            delays.append(delay if delay > 0 else DEFAULT_FRAME_DELAY_MS)
+            if len(images) == 1:
+                self.first_decoded.emit(images[0], provenance)
+
+        if not images:
+            print(f"Error: Unable to load GIF '{path}': {reader.errorString()}")
+            return
+        self.signature = signature
+        self.decoded.emit(images, delays, provenance)
+
+
+class RadarAnimationPlayer(QWidget):
+    """Plays an animated GIF from pre-decoded, cached frames.
+
+    When the file changes, the new animation is decoded on a worker thread and
+    swapped in whole once it's ready, releasing the old frames. At most two
+    sequences exist at once: the one playing and the one being decoded.
+    While nothing is playing yet (at startup), the first frame is shown as
+    soon as the worker has decoded it.
+    """
+
+    frame_size_changed = pyqtSignal(QSize)
+    decode_requested = pyqtSignal(str)
+    frame_paced = pyqtSignal(float, float)  # Scheduled and actual time (ms) of the frame just left
+
+    def __init__(self, path, parent=None):
+        super().__init__(parent)
+        self.path = path
+        self.frames = []  # QPixmap per frame of the playing sequence
+        self.delays = []  # Display time per frame in ms
+        self.frame_index = 0
+        self.frame_started = None  # time.monotonic() when the current frame's timer started
+        self.decoding = False  # A decode is in flight
+        self.decode_again = False  # The file changed while decoding
+        self.freshness = FreshnessTracker("radar")  # For the shown GIF
+
+        self.frame_timer = QTimer(self)
+        self.frame_timer.setSingleShot(True)
+        self.frame_timer.timeout.connect(self.next_frame)
+
+        # Decoder on its own thread; cross-thread signals are queued
+        self.worker_thread = QThread(self)
+        self.decoder = FrameDecoder()
+        self.decoder.moveToThread(self.worker_thread)
+        self.decode_requested.connect(self.decoder.decode)
+        self.decoder.decoded.connect(self.on_decoded)
+        self.decoder.first_decoded.connect(self.on_first_decoded)
+        self.decoder.finished.connect(self.decode_finished)
+        self.worker_thread.finished.connect(self.decoder.deleteLater)
+        self.worker_thread.start()
+
+        app = QCoreApplication.instance()
+        if app is not None:
+            app.aboutToQuit.connect(self.stop)
+
+        # Re-decode only when the GIF actually changes
+        self.watcher = CoalescingWatcher(os.path.dirname(self.path), parent=self)
+        self.watcher.watch_file(self.path)
+        self.watcher.settled.connect(self.request_decode)
+        self.request_decode()
+
+    def on_first_decoded(self, image, provenance):
+        """Show the GIF's first frame while the rest of it decodes, if nothing is showing yet.
+
+        get_radar only ever replaces the GIF with a finished one, so at
+        startup this is the last good radar image.
+        """
+        if self.frames:
+            return
+        self.frames = [QPixmap.fromImage(image)]
+        self.delays = [DEFAULT_FRAME_DELAY_MS]
+        self.frame_index = 0
+        self.freshness.loaded(provenance)
+        self.resize(self.frames[0].size())
+        self.frame_size_changed.emit(self.frames[0].size())
+        self.update()
+
+    def set_path(self, path):
+        """Play a different GIF (e.g. after the map layer setting changed)."""
+        if path == self.path:
+            return
+        self.path = path
+        self.watcher.watch_file(path)
+        self.request_decode()
+
+    def request_decode(self):
+        """Ask the worker to decode the file, or queue one more decode if it's busy."""
+        if self.decoding:
+            self.decode_again = True
+            return
+        self.decoding = True
+        self.decode_requested.emit(self.path)
+
+    def decode_finished(self):
+        self.decoding = False
+        if self.decode_again:
+            self.decode_again = False
+            self.request_decode()
+
+    def on_decoded(self, images, delays, provenance):
+        """Swap the newly decoded sequence in and free the old one."""
+        frames = [QPixmap.fromImage(image) for image in images]
+        images.clear()
+        if provenance != self.freshness.provenance:
+            self.freshness.loaded(provenance)  # Not the GIF on_first_decoded already counted
+
+        old_size = self.frames[0].size() if self.frames else None
+        self.frames = frames
+        self.delays = delays
+        self.frame_index = 0
+        print(f"GIF loaded: {self.path} ({len(frames)} frames)")
+
+        if frames[0].size() != old_size:
+            self.resize(frames[0].size())
+            self.frame_size_changed.emit(frames[0].size())
+        self.update()
+        self.start_playback()
+
+    def start_playback(self):
+        if self.frames and self.isVisible():
+            self.frame_timer.start(self.delays[self.frame_index])
+            self.frame_started = time.monotonic()
+
+    def next_frame(self):
+        now = time.monotonic()
+        if self.frame_started is not None:
+            self.frame_paced.emit(self.delays[self.frame_index], (now - self.frame_started) * 1000)
+        self.frame_index = (self.frame_index + 1) % len(self.frames)
+        self.update()
+        self.frame_timer.start(self.delays[self.frame_index])
+        self.frame_started = now
+
+    def showEvent(self, event):
+        self.start_playback()
+        super().showEvent(event)
+
+    def hideEvent(self, event):
+        # No point animating a slide that isn't on screen
+        self.frame_timer.stop()
+        self.frame_started = None
+        super().hideEvent(event)
+
+    def paintEvent(self, event):
+        if not self.frames:
+            return
+        painter = QPainter(self)
+        painter.drawPixmap(0, 0, self.frames[self.frame_index])
+        self.freshness.painted()
+
+    def stop(self):
+        """Stop playback and the decoder thread."""
+        self.frame_timer.stop()
+        if self.worker_thread.isRunning():
+            self.worker_thread.quit()
+            self.worker_thread.wait()
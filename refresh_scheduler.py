@@ -0,0 +1,198 @@
+"""
+Adaptive refresh intervals for the radar and weather jobs.
+
+Instead of fixed radar_refresh_min / weather_refresh_min intervals, each
+job's next run is planned from recent change signals:
+
+    precipitation       the current home conditions mention rain, snow, ...
+    pressure tendency   3-hour change in the home history, published by the
+                        weather job in home_weather.json
+    radar tiles         whether the last radar runs fetched different tiles
+                        (get_radar records a hash of every tile mosaic)
+
+Active weather uses the job's fastest interval, calm weather its slowest,
+anything else the configured interval, counted from the job's last run.
+The result is then pushed to just after the next upstream update, since
+fetching earlier only returns the data we already have.
+
+Planning reads no files but the small radar activity record. The effective
+schedule is written to weatherdata/schedule.json on a background thread,
+only when it changed; run `python3 refresh_scheduler.py` to print it.
+"""
+import json
+import math
+import os
+import threading
+import time
+from datetime import datetime
+import config
+import snapshot_format
+import working_store
+from history_store import STEADY_TENDENCY_INHG
+
+RADAR_ACTIVITY_PATH = os.path.join(working_store.directory("weatherdata"), "radar_activity.json")
+SCHEDULE_PATH = os.path.join(working_store.directory("weatherdata"), "schedule.json")
+
+JOBS = ("radar", "weather")
+
+# OWM current weather and map tiles are both refreshed about every 10 minutes
+UPSTREAM_PERIOD_SEC = {"radar": 600, "weather": 600}
+UPSTREAM_LAG_SEC = 60  # Give the upstream a minute to publish before fetching
+
+PRECIPITATION_WORDS = ("rain", "drizzle", "shower", "snow", "sleet", "hail", "thunderstorm")
+
+# 3-hour pressure change (inHg) that counts as rapidly rising or falling (about 2 hPa)
+ACTIVE_TENDENCY_INHG = 0.06
+
+RADAR_ACTIVITY_RUNS = 12  # Tile hashes kept for the change signal
+
+
+def record_radar_tiles(tile_hash, now=None):
+    """Append a radar run's tile mosaic hash (called by get_radar)."""
+    runs = load_radar_activity()
+    runs.append({"at": time.time() if now is None else now, "hash": tile_hash})
+    payload = json.dumps(runs[-RADAR_ACTIVITY_RUNS:], indent=4).encode("utf-8")
+    snapshot_format.write_atomic(RADAR_ACTIVITY_PATH, payload)
+
+
+def load_radar_activity():
+    try:
+        with open(RADAR_ACTIVITY_PATH, "r") as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return []
+
+
+def radar_unchanged_runs(runs):
+    """How many of the latest radar runs fetched the same tiles as the run before, in a row."""
+    count = 0
+    for previous, current in zip(reversed(runs[:-1]), reversed(runs)):
+        if current["hash"] != previous["hash"]:
+            break
+        count += 1
+    return count
+
+
+def read_signals(conditions=None, pressure_tendency=None):
+    """Gather the change signals from the current home conditions text and 3-hour
+    pressure tendency (inHg), if known."""
+    runs = load_radar_activity()
+    return {
+        "precipitation": bool(conditions) and any(word in conditions.lower() for word in PRECIPITATION_WORDS),
+        "pressure_tendency_inhg": pressure_tendency,
+        "radar_runs": len(runs),
+        "radar_unchanged_runs": radar_unchanged_runs(runs),
+    }
+
+
+def activity_level(signals):
+    """('active' | 'normal' | 'calm', reason) from the change signals."""
+    tendency = signals["pressure_tendency_inhg"]
+    if signals["precipitation"]:
+        return "active", "precipitation in current conditions"
+    if tendency is not None and abs(tendency) >= ACTIVE_TENDENCY_INHG:
+        return "active", f"pressure changing fast ({tendency:+.2f} inHg/3h)"
+    if signals["radar_runs"] >= 2 and signals["radar_unchanged_runs"] == 0:
+        return "normal", "radar tiles changed on the last run"
+    if tendency is not None and abs(tendency) < STEADY_TENDENCY_INHG and signals["radar_unchanged_runs"] > 0:
+        return "calm", "steady pressure, no precipitation, radar unchanged"
+    return "normal", "no strong signal"
+
+
+def interval_bounds(job, settings):
+    """(fastest, configured, slowest) interval in minutes, with the configured one clamped into range."""
+    if job == "radar":
+        fastest, base, slowest = (settings.radar_refresh_fastest_min, settings.radar_refresh_min,
+                                  settings.radar_refresh_slowest_min)
+    else:
+        fastest, base, slowest = (settings.weather_refresh_fastest_min, settings.weather_refresh_min,
+                                  settings.weather_refresh_slowest_min)
+    slowest = max(slowest, fastest)
+    return fastest, min(max(base, fastest), slowest), slowest
+
+
+def align_to_upstream(job, target):
+    """The first upstream update time (plus lag) at or after `target` (epoch seconds)."""
+    period = UPSTREAM_PERIOD_SEC[job]
+    return math.ceil((target - UPSTREAM_LAG_SEC) / period) * period + UPSTREAM_LAG_SEC
+
+
+class RefreshScheduler:
+    """Plans each job's next run and keeps the effective schedule for inspection."""
+
+    def __init__(self, schedule_path=SCHEDULE_PATH):
+        self.schedule_path = schedule_path
+        self.schedule = {}
+        self.saved_payload = None  # Latest schedule handed to the writer thread
+        self.write_lock = threading.Lock()
+
+    def plan(self, job, conditions=None, pressure_tendency=None, last_run=None, now=None):
+        """Return the delay in seconds until `job` should run next.
+
+        The interval counts from `last_run` (default now), so re-planning when
+        new conditions arrive doesn't push the next run back.
+        """
+        settings = config.get_config()
+        now = time.time() if now is None else now
+        last_run = now if last_run is None else last_run
+        fastest, base, slowest = interval_bounds(job, settings)
+
+        if settings.adaptive_refresh:
+            signals = read_signals(conditions, pressure_tendency)
+            level, reason = activity_level(signals)
+            interval_min = {"active": fastest, "normal": base, "calm": slowest}[level]
+            next_run = align_to_upstream(job, max(now, last_run + interval_min * 60))
+        else:
+            signals = {}
+            level, reason = "fixed", "adaptive_refresh is off"
+            interval_min = base
+            next_run = max(now, last_run + interval_min * 60)
+
+        self.schedule[job] = {
+            "level": level,
+            "reason": reason,
+            "interval_min": interval_min,
+            "bounds_min": [fastest, slowest],
+            "planned_at": datetime.fromtimestamp(now).isoformat(timespec="seconds"),
+            "next_run": datetime.fromtimestamp(next_run).isoformat(timespec="seconds"),
+            "signals": signals,
+        }
+        self.save()
+        return next_run - now
+
+    def status(self):
+        """The effective schedule: per job level, reason, interval, next run and signals."""
+        return dict(self.schedule)
+
+    def save(self):
+        """Write the schedule out if it changed, off the calling (GUI) thread."""
+        payload = json.dumps(self.schedule, indent=4).encode("utf-8")
+        if payload == self.saved_payload:
+            return
+        self.saved_payload = payload
+        threading.Thread(target=self.write_latest, name="schedule-save", daemon=True).start()
+
+    def write_latest(self):
+        with self.write_lock:  # One write at a time, always of the newest schedule
+            payload = self.saved_payload
+            try:
+                snapshot_format.write_atomic(self.schedule_path, payload)
+            except OSError as e:
+                print(f"Couldn't write the schedule to {self.schedule_path}: {e}")
+
+
+def main():
+    try:
+        with open(SCHEDULE_PATH, "r") as f:
+            schedule = json.load(f)
+    except FileNotFoundError:
+        print("No schedule yet; the GUI writes one when it plans its first refresh.")
+        return
+    for job, entry in schedule.items():
+        print(f"{job:<8} next {entry['next_run']}  every {entry['interval_min']} min "
+              f"(bounds {entry['bounds_min'][0]}-{entry['bounds_min'][1]})  {entry['level']}: {entry['reason']}")
+        for name, value in entry["signals"].items():
+            print(f"           {name}: {value}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,203 @@
+"""
+Render every slide offscreen and report paint times.
+
+Runs under the Qt offscreen platform (no X server needed), using whatever is
+in weatherdata/ and weathertiles/ as fixture data. Optionally dumps one PNG
+per slide with a fixed clock, and compares against a previous dump for
+pixel-diff regression checks.
+
+Usage:
+    python3 render_bench.py --frames 200
+    python3 render_bench.py --dump-dir bench/reference
+    python3 render_bench.py --dump-dir bench/current --compare-dir bench/reference
+"""
+import os
+import sys
+
+# Must be set before the QApplication is created
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+import argparse
+import json
+import time
+import tracemalloc
+from PyQt5.QtWidgets import QApplication
+from PyQt5.QtGui import QImage
+from PyQt5.QtCore import QEventLoop, QTimer
+from radar_player import RadarAnimationPlayer
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Clock text used for dumped frames so they're comparable between runs
+FIXED_TIME = "12:00:00 PM"
+FIXED_DATE = "Mon Jan 01"
+
+
+def find_slides():
+    """Find all slide modules, in display order (same rule as WeatherApp)."""
+    return sorted(
+        file_name[:-3]
+        for file_name in os.listdir(SCRIPT_DIR)
+        if file_name.startswith("slide") and file_name.endswith(".py")
+    )
+
+
+def process_events(ms):
+    """Run the Qt event loop for `ms` milliseconds so background loads can land."""
+    loop = QEventLoop()
+    QTimer.singleShot(ms, loop.quit)
+    loop.exec_()
+
+
+def rss_kb():
+    """Current resident set size in kB (Linux), or 0 if unavailable."""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return 0
+
+
+def percentile(samples, pct):
+    """Nearest-rank percentile of a list of numbers."""
+    ordered = sorted(samples)
+    index = max(0, min(len(ordered) - 1, int(round(pct / 100 * len(ordered))) - 1))
+    return ordered[index]
+
+
+def freeze_clock(slide):
+    """Pin the clock text and animation frame so a render is reproducible."""
+    slide.current_time = FIXED_TIME
+    slide.current_date = FIXED_DATE
+    for player in slide.findChildren(RadarAnimationPlayer):
+        player.frame_index = 0
+
+
+def bench_slide(slide, frames, warmup):
+    """Render `slide` repeatedly and return timing/allocation stats."""
+    image = QImage(slide.width(), slide.height(), QImage.Format_RGB32)
+
+    for _ in range(warmup):
+        slide.update_time_and_date()
+        slide.render(image)
+
+    times_ms = []
+    rss_before = rss_kb()
+    tracemalloc.start()
+    start_current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.reset_peak()
+    for _ in range(frames):
+        slide.update_time_and_date()  # What the 1 s clock timer does before each repaint
+        t0 = time.perf_counter()
+        slide.render(image)
+        times_ms.append((time.perf_counter() - t0) * 1000)
+    end_current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    rss_after = rss_kb()
+
+    return {
+        "frames": frames,
+        "p50_ms": percentile(times_ms, 50),
+        "p90_ms": percentile(times_ms, 90),
+        "p99_ms": percentile(times_ms, 99),
+        "max_ms": max(times_ms),
+        "mean_ms": sum(times_ms) / len(times_ms),
+        "py_alloc_peak_kb": (peak - start_current) / 1024,
+        "py_alloc_retained_kb": (end_current - start_current) / 1024,
+        "rss_growth_kb": rss_after - rss_before,
+    }
+
+
+def image_diff(a, b):
+    """Return the fraction of pixels that differ between two images."""
+    if a.size() != b.size():
+        return 1.0
+    a = a.convertToFormat(QImage.Format_RGB32)
+    b = b.convertToFormat(QImage.Format_RGB32)
+    pixels_a = a.constBits().asarray(a.sizeInBytes())
+    pixels_b = b.constBits().asarray(b.sizeInBytes())
+    if bytes(pixels_a) == bytes(pixels_b):
+        return 0.0
+    view_a = memoryview(bytes(pixels_a)).cast("I")
+    view_b = memoryview(bytes(pixels_b)).cast("I")
+    differing = sum(1 for pa, pb in zip(view_a, view_b) if pa != pb)
+    return differing / len(view_a)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offscreen paint benchmark for the weather slides.")
+    parser.add_argument("--frames", type=int, default=100, help="Frames to time per slide (default: 100)")
+    parser.add_argument("--warmup", type=int, default=5, help="Untimed frames per slide first (default: 5)")
+    parser.add_argument("--slides", nargs="*", help="Only bench these slide modules (e.g. slide1 slide3)")
+    parser.add_argument("--dump-dir", help="Write one PNG per slide here, rendered with a fixed clock")
+    parser.add_argument("--compare-dir", help="Compare dumped PNGs against the ones in this directory")
+    parser.add_argument("--max-diff", type=float, default=0.0,
+                        help="Fraction of pixels allowed to differ in --compare-dir mode (default: 0)")
+    parser.add_argument("--json", action="store_true", help="Print results as JSON")
+    args = parser.parse_args()
+
+    if args.compare_dir and not args.dump_dir:
+        parser.error("--compare-dir needs --dump-dir")
+
+    # Slides resolve their files relative to the script directory, the fetch modules relative to cwd
+    os.chdir(SCRIPT_DIR)
+    sys.path.insert(0, SCRIPT_DIR)
+    app = QApplication(sys.argv)
+
+    slide_names = args.slides or find_slides()
+    slides = []
+    for slide_name in slide_names:
+        module = __import__(slide_name)
+        slides.append((slide_name, module.SlideGUI()))
+
+    # Let the data source and radar decoder deliver their first snapshots
+    process_events(1000)
+
+    results = {}
+    failed = False
+    for slide_name, slide in slides:
+        results[slide_name] = bench_slide(slide, args.frames, args.warmup)
+
+        if args.dump_dir:
+            os.makedirs(args.dump_dir, exist_ok=True)
+            freeze_clock(slide)
+            image = QImage(slide.width(), slide.height(), QImage.Format_RGB32)
+            slide.render(image)
+            dump_path = os.path.join(args.dump_dir, f"{slide_name}.png")
+            image.save(dump_path)
+
+            if args.compare_dir:
+                reference_path = os.path.join(args.compare_dir, f"{slide_name}.png")
+                reference = QImage(reference_path)
+                if reference.isNull():
+                    print(f"No reference image at {reference_path}")
+                    diff = 1.0
+                else:
+                    diff = image_diff(image, reference)
+                results[slide_name]["pixel_diff"] = diff
+                if diff > args.max_diff:
+                    failed = True
+
+    if args.json:
+        print(json.dumps(results, indent=4))
+    else:
+        print(f"{'slide':<10}{'p50':>8}{'p90':>8}{'p99':>8}{'max':>8}  {'py peak':>9}{'py kept':>9}{'rss +':>8}  (ms / kB)")
+        for slide_name, stats in results.items():
+            line = (
+                f"{slide_name:<10}{stats['p50_ms']:>8.2f}{stats['p90_ms']:>8.2f}{stats['p99_ms']:>8.2f}"
+                f"{stats['max_ms']:>8.2f}  {stats['py_alloc_peak_kb']:>9.1f}{stats['py_alloc_retained_kb']:>9.1f}"
+                f"{stats['rss_growth_kb']:>8}"
+            )
+            if "pixel_diff" in stats:
+                line += f"  diff {stats['pixel_diff']:.4%}"
+            print(line)
+
+    app.aboutToQuit.emit()  # Stops the loader/decoder threads
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
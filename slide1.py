@@ -1,9 +1,26 @@
 import os
-import json
 from PyQt5.QtWidgets import QWidget
-from PyQt5.QtGui import QPixmap, QFont, QPainter, QFontDatabase
+from PyQt5.QtGui import QPixmap, QFont, QFontMetrics, QPainter, QFontDatabase
 from PyQt5.QtCore import Qt, QTimer, QTime, QDateTime
-from PyQt5.QtCore import QFileSystemWatcher
+from weather_data import get_data_source
+from freshness import FreshnessTracker, draw_stale_marker
+
+# Regional table layout
+BOX_WIDTH = 540  # Total box width
+COLUMN_SPACING = 50  # Spacing between columns
+HEADER_FONT_SIZE = 16
+HEADER_Y = 135  # Y position for column headers
+WEATHER_FONT_SIZE = 24
+WEATHER_Y = 165  # Starting Y position for data rows
+WEATHER_LINE_SPACING = 15  # Vertical spacing between lines
+# Columns have always been measured at the clock's font size, which keeps
+# the table inside the box at the 24pt row size.
+MEASURE_FONT_SIZE = 20
+FOOTER_FONT_SIZE = 16
+FOOTER_MARGIN = 20  # Observation time sits this far above the bottom edge
+
+# Lists longer than a page are shown a page at a time
+PAGE_INTERVAL_MS = 5000
 
 class SlideGUI(QWidget):
     def __init__(self):
@@ -23,15 +40,22 @@ class SlideGUI(QWidget):
             print(f"Error: Failed to load font from {font_path}")
         self.custom_font_family = QFontDatabase.applicationFontFamilies(font_id)[0] if font_id != -1 else "Arial"
 
-        self.weather_file = os.path.join(script_dir, "weatherdata", "regional_weather.json")
+        # Shown until the first good data arrives
+        self.regional_weather = {"regional_weather": [], "observation_time": "Unknown time"}
+        self.page_index = 0
+        self.build_table_layout()
 
-        # Timer to reload weather data
-        self.weather_reload_timer = QTimer(self)
-        self.weather_reload_timer.timeout.connect(self.reload_weather_data)
-        self.weather_reload_timer.start(2000)  # Reload every 2 seconds
+        # Flip pages while the slide is on screen; the timer is the only thing
+        # that flips them, and it resumes where it left off, so on-screen time
+        # adds up across passes through the slideshow
+        self.page_timer = QTimer(self)
+        self.page_timer.timeout.connect(self.on_page_timer)
+        self.page_time_left_ms = PAGE_INTERVAL_MS
 
-        # Load regional weather data initially
-        self.regional_weather = self.load_weather_data(self.weather_file)
+        # Reload weather data whenever the file changes
+        self.freshness = FreshnessTracker("regional")
+        self.data_source = get_data_source()
+        self.data_source.subscribe("regional_weather.json", self.reload_weather_data)
 
         # Timer to update time and date
         self.current_time = ""
@@ -42,20 +66,17 @@ class SlideGUI(QWidget):
         self.timer.timeout.connect(self.update_time_and_date)
         self.timer.start(1000)  # Update every second
 
-    def load_weather_data(self, filepath):
-        """Load weather data from the specified JSON file."""
-        try:
-            with open(filepath, "r") as file:
-                return json.load(file)
-        except (FileNotFoundError, json.JSONDecodeError) as e:
-            print(f"Error loading weather data: {e}")
-            return {"regional_weather": [], "observation_time": "Unknown time"}
-
-    def reload_weather_data(self):
-        """Reload the weather data periodically."""
-        self.regional_weather = self.load_weather_data(self.weather_file)
+    def reload_weather_data(self, snapshot):
+        """Take a new weather data snapshot from the shared data source."""
+        self.regional_weather = snapshot.data
+        self.freshness.loaded(snapshot.data.get("provenance"), snapshot.loaded_at)
+        self.build_table_layout()
         self.update()  # Trigger a repaint to refresh the UI
 
+    def has_data(self):
+        """Whether real data has arrived (for the startup paint timing)."""
+        return self.data_source.snapshot("regional_weather.json") is not None
+
     def update_time_and_date(self):
         """Update the current time and date."""
         self.current_time = QTime.currentTime().toString("hh:mm:ss AP")  # Time in HH:MM:SS AM/PM format
@@ -72,22 +93,105 @@ class SlideGUI(QWidget):
         self.current_date = QDateTime.currentDateTime().toString("ddd MMM dd")  # Date in DAY MON DATE format
         self.update()  # Trigger a repaint
 
-    def calculate_column_widths(self, painter, font_size):
+    def calculate_column_widths(self, font_metrics, entries):
         """Calculate dynamic column widths based on the largest strings in each column."""
         max_location_width = max(
-            painter.fontMetrics().horizontalAdvance(entry["location"])
-            for entry in self.regional_weather["regional_weather"]  # Access the list
+            (font_metrics.horizontalAdvance(location) for location, _, _ in entries),
+            default=0,
         )
         max_observation_width = max(
-            painter.fontMetrics().horizontalAdvance(entry["conditions"])
-            for entry in self.regional_weather["regional_weather"]  # Access the list
+            (font_metrics.horizontalAdvance(observation) for _, observation, _ in entries),
+            default=0,
         )
         max_temperature_width = max(
-            painter.fontMetrics().horizontalAdvance(str(int(entry["temperature"])))
-            for entry in self.regional_weather["regional_weather"]  # Access the list
+            (font_metrics.horizontalAdvance(temperature) for _, _, temperature in entries),
+            default=0,
         )
         return max_location_width, max_observation_width, max_temperature_width
 
+    def build_table_layout(self):
+        """Measure and position the table once per data snapshot.
+
+        Produces the header positions, the text runs for each page of rows and
+        the centered footer, so paintEvent only has to draw them.
+        """
+        entries = [
+            (
+                entry["location"],
+                entry["conditions"],
+                # Failed fetches have no temperature
+                str(int(entry["temperature"])) if entry["temperature"] is not None else "--",
+            )
+            for entry in self.regional_weather["regional_weather"]
+        ]
+
+        measure_font = QFont(self.custom_font_family, MEASURE_FONT_SIZE)
+        measure_font.setBold(True)
+        location_width, observation_width, temperature_width = self.calculate_column_widths(
+            QFontMetrics(measure_font), entries
+        )
+
+        # Calculate column starting positions
+        box_x = (self.width() - BOX_WIDTH) // 2  # Centered horizontally
+        location_x = box_x + 20
+        observation_x = location_x + location_width + COLUMN_SPACING
+        temperature_x = observation_x + observation_width + COLUMN_SPACING
+
+        # Column headers "WEATHER" and "°F"
+        self.table_headers = [
+            ("WEATHER", observation_x + observation_width // 2, HEADER_Y),
+            ("°F", temperature_x, HEADER_Y),
+        ]
+
+        # Footer with the observation time, centered
+        obs_time = self.regional_weather.get("observation_time", "Unknown time")
+        self.obs_time_display = f"Updated: {obs_time}"
+        text_width = QFontMetrics(QFont(self.custom_font_family, FOOTER_FONT_SIZE)).horizontalAdvance(self.obs_time_display)
+        self.obs_time_x = (self.width() - text_width) // 2
+        self.obs_time_y = self.height() - FOOTER_MARGIN
+
+        # Split rows into pages that fit above the footer
+        row_height = WEATHER_FONT_SIZE + WEATHER_LINE_SPACING
+        last_row_y = self.obs_time_y - FOOTER_FONT_SIZE - WEATHER_LINE_SPACING
+        rows_per_page = max(1, (last_row_y - WEATHER_Y) // row_height + 1)
+
+        self.table_pages = []
+        for start in range(0, len(entries), rows_per_page):
+            runs = []
+            for row, (location, observation, temperature) in enumerate(entries[start:start + rows_per_page]):
+                y_position = WEATHER_Y + row * row_height
+                runs.append((location, location_x, y_position))
+                runs.append((observation, observation_x, y_position))
+                runs.append((temperature, temperature_x, y_position))
+            self.table_pages.append(runs)
+        if not self.table_pages:
+            self.table_pages.append([])
+
+        self.page_index %= len(self.table_pages)
+        self.page_label = f"{self.page_index + 1}/{len(self.table_pages)}" if len(self.table_pages) > 1 else ""
+        self.page_label_x = box_x + BOX_WIDTH - 40
+
+    def next_page(self):
+        """Advance to the next page of rows."""
+        if len(self.table_pages) > 1:
+            self.page_index = (self.page_index + 1) % len(self.table_pages)
+            self.page_label = f"{self.page_index + 1}/{len(self.table_pages)}"
+            self.update()
+
+    def on_page_timer(self):
+        self.next_page()
+        self.page_timer.start(PAGE_INTERVAL_MS)
+
+    def showEvent(self, event):
+        self.page_timer.start(self.page_time_left_ms)
+        super().showEvent(event)
+
+    def hideEvent(self, event):
+        if self.page_timer.isActive():
+            self.page_time_left_ms = max(0, self.page_timer.remainingTime())
+        self.page_timer.stop()
+        super().hideEvent(event)
+
 
     def paintEvent(self, event):
         painter = QPainter(self)
@@ -123,57 +227,23 @@ class SlideGUI(QWidget):
         self.draw_text_with_outline(painter, self.current_time, 450, 70, 20, 1)
         self.draw_text_with_outline(painter, self.current_date, 450, 100, 20, 1)
 
-        # Calculate column widths dynamically
-        weather_font_size = 24
+        # Draw the cached table layout for the current page
         outline_width = 1
-        column_spacing = 50  # Spacing between columns
-        column_widths = self.calculate_column_widths(painter, weather_font_size)
-        location_width, observation_width, temperature_width = column_widths
-
-        # Calculate column starting positions
-        box_width = 540  # Total box width
-        box_x = (self.width() - box_width) // 2  # Centered horizontally
-        location_x = box_x + 20
-        observation_x = location_x + location_width + column_spacing
-        temperature_x = observation_x + observation_width + column_spacing
-
-        # Draw column headers "WEATHER" and "°F"
-        header_font_size = 16
-        header_y = 135  # Y position for column headers
-
-        self.draw_text_with_outline(painter, "WEATHER", observation_x+observation_width//2, header_y, header_font_size, outline_width)
-        self.draw_text_with_outline(painter, "°F", temperature_x, header_y, header_font_size, outline_width)
+        for text, x, y in self.table_headers:
+            self.draw_text_with_outline(painter, text, x, y, HEADER_FONT_SIZE, outline_width)
+        if self.page_label:
+            self.draw_text_with_outline(painter, self.page_label, self.page_label_x, HEADER_Y, HEADER_FONT_SIZE, outline_width)
 
-        # Draw regional weather data
-        weather_y = 165  # Starting Y position for data rows
-        weather_line_spacing = 15  # Vertical spacing between lines
-
-        for index, entry in enumerate(self.regional_weather["regional_weather"]):
-            location = entry["location"]
-            observation = entry["conditions"]
-            temperature = str(int(entry["temperature"]))  # Convert temperature to string
-
-            y_position = weather_y + index * (weather_font_size + weather_line_spacing)
-
-            # Draw each column's text
-            self.draw_text_with_outline(painter, location, location_x, y_position, weather_font_size, outline_width)
-            self.draw_text_with_outline(painter, observation, observation_x, y_position, weather_font_size, outline_width)
-            self.draw_text_with_outline(painter, temperature, temperature_x, y_position, weather_font_size, outline_width)
+        for text, x, y in self.table_pages[self.page_index]:
+            self.draw_text_with_outline(painter, text, x, y, WEATHER_FONT_SIZE, outline_width)
 
         # Draw observation time at the bottom of the screen
-        obs_time = self.regional_weather.get("observation_time", "Unknown time")
-        obs_time_display = f"Updated: {obs_time}"
-        font_size = 16  # Font size for the observation time
-        painter.setFont(QFont(self.custom_font_family, font_size))
-
-        # Calculate text width and position for centering
-        text_width = painter.fontMetrics().horizontalAdvance(obs_time_display)
-        x = (self.width() - text_width) // 2
-        y = self.height() - 20  # Position the text 20 pixels from the bottom
+        self.draw_text_with_outline(painter, self.obs_time_display, self.obs_time_x, self.obs_time_y, FOOTER_FONT_SIZE, outline_width)
 
-        self.draw_text_with_outline(painter, obs_time_display, x, y, font_size, outline_width)
+        draw_stale_marker(self, painter, self.freshness.stale_label())
+        self.freshness.painted()
 
-    def draw_text_with_outline(self, painter, text, x, y, font_size, outline_width=1):
+    def draw_text_with_outline(self, painter, text, x, y, font_size, outline_width=1, color=Qt.white):
         """
         Draw text with an outline.
 
@@ -184,6 +254,7 @@ class SlideGUI(QWidget):
             y: Y-coordinate of the text.
             font_size: Font size of the text.
             outline_width: Thickness of the outline in pixels (default: 1).
+            color: Color of the text inside the outline (default: white).
         """
         font = QFont(self.custom_font_family, font_size)
         font.setBold(True)
@@ -197,6 +268,6 @@ class SlideGUI(QWidget):
                     painter.drawText(x + dx, y + dy, text)
 
         # Draw main text
-        painter.setPen(Qt.white)
+        painter.setPen(color)
         painter.drawText(x, y, text)
 
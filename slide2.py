@@ -1,11 +1,12 @@
 import os
-import json
 from PyQt5.QtWidgets import QWidget
 from PyQt5.QtGui import QPixmap, QFont, QPainter, QFontDatabase
 from PyQt5.QtCore import Qt, QTimer, QTime, QDateTime
-from PyQt5.QtGui import QMovie
-from PyQt5.QtWidgets import QLabel
-
+from radar_player import RadarAnimationPlayer
+from freshness import draw_stale_marker
+import config
+from weather_data import get_config_watcher
+import working_store
 
 
 class SlideGUI(QWidget):
@@ -27,14 +28,7 @@ class SlideGUI(QWidget):
         self.custom_font_family = QFontDatabase.applicationFontFamilies(font_id)[0] if font_id != -1 else "Arial"
 
         # Load settings
-        settings_path = os.path.join(script_dir, "settings.json")
-        with open(settings_path, "r") as f:
-            self.settings = json.load(f)
-
-        # Process the map display layer
-        self.map_display_layer = self.settings.get("weather_map_disp_layer", "")
-        if "_animated" in self.map_display_layer:
-            self.map_display_layer = self.map_display_layer.replace("_animated", "").upper()
+        self.settings = config.get_config()
 
         # Timer to update time and date
         self.current_time = ""
@@ -45,29 +39,29 @@ class SlideGUI(QWidget):
         self.timer.timeout.connect(self.update_time_and_date)
         self.timer.start(1000)  # Update every second
 
-        script_dir = os.path.dirname(os.path.abspath(__file__))
-        self.gif_path = os.path.join(script_dir, "weathertiles", self.settings.get("weather_map_disp_layer", "default.gif"))+".gif"
-        print(self.gif_path)
-        self.last_mod_time = None  # Track modification time
-        
-        # Create a QLabel to display the GIF
-        self.gif_label = QLabel(self)
-        self.gif_label.setAlignment(Qt.AlignCenter)
-        self.update_gif_display()
-
-        # Timer to check for updates
-        self.gif_timer = QTimer(self)
-        self.gif_timer.timeout.connect(self.check_and_update_gif)
-        self.gif_timer.start(1000)  # Check every second
-
-    def load_weather_data(self, filepath):
-        """Load weather data from the specified JSON file."""
-        try:
-            with open(filepath, "r") as file:
-                return json.load(file)
-        except (FileNotFoundError, json.JSONDecodeError) as e:
-            print(f"Error loading weather data: {e}")
-            return []  # Return an empty list if data cannot be loaded
+        self.gif_path = self.layer_gif_path(self.settings.weather_map_disp_layer)
+
+        # Player decodes the GIF once per change and reloads it when the file changes
+        self.radar_player = RadarAnimationPlayer(self.gif_path, self)
+        self.radar_player.frame_size_changed.connect(self.position_radar)
+
+        # Switch layers live when the setting changes
+        get_config_watcher().changed.connect(self.apply_settings)
+
+    def has_data(self):
+        """Whether there's a radar image to show yet (for the startup paint timing)."""
+        return bool(self.radar_player.frames)
+
+    def layer_gif_path(self, layer):
+        return os.path.join(working_store.directory("weathertiles"), layer) + ".gif"
+
+    def apply_settings(self, old, new):
+        """Show the new map layer when weather_map_disp_layer changes."""
+        self.settings = new
+        if new.weather_map_disp_layer != old.weather_map_disp_layer:
+            self.gif_path = self.layer_gif_path(new.weather_map_disp_layer)
+            self.radar_player.set_path(self.gif_path)
+            self.update()
 
     def update_time_and_date(self):
         """Update the current time and date."""
@@ -75,23 +69,6 @@ class SlideGUI(QWidget):
         self.current_date = QDateTime.currentDateTime().toString("ddd MMM dd")  # Date in DAY MON DATE format
         self.update()  # Trigger a repaint
 
-    def calculate_column_widths(self, painter, font_size):
-        """Calculate dynamic column widths based on the largest strings in each column."""
-        max_location_width = max(
-            painter.fontMetrics().horizontalAdvance(entry["location"])
-            for entry in self.regional_weather["regional_weather"]  # Access the list
-        )
-        max_observation_width = max(
-            painter.fontMetrics().horizontalAdvance(entry["conditions"])
-            for entry in self.regional_weather["regional_weather"]  # Access the list
-        )
-        max_temperature_width = max(
-            painter.fontMetrics().horizontalAdvance(str(int(entry["temperature"])))
-            for entry in self.regional_weather["regional_weather"]  # Access the list
-        )
-        return max_location_width, max_observation_width, max_temperature_width
-
-
     def paintEvent(self, event):
         painter = QPainter(self)
 
@@ -118,7 +95,7 @@ class SlideGUI(QWidget):
                 outline_width
             )
 
-        display_layer = self.settings.get("weather_map_disp_layer", "").replace("_animated", "").upper()
+        display_layer = self.settings.weather_map_disp_layer.replace("_animated", "").upper()
 
         # Font and text details
         font_size = 24
@@ -144,7 +121,10 @@ class SlideGUI(QWidget):
         self.draw_text_with_outline(painter, self.current_time, 10, 22, 20, 1)
         self.draw_text_with_outline(painter, self.current_date, 570, 22, 20, 1)
 
-    def draw_text_with_outline(self, painter, text, x, y, font_size, outline_width=1):
+        # The radar player counts its own first paint; the marker is drawn here, above the map
+        draw_stale_marker(self, painter, self.radar_player.freshness.stale_label())
+
+    def draw_text_with_outline(self, painter, text, x, y, font_size, outline_width=1, color=Qt.white):
         """
         Draw text with an outline.
 
@@ -155,6 +135,7 @@ class SlideGUI(QWidget):
             y: Y-coordinate of the text.
             font_size: Font size of the text.
             outline_width: Thickness of the outline in pixels (default: 1).
+            color: Color of the text inside the outline (default: white).
         """
         font = QFont(self.custom_font_family, font_size)
         font.setBold(True)
@@ -168,47 +149,11 @@ class SlideGUI(QWidget):
                     painter.drawText(x + dx, y + dy, text)
 
         # Draw main text
-        painter.setPen(Qt.white)
+        painter.setPen(color)
         painter.drawText(x, y, text)
 
-    def update_gif_display(self):
-        """Update the GIF display."""
-        if not os.path.exists(self.gif_path):
-            print(f"Error: File '{self.gif_path}' does not exist.")
-            return
-
-        # Load the GIF
-        movie = QMovie(self.gif_path)
-        if not movie.isValid():
-            print(f"Error: Unable to load GIF '{self.gif_path}'.")
-            return
-        
-        # Get original size
-        movie.start()
-        movie_width = movie.frameRect().width()
-        movie_height = movie.frameRect().height()
-        movie.stop()
-
-        # Center horizontally and align bottom
-        x_offset = (self.width() - movie_width) // 2
-        y_offset = self.height() - movie_height
-        self.gif_label.setGeometry(x_offset, y_offset, movie_width, movie_height)
-
-        # Set the movie to the label
-        self.gif_label.setMovie(movie)
-        movie.start()
-        print(f"GIF loaded: {self.gif_path}")
-
-    def check_and_update_gif(self):
-        """Check if the GIF file has changed and reload it if needed."""
-        try:
-            current_mod_time = os.path.getmtime(self.gif_path)
-        except FileNotFoundError:
-            print(f"Error: File '{self.gif_path}' does not exist.")
-            return
-
-        if self.last_mod_time != current_mod_time:
-            self.last_mod_time = current_mod_time
-            print("GIF file updated. Reloading...")
-            self.update_gif_display()
-
+    def position_radar(self, size):
+        """Center the radar animation horizontally and align it to the bottom."""
+        x_offset = (self.width() - size.width()) // 2
+        y_offset = self.height() - size.height()
+        self.radar_player.setGeometry(x_offset, y_offset, size.width(), size.height())
@@ -1,11 +1,38 @@
 import os
-import json
 from PyQt5.QtWidgets import QWidget, QLabel
 from PyQt5.QtGui import QPixmap, QFont, QPainter, QImage, QFontDatabase
-from PyQt5.QtCore import Qt, QTimer, QTime, QDateTime
+from PyQt5.QtCore import Qt, QTimer, QTime, QDateTime, QPoint, QRect
 from datetime import datetime
 from dateutil import parser
-from PyQt5.QtCore import QFileSystemWatcher
+from weather_data import get_data_source, CoalescingWatcher
+import config
+from freshness import FreshnessTracker, draw_stale_marker
+import icon_atlas
+import working_store
+
+# Shown until the first good data arrives
+DEFAULT_WEATHER_DATA = {
+    "location": "Unknown",
+    "temperature": 0,
+    "conditions": "N/A",
+    "wind_direction": "N/A",
+    "wind_speed_mph": 0,
+    "gusts_mph": 0,
+    "humidity_percent": 0,
+    "dewpoint": 0,
+    "ceiling_feet": 0,
+    "visibility_miles": 0,
+    "pressure_inhg": 0.0,
+    "pressure_trend": "steady",
+    "icon_url": "",
+    "observation_time": "Unknown time"
+}
+
+# On-screen icon size; must be one of icon_atlas.ATLAS_SIZES. Qt loads the
+# "@2x" icon files at device pixel ratio 2, so the 350px scale this slide
+# used to draw has always shown up 175px wide.
+ICON_SIZE = 175
+ICON_POSITION = QPoint(100, 120)  # Below the temperature on the left side
 
 class SlideGUI(QWidget):
     def __init__(self):
@@ -19,8 +46,8 @@ class SlideGUI(QWidget):
         self.background_path = os.path.join(script_dir, "backgrounds", background_filename)
 
         # Define the weather data file
-        self.weather_file = os.path.join(script_dir, "weatherdata", "home_weather.json")
-        self.weather_data = self.load_weather_data(self.weather_file)
+        self.weather_file = os.path.join(working_store.directory("weatherdata"), "home_weather.json")
+        self.weather_data = DEFAULT_WEATHER_DATA
 
         # Map pressure trend to arrow symbols
         self.pressure_trend_mapping = {
@@ -55,69 +82,90 @@ class SlideGUI(QWidget):
         self.time_timer.timeout.connect(self.update_time_and_date)
         self.time_timer.start(1000)  # Update every second
 
-        # Timer to reload weather data
-        self.weather_reload_timer = QTimer(self)
-        self.weather_reload_timer.timeout.connect(self.reload_weather_data)
-        self.weather_reload_timer.start(2000)  # Reload every 2 seconds
+        # Icons come pre-scaled from the atlas built by icon_atlas.py, reloaded
+        # only when the icon directory settles with a rebuilt atlas in it
+        self.icon_atlas = None
+        self.icon_atlas_rects = {}
+        self.icon_atlas_signature = None
+        self.fallback_icons = {}  # Icon path -> one-off scaled pixmap (None if unreadable)
+        self.load_icon_atlas()
+        os.makedirs(icon_atlas.ICON_DIR, exist_ok=True)
+        self.icon_watcher = CoalescingWatcher(icon_atlas.ICON_DIR, parent=self)
+        self.icon_watcher.settled.connect(self.on_icons_changed)
 
         # Initialize weather details
         self.update_weather_details()
 
+        # Reload weather data whenever the file changes
+        self.freshness = FreshnessTracker("home")
+        self.data_source = get_data_source()
+        self.data_source.subscribe(os.path.basename(self.weather_file), self.reload_weather_data)
 
 
-    def reload_weather_data(self):
-        """Reload the weather data periodically."""
-        self.weather_data = self.load_weather_data(self.weather_file)
+
+    def reload_weather_data(self, snapshot):
+        """Take a new weather data snapshot from the shared data source."""
+        self.weather_data = snapshot.data
+        self.freshness.loaded(snapshot.data.get("provenance"), snapshot.loaded_at)
         self.update_weather_details()
         self.update()  # Trigger a repaint
 
-    def load_weather_data(self, filepath):
-        """Load weather data from the specified JSON file."""
-        try:
-            with open(filepath, "r") as f:
-                return json.load(f)
-        except (FileNotFoundError, json.JSONDecodeError) as e:
-            print(f"Error loading weather data: {e}")
-            return {
-                "location": "Unknown",
-                "temperature": 0,
-                "conditions": "N/A",
-                "wind_direction": "N/A",
-                "wind_speed_mph": 0,
-                "gusts_mph": 0,
-                "humidity_percent": 0,
-                "dewpoint": 0,
-                "ceiling_feet": 0,
-                "visibility_miles": 0,
-                "pressure_inhg": 0.0,
-                "pressure_trend": "steady",
-                "icon_url": "",
-                "observation_time": "Unknown time"
-            }
-        
-    def load_weather_data(self, filepath):
-        """Load weather data from the specified JSON file."""
-        try:
-            with open(filepath, "r") as f:
-                return json.load(f)
-        except (FileNotFoundError, json.JSONDecodeError) as e:
-            print(f"Error loading weather data: {e}")
-            return {
-                "location": "Unknown",
-                "temperature": 0,
-                "conditions": "N/A",
-                "wind_direction": "N/A",
-                "wind_speed_mph": 0,
-                "gusts_mph": 0,
-                "humidity_percent": 0,
-                "dewpoint": 0,
-                "ceiling_feet": 0,
-                "visibility_miles": 0,
-                "pressure_inhg": 0.0,
-                "pressure_trend": "steady",
-                "icon_url": "",
-                "observation_time": "Unknown time"
-            }
+
+    def has_data(self):
+        """Whether real data has arrived (for the startup paint timing)."""
+        return self.weather_data is not DEFAULT_WEATHER_DATA
+
+    def load_icon_atlas(self):
+        """Load the icon atlas image and its source rects for ICON_SIZE, if it exists."""
+        self.icon_atlas_signature = config.file_signature(icon_atlas.ATLAS_INDEX_PATH)
+        index = icon_atlas.load_index()
+        if index is None:
+            return
+        pixmap = QPixmap(icon_atlas.ATLAS_IMAGE_PATH)
+        if pixmap.isNull():
+            return
+        self.icon_atlas = pixmap
+        self.icon_atlas_rects = {
+            code: QRect(*rect) for code, rect in index["sizes"].get(str(ICON_SIZE), {}).items()
+        }
+
+
+    def on_icons_changed(self):
+        """The icon directory changed: reload the atlas if it was rebuilt, and retry missing icons."""
+        self.fallback_icons.clear()  # A missing icon may have been downloaded
+        if config.file_signature(icon_atlas.ATLAS_INDEX_PATH) != self.icon_atlas_signature:
+            self.load_icon_atlas()
+        self.update_icon()
+        self.update()
+
+    def fallback_icon(self, path):
+        """A one-off scaled copy of an icon the atlas doesn't have, read once until the icons change."""
+        if path not in self.fallback_icons:
+            scaled = None
+            if os.path.isfile(path):
+                pixmap = QPixmap(path)
+                if not pixmap.isNull():
+                    pixmap.setDevicePixelRatio(1)  # Scale in real pixels, like the atlas
+                    scaled = pixmap.scaled(ICON_SIZE, ICON_SIZE, Qt.KeepAspectRatio, Qt.SmoothTransformation)
+            self.fallback_icons[path] = scaled
+        return self.fallback_icons[path]
+
+
+    def update_icon(self):
+        """Pick the icon to draw: a rect in the atlas, or a one-off scaled copy if it isn't in there."""
+        self.icon_pixmap = None
+        self.icon_source = QRect()
+        if not self.weather_data["icon_url"]:
+            return
+        code = icon_atlas.icon_code(self.weather_data["icon_url"])
+        if code in self.icon_atlas_rects:
+            self.icon_pixmap = self.icon_atlas
+            self.icon_source = self.icon_atlas_rects[code]
+        else:
+            self.icon_pixmap = self.fallback_icon(self.icon_path)
+            if self.icon_pixmap is not None:
+                self.icon_source = self.icon_pixmap.rect()
+
 
     def update_weather_details(self):
         """Update weather details based on the loaded data."""
@@ -159,6 +207,7 @@ class SlideGUI(QWidget):
         # Update icon path
         icon_filename = self.weather_data["icon_url"].split("/")[-1]
         self.icon_path = os.path.join(os.path.dirname(self.weather_file), "icons", icon_filename)
+        self.update_icon()
 
 
     def update_time_and_date(self):
@@ -237,10 +286,8 @@ class SlideGUI(QWidget):
 
 
         # Draw weather icon (overlapping placeholder position)
-        if os.path.exists(self.icon_path):
-            pixmap = QPixmap(self.icon_path)
-            pixmap = pixmap.scaled(350, 350, Qt.KeepAspectRatio, Qt.SmoothTransformation)
-            painter.drawPixmap(100, 120, pixmap)  # Icon below temperature on the left side
+        if self.icon_pixmap is not None:
+            painter.drawPixmap(ICON_POSITION, self.icon_pixmap, self.icon_source)
 
         # Draw time and date in the upper-right corner
         self.draw_text_with_outline(painter, self.current_time, 450, 70, 20)
@@ -259,9 +306,12 @@ class SlideGUI(QWidget):
 
         self.draw_text_with_outline(painter, obs_time_display, x, y, font_size, 1)
 
+        draw_stale_marker(self, painter, self.freshness.stale_label())
+        self.freshness.painted()
+
 
 
-    def draw_text_with_outline(self, painter, text, x, y, font_size, outline_width=1):
+    def draw_text_with_outline(self, painter, text, x, y, font_size, outline_width=1, color=Qt.white):
         """
         Draw text with an outline.
 
@@ -272,6 +322,7 @@ class SlideGUI(QWidget):
             y: Y-coordinate of the text.
             font_size: Font size of the text.
             outline_width: Thickness of the outline in pixels (default: 1).
+            color: Color of the text inside the outline (default: white).
         """
         # Use fallback font for arrows if necessary
         if "↑" in text or "↓" in text or "→" in text:
@@ -291,7 +342,7 @@ class SlideGUI(QWidget):
                     painter.drawText(x + dx, y + dy, text)
 
         # Draw main text
-        painter.setPen(Qt.white)
+        painter.setPen(color)
         painter.drawText(x, y, text)
 
 
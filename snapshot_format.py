@@ -0,0 +1,104 @@
+"""
+Versioned binary snapshots of the weatherdata files, published atomically.
+
+Each `<name>.json` written by a fetcher gets a `<name>.snap` next to it:
+
+    header (24 bytes, little endian)
+        magic        4s   b"WXS1"
+        version      H    1
+        flags        H    reserved, 0
+        generation   Q    bumped on every publish
+        body_length  I
+        body_crc32   I
+    body         compact UTF-8 JSON
+
+Both files are written to a temp file, fsynced and renamed into place, so a
+reader sees either the old or the new file, never a torn one. Readers can
+read just the header to tell "unchanged" from "new" without parsing the
+body.
+"""
+import json
+import os
+import struct
+import tempfile
+import zlib
+
+MAGIC = b"WXS1"
+VERSION = 1
+HEADER = struct.Struct("<4sHHQII")
+
+
+def snapshot_path(json_path):
+    """The .snap file that goes with a .json data file."""
+    return os.path.splitext(json_path)[0] + ".snap"
+
+
+def write_atomic(path, payload):
+    """Write bytes to `path` via temp file + fsync + rename."""
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    # A temp file of its own, so concurrent writers of the same path can't interleave
+    with tempfile.NamedTemporaryFile(dir=directory, prefix=os.path.basename(path) + ".",
+                                     suffix=".tmp", delete=False) as f:
+        try:
+            f.write(payload)
+            f.flush()
+            os.fsync(f.fileno())
+        except BaseException:
+            f.close()
+            os.unlink(f.name)
+            raise
+    os.replace(f.name, path)
+    # Make the rename itself durable
+    dir_fd = os.open(directory, os.O_RDONLY)
+    try:
+        os.fsync(dir_fd)
+    finally:
+        os.close(dir_fd)
+
+
+def read_generation(path):
+    """Return the generation in a snapshot's header, or None if it's missing or not a snapshot."""
+    try:
+        with open(path, "rb") as f:
+            header = f.read(HEADER.size)
+    except FileNotFoundError:
+        return None
+    if len(header) != HEADER.size:
+        return None
+    magic, version, _, generation, _, _ = HEADER.unpack(header)
+    if magic != MAGIC or version != VERSION:
+        return None
+    return generation
+
+
+def read_snapshot(path):
+    """Return (generation, data) from a snapshot file. Raises ValueError if it's corrupt."""
+    with open(path, "rb") as f:
+        payload = f.read()
+    if len(payload) < HEADER.size:
+        raise ValueError(f"{path}: too short for a snapshot header")
+    magic, version, _, generation, body_length, body_crc = HEADER.unpack_from(payload)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError(f"{path}: not a version {VERSION} snapshot")
+    body = payload[HEADER.size:]
+    if len(body) != body_length or zlib.crc32(body) != body_crc:
+        raise ValueError(f"{path}: body length or checksum mismatch")
+    return generation, json.loads(body.decode("utf-8"))
+
+
+def encode_snapshot(data, generation):
+    body = json.dumps(data, separators=(",", ":")).encode("utf-8")
+    return HEADER.pack(MAGIC, VERSION, 0, generation, len(body), zlib.crc32(body)) + body
+
+
+def publish(json_path, data):
+    """Atomically write `data` as pretty JSON and as the next snapshot generation.
+
+    Returns the new generation.
+    """
+    snap_path = snapshot_path(json_path)
+    generation = (read_generation(snap_path) or 0) + 1
+    write_atomic(json_path, json.dumps(data, indent=4).encode("utf-8"))
+    write_atomic(snap_path, encode_snapshot(data, generation))
+    return generation
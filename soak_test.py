@@ -0,0 +1,337 @@
+"""
+Accelerated-clock soak test for the whole app.
+
+Runs WeatherApp offscreen against fixture data with every QTimer driven by
+a simulated clock, so days of slide cycling, clock ticks, radar frames and
+refresh jobs replay in minutes. The refresh jobs are real subprocesses,
+but instead of calling OWM they republish the fixture data (this script's
+fixture-job command), so the file watchers, snapshot loads and GIF decodes
+all run as they would in the field. A job still takes real time, so at
+high speeds each refresh lands later in simulated time than its interval.
+
+RSS, open file descriptors, threads and live QObjects are sampled every
+simulated hour. After a warmup, a metric fails when the lowest value of the
+last quarter of the run is above the highest value of the first quarter by
+more than its tolerance, i.e. it kept growing instead of levelling off.
+
+Everything runs against a throwaway settings file and working store in a
+temp directory; the data in weatherdata/ and weathertiles/ is only read.
+
+Usage:
+    python3 soak_test.py --days 7
+    python3 soak_test.py --days 2 --speed 20000 --json soak.json
+"""
+import os
+import sys
+
+# Must be set before the QApplication is created
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+import argparse
+import gc
+import json
+import random
+import shutil
+import tempfile
+import time
+from collections import Counter
+from datetime import datetime
+from PyQt5 import sip
+from PyQt5.QtWidgets import QApplication
+from PyQt5.QtCore import QObject, QTimer, QEvent
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Qt is told a timer runs this long, so it reports as active but never fires by itself
+PARKED_MS = 2 ** 31 - 1
+
+# Let Qt paint and deliver queued signals at least this often (wall time)
+PROCESS_EVENTS_EVERY_SEC = 0.01
+
+# Allowed growth between the first and last quarter of the run, after warmup
+TOLERANCES = {
+    "rss_mb": 8.0,
+    "fds": 2,
+    "threads": 2,  # A job thread may be running when a sample is taken
+    "qobjects": 5,
+}
+
+
+class SimulatedClock:
+    """Drives every QTimer from a virtual clock instead of wall time.
+
+    QTimer.start, stop and setInterval are patched, so timers keep their
+    usual API (isActive, isSingleShot) while advance() decides when each one
+    fires. QTimer.singleShot(ms, callback) (the startup show fallback) gets a
+    one-off single-shot QTimer, so it runs on virtual time too. Virtual time
+    never runs more than `speed` times faster than wall time, so subprocesses
+    and worker threads still get a chance to finish.
+    """
+
+    def __init__(self, app, speed):
+        self.app = app
+        self.speed = speed
+        self.now_ms = 0
+        self.due = {}  # QTimer -> virtual time (ms) it fires next
+        self.intervals = {}  # QTimer -> interval (ms) the app asked for
+        self.fired = 0
+        self.wall_start = time.monotonic()
+        self.last_process_events = 0.0
+        self.install()
+
+    def install(self):
+        clock = self
+        self.original_start = original_start = QTimer.start
+        self.original_stop = original_stop = QTimer.stop
+
+        def start(timer, msec=None):
+            if msec is not None:
+                clock.intervals[timer] = msec
+            clock.due[timer] = clock.now_ms + clock.intervals.get(timer, 0)
+            original_start(timer, PARKED_MS)
+
+        def stop(timer):
+            clock.due.pop(timer, None)
+            original_stop(timer)
+
+        def set_interval(timer, msec):
+            clock.intervals[timer] = msec
+            if timer in clock.due:  # Qt restarts an active timer with the new interval
+                clock.due[timer] = clock.now_ms + msec
+
+        def single_shot(msec, *args):
+            # singleShot(msec, callback), or with a timer type in between; the callback is last
+            timer = QTimer(clock.app)
+            timer.setSingleShot(True)
+            timer.timeout.connect(args[-1])
+            timer.timeout.connect(timer.deleteLater)
+            start(timer, msec)
+
+        QTimer.start = start
+        QTimer.stop = stop
+        QTimer.setInterval = set_interval
+        QTimer.singleShot = staticmethod(single_shot)
+
+    def process_events(self):
+        self.app.processEvents()
+        # processEvents() outside exec_() never runs deleteLater(); the real event loop does
+        self.app.sendPostedEvents(None, QEvent.DeferredDelete)
+        self.last_process_events = time.monotonic()
+
+    def advance(self):
+        """Fire the next due timer, waiting for wall time to catch up if we're ahead."""
+        for timer in [timer for timer in self.due if sip.isdeleted(timer)]:
+            del self.due[timer]
+        if not self.due:
+            self.now_ms += 1000  # Nothing scheduled; let time pass for the jobs
+            self.process_events()
+            return
+        timer, due = min(self.due.items(), key=lambda item: item[1])
+        wall_target = self.wall_start + due / 1000 / self.speed
+        while True:
+            remaining = wall_target - time.monotonic()
+            if remaining <= 0:
+                break
+            self.process_events()
+            time.sleep(min(remaining, 0.005))
+        if time.monotonic() - self.last_process_events > PROCESS_EVENTS_EVERY_SEC:
+            self.process_events()
+
+        self.now_ms = due
+        if timer.isSingleShot():
+            del self.due[timer]
+            self.original_stop(timer)
+        else:
+            self.due[timer] = due + max(self.intervals.get(timer, 0), 1)
+        self.fired += 1
+        timer.timeout.emit()
+
+    def run_until(self, end_ms):
+        while self.now_ms < end_ms:
+            self.advance()
+
+
+def proc_status(field):
+    """A numeric field (e.g. VmRSS, Threads) from /proc/self/status."""
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith(f"{field}:"):
+                return int(line.split()[1])
+    return 0
+
+
+def live_qobjects(roots):
+    """Count of live QObjects by class, over the object trees under `roots`."""
+    counts = Counter()
+    for root in roots:
+        counts[type(root).__name__] += 1
+        for child in root.findChildren(QObject):
+            counts[type(child).__name__] += 1
+    return counts
+
+
+def take_sample(clock, roots, window):
+    counts = live_qobjects(roots)
+    jobs = window.job_status()
+    return {
+        "sim_hours": round(clock.now_ms / 3600000, 2),
+        "wall_sec": round(time.monotonic() - clock.wall_start, 1),
+        "rss_mb": round(proc_status("VmRSS") / 1024, 1),
+        "fds": len(os.listdir("/proc/self/fd")),
+        "threads": proc_status("Threads"),
+        "qobjects": sum(counts.values()),
+        "qobject_wrappers": sum(1 for obj in gc.get_objects() if isinstance(obj, QObject)),
+        "timers_fired": clock.fired,
+        "job_runs": sum(job["runs"] for job in jobs.values()),
+        "job_failures": sum(job["failures"] for job in jobs.values()),
+        "by_class": dict(counts),
+    }
+
+
+def growth_failures(samples):
+    """Metrics whose late values all sit above their early values by more than the tolerance."""
+    quarter = len(samples) // 4
+    if quarter < 2:
+        return None  # Too short to tell growth from noise
+    early, late = samples[:quarter], samples[-quarter:]
+    failures = []
+    for metric, tolerance in TOLERANCES.items():
+        early_max = max(sample[metric] for sample in early)
+        late_min = min(sample[metric] for sample in late)
+        if late_min > early_max + tolerance:
+            failures.append(f"{metric} grew from at most {early_max} to at least {late_min}")
+    return failures
+
+
+def grown_classes(first, last):
+    """QObject classes with more live instances at the end, most grown first."""
+    grown = {name: count - first.get(name, 0) for name, count in last.items() if count > first.get(name, 0)}
+    return sorted(grown.items(), key=lambda item: -item[1])
+
+
+def fixture_job(job):
+    """Stand-in for a refresh job: republish the fixture data with small changes."""
+    import config
+    import snapshot_format
+    import working_store
+
+    data_dir = working_store.directory("weatherdata")
+    if job == "weather":
+        now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        for file_name in ("home_weather.json", "regional_weather.json"):
+            with open(os.path.join(SCRIPT_DIR, "weatherdata", file_name), "r") as f:
+                data = json.load(f)
+            if file_name == "home_weather.json":
+                data["temperature"] = round(data["temperature"] + random.uniform(-5, 5), 1)
+            else:
+                for entry in data["regional_weather"]:
+                    if entry["temperature"] is not None:
+                        entry["temperature"] = round(entry["temperature"] + random.uniform(-5, 5), 1)
+            data["observation_time"] = now
+            snapshot_format.publish(os.path.join(data_dir, file_name), data)
+    else:
+        # Swap in a different fixture GIF, so every run is a real decode of new frames
+        fixture_dir = os.path.join(SCRIPT_DIR, "weathertiles")
+        gifs = sorted(name for name in os.listdir(fixture_dir) if name.endswith(".gif"))
+        with open(os.path.join(fixture_dir, random.choice(gifs)), "rb") as f:
+            payload = f.read()
+        layer = config.get_config().weather_map_disp_layer
+        snapshot_format.write_atomic(os.path.join(working_store.directory("weathertiles"), f"{layer}.gif"), payload)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Accelerated-clock soak test for the weather GUI.")
+    parser.add_argument("--days", type=float, default=7, help="Simulated days to run (default: 7)")
+    parser.add_argument("--speed", type=float, default=5000,
+                        help="At most this many simulated seconds per wall second (default: 5000)")
+    parser.add_argument("--refresh-min", type=int, default=10,
+                        help="Simulated minutes between radar and weather refreshes (default: 10)")
+    parser.add_argument("--sample-min", type=float, default=60, help="Simulated minutes between samples (default: 60)")
+    parser.add_argument("--warmup-hours", type=float, default=6,
+                        help="Simulated hours before samples count toward the growth check (default: 6)")
+    parser.add_argument("--json", help="Write every sample to this file")
+    parser.add_argument("--keep", action="store_true", help="Keep the temp directory with the settings and working store")
+    subparsers = parser.add_subparsers(dest="command")
+    job_parser = subparsers.add_parser("fixture-job", help="(Internal) one refresh job run against the fixture data")
+    job_parser.add_argument("job", choices=("radar", "weather"))
+    args = parser.parse_args()
+
+    if args.command == "fixture-job":
+        fixture_job(args.job)
+        return
+
+    # Every module (and every job subprocess) reads this settings file instead
+    temp_dir = tempfile.mkdtemp(prefix="weather-soak-")
+    settings_path = os.path.join(temp_dir, "settings.json")
+    with open(settings_path, "w") as f:
+        json.dump({
+            "debug": False,
+            "api_key": "soak-test",
+            "adaptive_refresh": False,  # Fixed intervals; the scheduler's upstream alignment uses wall time
+            "radar_refresh_min": args.refresh_min,
+            "weather_refresh_min": args.refresh_min,
+            "working_store_dir": os.path.join(temp_dir, "store"),
+        }, f, indent=4)
+    os.environ["WEATHER_SETTINGS"] = settings_path
+
+    sys.path.insert(0, SCRIPT_DIR)
+    app = QApplication(sys.argv)
+    clock = SimulatedClock(app, args.speed)
+
+    # Imported only now, so config picks up WEATHER_SETTINGS
+    import working_store
+    from weather_data import get_config_watcher, get_data_source
+    from weather_gui import WeatherApp
+
+    window = WeatherApp()
+    for name, job in window.jobs.items():
+        job.script_path = os.path.abspath(__file__)
+        job.args = ["fixture-job", name]
+    # The soak run's data is throwaway; never checkpoint it over the real files
+    window.checkpoint_timer.stop()
+    app.aboutToQuit.disconnect(working_store.checkpoint)
+    window.show()
+
+    roots = [app, get_data_source(), get_config_watcher()] + QApplication.topLevelWidgets()
+    end_ms = args.days * 24 * 3600 * 1000
+    sample_ms = args.sample_min * 60 * 1000
+    samples = []
+    print(f"{'sim h':>7}{'wall s':>8}{'rss MB':>8}{'fds':>6}{'threads':>8}{'qobjects':>9}{'timers':>10}{'jobs':>6}")
+    while clock.now_ms < end_ms:
+        clock.run_until(min(clock.now_ms + sample_ms, end_ms))
+        sample = take_sample(clock, roots, window)
+        samples.append(sample)
+        print(f"{sample['sim_hours']:>7}{sample['wall_sec']:>8}{sample['rss_mb']:>8}{sample['fds']:>6}"
+              f"{sample['threads']:>8}{sample['qobjects']:>9}{sample['timers_fired']:>10}{sample['job_runs']:>6}")
+
+    app.aboutToQuit.emit()  # Stops the jobs and the loader/decoder threads
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(samples, f, indent=4)
+    if args.keep:
+        print(f"Kept {temp_dir}")
+    else:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+
+    wall_sec = time.monotonic() - clock.wall_start
+    print(f"Simulated {clock.now_ms / 3600000:.1f} h in {wall_sec:.0f} s "
+          f"({clock.now_ms / 1000 / wall_sec:.0f}x), {clock.fired} timer events, "
+          f"{samples[-1]['job_runs']} job runs ({samples[-1]['job_failures']} failed)")
+
+    steady = [sample for sample in samples if sample["sim_hours"] >= args.warmup_hours]
+    failures = growth_failures(steady)
+    if failures is None:
+        print("Run too short after warmup to check for growth; use more --days or a smaller --sample-min.")
+        sys.exit(2)
+    if samples[-1]["job_failures"]:
+        failures.append(f"{samples[-1]['job_failures']} fixture job runs failed")
+    if failures:
+        print("FAIL: " + "; ".join(failures))
+        grown = grown_classes(steady[0]["by_class"], samples[-1]["by_class"])
+        if grown:
+            print("QObject classes that grew: " + ", ".join(f"{name} +{count}" for name, count in grown[:10]))
+        sys.exit(1)
+    print("PASS: no sustained growth in RSS, file descriptors, threads or QObjects.")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,341 @@
+import os
+import json
+import time
+from dataclasses import dataclass
+from types import MappingProxyType
+from PyQt5.QtCore import QObject, QThread, QTimer, QCoreApplication, QFileSystemWatcher, pyqtSignal, pyqtSlot
+import snapshot_format
+import config
+import working_store
+
+# Writers (json.dump, editors, rsync) emit several events per save, so wait
+# for things to go quiet before re-reading anything.
+COALESCE_MS = 250
+
+# Expected fields per data file; a file that doesn't match is treated as
+# half-written and the previous snapshot is kept.
+NUMBER = (int, float)
+OPTIONAL_NUMBER = (int, float, type(None))
+OPTIONAL_STR = (str, type(None))
+
+HOME_WEATHER_FIELDS = {
+    "location": str,
+    "temperature": NUMBER,
+    "conditions": str,
+    "wind_direction": str,
+    "wind_speed_mph": NUMBER,
+    "gusts_mph": NUMBER,
+    "humidity_percent": NUMBER,
+    "dewpoint": NUMBER,
+    "ceiling_feet": NUMBER,
+    "visibility_miles": NUMBER,
+    "pressure_inhg": NUMBER,
+    "pressure_trend": str,
+    "icon_url": str,
+    "observation_time": str,
+}
+
+REGIONAL_WEATHER_FIELDS = {
+    "observation_time": OPTIONAL_STR,
+    "regional_weather": list,
+}
+
+REGIONAL_ENTRY_FIELDS = {
+    "location": str,
+    "conditions": str,
+    "temperature": OPTIONAL_NUMBER,  # None when the fetch for that city failed
+}
+
+
+def check_fields(data, fields, where):
+    """Raise ValueError if `data` is missing a field or has the wrong type."""
+    if not isinstance(data, dict):
+        raise ValueError(f"{where}: expected an object, got {type(data).__name__}")
+    for key, expected_type in fields.items():
+        if key not in data:
+            raise ValueError(f"{where}: missing '{key}'")
+        if not isinstance(data[key], expected_type):
+            raise ValueError(f"{where}: '{key}' has unexpected type {type(data[key]).__name__}")
+
+
+def validate_home_weather(data):
+    check_fields(data, HOME_WEATHER_FIELDS, "home_weather.json")
+
+
+def validate_regional_weather(data):
+    check_fields(data, REGIONAL_WEATHER_FIELDS, "regional_weather.json")
+    for index, entry in enumerate(data["regional_weather"]):
+        check_fields(entry, REGIONAL_ENTRY_FIELDS, f"regional_weather.json entry {index}")
+
+
+VALIDATORS = {
+    "home_weather.json": validate_home_weather,
+    "regional_weather.json": validate_regional_weather,
+}
+
+
+def freeze(value):
+    """Recursively convert dicts/lists into read-only mappings/tuples."""
+    if isinstance(value, dict):
+        return MappingProxyType({key: freeze(item) for key, item in value.items()})
+    if isinstance(value, list):
+        return tuple(freeze(item) for item in value)
+    return value
+
+
+@dataclass(frozen=True)
+class WeatherSnapshot:
+    """One validated, read-only version of a data file."""
+    file_name: str
+    data: MappingProxyType
+    signature: tuple  # ("snap", generation) or ("json", mtime_ns, size) of what it was parsed from
+    loaded_at: float  # time.time() when parsing finished
+    generation: int = None  # Snapshot generation, None when read from plain JSON
+
+
+class CoalescingWatcher(QObject):
+    """Watch a directory (and files in it) and emit `settled` once events go quiet.
+
+    Files replaced by rename or deleted drop out of QFileSystemWatcher, so
+    watched files are re-added after every burst.
+    """
+
+    settled = pyqtSignal()
+
+    def __init__(self, directory, coalesce_ms=COALESCE_MS, parent=None):
+        super().__init__(parent)
+        self.directory = directory
+        self.file_paths = []
+
+        self.watcher = QFileSystemWatcher(self)
+        self.watcher.directoryChanged.connect(self.schedule_check)
+        self.watcher.fileChanged.connect(self.schedule_check)
+
+        # One check per burst of events
+        self.coalesce_timer = QTimer(self)
+        self.coalesce_timer.setSingleShot(True)
+        self.coalesce_timer.setInterval(coalesce_ms)
+        self.coalesce_timer.timeout.connect(self.on_settled)
+
+        self.watcher.addPath(self.directory)
+
+    def watch_file(self, file_path):
+        """Also watch a single file, so in-place rewrites are noticed."""
+        if file_path not in self.file_paths:
+            self.file_paths.append(file_path)
+        self.watcher.addPath(file_path)  # Fails quietly if it doesn't exist yet
+
+    def schedule_check(self, _path=None):
+        """Restart the coalescing timer on every filesystem event."""
+        self.coalesce_timer.start()
+
+    def on_settled(self):
+        watched = set(self.watcher.files())
+        for file_path in self.file_paths:
+            if file_path not in watched:
+                self.watcher.addPath(file_path)
+        self.settled.emit()
+
+
+class SnapshotLoader(QObject):
+    """Reads, validates and freezes data files. Lives on a worker thread.
+
+    Prefers the binary .snap a fetcher publishes next to each .json, whose
+    header generation tells "unchanged" from "new" without reading the body.
+    Falls back to the JSON when there is no snapshot or the JSON is newer
+    (e.g. edited by hand).
+    """
+
+    snapshot_loaded = pyqtSignal(object)  # WeatherSnapshot
+    preloaded = pyqtSignal()  # After the snapshots preload() found
+
+    def __init__(self, directory):
+        super().__init__()
+        self.directory = directory
+        self.signatures = {}  # file name -> signature last seen
+
+    def current_signature(self, json_path, snap_path):
+        """("snap", generation), ("json", mtime_ns, size), or None if neither file exists."""
+        try:
+            json_stat = os.stat(json_path)
+        except FileNotFoundError:
+            json_stat = None
+        try:
+            snap_stat = os.stat(snap_path)
+        except FileNotFoundError:
+            snap_stat = None
+
+        if snap_stat is not None and (json_stat is None or snap_stat.st_mtime_ns >= json_stat.st_mtime_ns):
+            generation = snapshot_format.read_generation(snap_path)
+            if generation is not None:
+                return ("snap", generation)
+        if json_stat is not None:
+            return ("json", json_stat.st_mtime_ns, json_stat.st_size)
+        return None
+
+    @pyqtSlot(list)
+    def check_files(self, file_names):
+        """Parse every file whose generation or mtime/size changed and emit a snapshot for it."""
+        for snapshot in self.changed_snapshots(file_names):
+            self.snapshot_loaded.emit(snapshot)
+
+    @pyqtSlot(list)
+    def preload(self, file_names):
+        """Load the files' current data, then emit `preloaded` (queued after the snapshots)."""
+        self.check_files(file_names)
+        self.preloaded.emit()
+
+    def changed_snapshots(self, file_names):
+        """Yield a WeatherSnapshot for every file that changed since it was last checked."""
+        for file_name in file_names:
+            json_path = os.path.join(self.directory, file_name)
+            snap_path = snapshot_format.snapshot_path(json_path)
+            signature = self.current_signature(json_path, snap_path)
+            if signature is None or signature == self.signatures.get(file_name):
+                continue
+            # Remember the signature even if parsing fails; a finished write changes it again
+            self.signatures[file_name] = signature
+
+            path = snap_path if signature[0] == "snap" else json_path
+            snapshot = self.load_snapshot(file_name, path, signature)
+            if snapshot is not None:
+                yield snapshot
+
+    def load_snapshot(self, file_name, path, signature):
+        """Return a WeatherSnapshot, or None if the file is unreadable or invalid."""
+        generation = None
+        try:
+            if signature[0] == "snap":
+                generation, data = snapshot_format.read_snapshot(path)
+            else:
+                with open(path, "r") as file:
+                    data = json.load(file)
+            validator = VALIDATORS.get(file_name)
+            if validator is not None:
+                validator(data)
+        except (OSError, ValueError) as e:  # JSONDecodeError is a ValueError
+            print(f"Error loading weather data from {os.path.basename(path)}, keeping previous data: {e}")
+            return None
+        return WeatherSnapshot(file_name, freeze(data), signature, time.time(), generation)
+
+
+class WeatherDataSource(QObject):
+    """Shared, event-driven source of weather data snapshots for the slides.
+
+    File reads happen on a worker thread; snapshots come back to the GUI
+    thread through a queued signal and are fanned out to every subscriber.
+    The last good snapshot of each file is kept when a new one fails to parse.
+
+    The fetchers only ever replace the data files with good data, so what's
+    on disk at startup is the last good state. The loader reads it first and
+    `preloaded` fires once it has arrived, so the window can hold its first
+    paint until then (WeatherApp.show_when_loaded).
+    """
+
+    data_changed = pyqtSignal(object)  # WeatherSnapshot
+    check_requested = pyqtSignal(list)  # File names for the loader to check
+    preload_requested = pyqtSignal(list)
+    preloaded = pyqtSignal()
+
+    def __init__(self, directory=None, parent=None):
+        super().__init__(parent)
+        # Resolved here rather than at import, so importing this module doesn't restore the working store
+        directory = working_store.directory("weatherdata") if directory is None else directory
+        self.directory = directory
+        self.snapshots = {}  # file name -> last good WeatherSnapshot
+        self.subscribers = {}  # file name -> list of callbacks
+        self.is_preloaded = False
+
+        # Loader on its own thread; cross-thread signals are queued
+        self.worker_thread = QThread(self)
+        self.loader = SnapshotLoader(directory)
+        self.loader.moveToThread(self.worker_thread)
+        self.check_requested.connect(self.loader.check_files)
+        self.preload_requested.connect(self.loader.preload)
+        self.loader.snapshot_loaded.connect(self.on_snapshot_loaded)
+        self.loader.preloaded.connect(self.on_preloaded)
+        self.worker_thread.finished.connect(self.loader.deleteLater)
+        self.worker_thread.start()
+        self.preload_requested.emit(list(VALIDATORS))
+
+        app = QCoreApplication.instance()
+        if app is not None:
+            app.aboutToQuit.connect(self.stop)
+
+        os.makedirs(directory, exist_ok=True)
+        self.watcher = CoalescingWatcher(directory, parent=self)
+        self.watcher.settled.connect(self.check_files)
+
+    def subscribe(self, file_name, callback):
+        """Call `callback(snapshot)` with the current snapshot (if any) and on every change."""
+        if file_name not in self.subscribers:
+            json_path = os.path.join(self.directory, file_name)
+            self.watcher.watch_file(json_path)
+            self.watcher.watch_file(snapshot_format.snapshot_path(json_path))
+        self.subscribers.setdefault(file_name, []).append(callback)
+        if file_name in self.snapshots:
+            callback(self.snapshots[file_name])
+        else:
+            self.check_requested.emit([file_name])
+
+    def snapshot(self, file_name):
+        """Return the last good snapshot of a file, or None."""
+        return self.snapshots.get(file_name)
+
+    def check_files(self):
+        self.check_requested.emit(list(self.subscribers))
+
+    def on_snapshot_loaded(self, snapshot):
+        self.snapshots[snapshot.file_name] = snapshot
+        self.data_changed.emit(snapshot)
+        for callback in self.subscribers.get(snapshot.file_name, []):
+            callback(snapshot)
+
+    def on_preloaded(self):
+        self.is_preloaded = True
+        self.preloaded.emit()
+
+    def stop(self):
+        """Stop the loader thread."""
+        if self.worker_thread.isRunning():
+            self.worker_thread.quit()
+            self.worker_thread.wait()
+
+
+_data_source = None
+
+def get_data_source():
+    """Return the data source shared by all slides."""
+    global _data_source
+    if _data_source is None:
+        _data_source = WeatherDataSource()
+    return _data_source
+
+
+class ConfigWatcher(QObject):
+    """Reload settings.json when it's saved and emit `changed(old, new)` if any setting changed."""
+
+    changed = pyqtSignal(object, object)
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.watcher = CoalescingWatcher(os.path.dirname(config.SETTINGS_PATH), parent=self)
+        self.watcher.watch_file(config.SETTINGS_PATH)
+        self.watcher.settled.connect(self.check)
+
+    def check(self):
+        old = config.get_config()
+        new = config.reload()
+        if new != old:
+            print("Settings reloaded.")
+            self.changed.emit(old, new)
+
+
+_config_watcher = None
+
+def get_config_watcher():
+    """Return the settings watcher shared by the app and all slides."""
+    global _config_watcher
+    if _config_watcher is None:
+        _config_watcher = ConfigWatcher()
+    return _config_watcher
@@ -1,20 +1,193 @@
 import os
-import json
 from PyQt5.QtWidgets import QApplication, QMainWindow, QStackedWidget
-from PyQt5.QtCore import QTimer, Qt
+from PyQt5.QtCore import QObject, QTimer, Qt, QCoreApplication, QEvent, pyqtSignal
 from PyQt5.QtGui import QCursor
 import subprocess  # For running external scripts
 from datetime import datetime
 import threading
+import time
+import config
+import metrics
+import profiler
+import working_store
+from weather_data import get_config_watcher, get_data_source
+from refresh_scheduler import RefreshScheduler
+from framebuffer import FramebufferBackend
+from frame_stats import FrameStats, FrameStatsOverlay
+from radar_player import RadarAnimationPlayer
+
+# Grace period between asking a timed-out script to stop and killing it
+TERMINATE_GRACE_SEC = 10
+
+# Startup fetches run one job at a time, in this order (the weather job does
+# home conditions before regional), beginning once the first frame is painted
+STARTUP_JOBS = ("weather", "radar")
+STARTUP_FIRST_JOB_MAX_WAIT_MS = 5000  # Start anyway if nothing has painted by then
+STARTUP_LOAD_MAX_WAIT_MS = 2000  # Show the window anyway if the last good data takes this long to load
+STARTUP_STAGE_MAX_WAIT_MS = 60000  # Start the next job anyway if one runs this long
+
+IMPORTED_AT = time.monotonic()
+
+
+def seconds_since_launch():
+    """Seconds since this process started, interpreter startup included."""
+    try:
+        with open("/proc/self/stat", "r") as f:
+            # Field 22 is the start time in clock ticks after boot; fields 3+ follow the ")"
+            start_ticks = int(f.read().rsplit(")", 1)[1].split()[19])
+        with open("/proc/uptime", "r") as f:
+            uptime = float(f.read().split()[0])
+        return uptime - start_ticks / os.sysconf("SC_CLK_TCK")
+    except (OSError, ValueError, IndexError):
+        return time.monotonic() - IMPORTED_AT
+
+
+class JobRunner(QObject):
+    """Runs one script as a subprocess on a background thread, never two at once.
+
+    A request while the script is running is coalesced into at most one
+    rerun after it finishes. A run that exceeds its timeout is terminated
+    (then killed) and counts as a failure.
+    """
+
+    finished = pyqtSignal(str)  # Job name, once the job goes idle; queued to the GUI thread
+
+    def __init__(self, name, script_path, timeout_sec, parent=None, args=()):
+        super().__init__(parent)
+        self.name = name
+        self.script_path = script_path
+        self.args = list(args)  # Extra command line arguments for the script
+        self.timeout_sec = timeout_sec
+        self.lock = threading.Lock()
+        self.running = False
+        self.queued = False
+        self.process = None
+        self.stopping = False
+
+        # Status, reported by status()
+        self.runs = 0
+        self.failures = 0
+        self.timeouts = 0
+        self.coalesced = 0  # Requests folded into a queued rerun or dropped as duplicates
+        self.last_started = None
+        self.last_duration_sec = None
+        self.last_result = None  # "ok", "failed" or "timeout"
+        self.last_success = None
+
+        app = QCoreApplication.instance()
+        if app is not None:
+            app.aboutToQuit.connect(self.stop)
+
+    def request(self):
+        """Run the script now, or once more after the current run if it's busy."""
+        with self.lock:
+            if self.stopping:
+                return
+            if self.running:
+                if self.queued:
+                    self.coalesced += 1
+                    print(f"{self.name} job is still running and a rerun is already queued.")
+                else:
+                    self.queued = True
+                    print(f"{self.name} job is still running; queued one rerun.")
+                return
+            self.running = True
+        threading.Thread(target=self.run_until_idle, name=f"{self.name}-job", daemon=True).start()
+
+    def run_until_idle(self):
+        while True:
+            self.run_once()
+            with self.lock:
+                if not self.queued or self.stopping:
+                    self.running = False
+                    self.queued = False
+                    break
+                self.queued = False
+        self.finished.emit(self.name)
+
+    def run_once(self):
+        started = time.time()
+        with self.lock:
+            self.last_started = started
+        result = "failed"
+        try:
+            # WEATHER_JOB tags the script's profiles with the job it runs for
+            process = subprocess.Popen(["python3", self.script_path, *self.args],
+                                       env=dict(os.environ, WEATHER_JOB=self.name))
+            with self.lock:
+                self.process = process
+                stopping = self.stopping
+            if stopping:
+                # stop() ran before the process was visible to it
+                self.terminate(process)
+                return
+            try:
+                returncode = process.wait(timeout=self.timeout_sec)
+                result = "ok" if returncode == 0 else "failed"
+                if returncode != 0:
+                    print(f"Error running {self.name} script: exit status {returncode}")
+            except subprocess.TimeoutExpired:
+                print(f"{self.name} script ran longer than {self.timeout_sec} s; stopping it.")
+                self.terminate(process)
+                result = "timeout"
+        except Exception as e:
+            print(f"Unexpected error running {self.name} script: {e}")
+        finally:
+            metrics.inc("weather_job_runs_total", job=self.name, result=result)
+            metrics.observe("weather_job_seconds", time.time() - started, job=self.name)
+            with self.lock:
+                self.process = None
+                self.runs += 1
+                self.last_duration_sec = round(time.time() - started, 1)
+                self.last_result = result
+                if result == "ok":
+                    self.last_success = time.time()
+                    print(f"{self.name} script executed successfully in {self.last_duration_sec} s.")
+                else:
+                    self.failures += 1
+                    self.timeouts += result == "timeout"
+
+    def terminate(self, process):
+        """SIGTERM, then SIGKILL if it doesn't exit within the grace period."""
+        process.terminate()
+        try:
+            process.wait(timeout=TERMINATE_GRACE_SEC)
+        except subprocess.TimeoutExpired:
+            process.kill()
+            process.wait()
+
+    def status(self):
+        """Running and queue state plus the outcome of recent runs."""
+        with self.lock:
+            return {
+                "running": self.running,
+                "queued": self.queued,
+                "runs": self.runs,
+                "failures": self.failures,
+                "timeouts": self.timeouts,
+                "coalesced": self.coalesced,
+                "last_started": self.last_started,
+                "last_duration_sec": self.last_duration_sec,
+                "last_result": self.last_result,
+                "last_success": self.last_success,
+            }
+
+    def stop(self):
+        """Drop any queued rerun and stop a running script (on quit)."""
+        with self.lock:
+            self.stopping = True
+            self.queued = False
+            process = self.process
+        if process is not None and process.poll() is None:
+            self.terminate(process)
+
 
 class WeatherApp(QMainWindow):
     def __init__(self):
         # Load settings from settings.json
-        settings = self.load_settings()
-        debug = settings.get("debug", False)
-        self.slide_debug = settings.get("slide_debug", -1)  # Default to -1 (cycle normally)
-        radar_refresh = settings.get("radar_refesh_min")
-        weather_refresh = settings.get("weather_refesh_min")
+        settings = config.get_config()
+        debug = settings.debug
+        self.slide_debug = settings.slide_debug  # -1 cycles normally
 
         super().__init__()
         self.setWindowTitle("Weather GUI Slideshow")
@@ -36,12 +209,22 @@ class WeatherApp(QMainWindow):
         self.current_index = 0
 
         # Load GUIs dynamically
+        self.frame_stats = None
         self.load_guis()
 
+        # Debug mode keeps paint, clock and radar frame timings, logged and (debug_hud) on screen
+        self.frame_stats_overlay = None
+        if debug:
+            self.frame_stats = FrameStats(self.guis, self)
+            for player in self.findChildren(RadarAnimationPlayer):
+                player.frame_paced.connect(self.frame_stats.radar_frame)
+            self.frame_stats_overlay = FrameStatsOverlay(self.frame_stats, self)
+            self.frame_stats_overlay.setVisible(settings.debug_hud)
+
         # Set up a timer to cycle through GUIs
         self.timer = QTimer(self)
         self.timer.timeout.connect(self.next_gui)
-        self.timer.start(settings.get("cycle_interval", 5000))  # Default cycle interval 5000ms
+        self.timer.start(settings.cycle_interval)
 
         # If slide_debug is set to a valid slide number, show it and stop cycling
         if debug and 1 <= self.slide_debug <= len(self.guis):
@@ -49,100 +232,189 @@ class WeatherApp(QMainWindow):
             self.timer.stop()
 
 
-        # Timer to run radar script every 5 minutes
+        # The next radar and weather runs are planned after each run finishes,
+        # from the weather activity and upstream update times
+        self.scheduler = RefreshScheduler()
+        self.last_run = {}  # Job name -> when its last run finished
+
+        # One runner per script, so runs of the same job never overlap
+        script_dir = os.path.dirname(os.path.abspath(__file__))
+        self.jobs = {
+            "radar": JobRunner("radar", os.path.join(script_dir, "get_radar.py"),
+                               settings.radar_job_timeout_sec, self),
+            # Home and regional weather in one pass
+            "weather": JobRunner("weather", os.path.join(script_dir, "weather_service.py"),
+                                 settings.weather_job_timeout_sec, self),
+        }
+        for job in self.jobs.values():
+            job.finished.connect(self.on_job_finished)
+
+        # Timer to run the radar script
         if debug is False:
-            # Run radar script on startup in a separate thread
-            threading.Thread(target=self.run_radar_script, daemon=True).start()
             self.radar_timer = QTimer(self)
-            self.radar_timer.timeout.connect(self.run_radar_script_in_thread)
-            self.radar_timer.start(radar_refresh * 60 * 1000)  # Every x minutes (set in json)
+            self.radar_timer.setSingleShot(True)
+            self.radar_timer.timeout.connect(self.jobs["radar"].request)
 
 
-        # Timer to run weather script every hour
+        # Timer to run the weather service
         if debug is False:
-            # Run weather script on startup in a separate thread
-            threading.Thread(target=self.run_weather_script, daemon=True).start()
             self.weather_timer = QTimer(self)
-            self.weather_timer.timeout.connect(self.run_weather_script_in_thread)
-            self.weather_timer.start(weather_refresh * 60 * 1000)  # Every x minutes (set in json)
+            self.weather_timer.setSingleShot(True)
+            self.weather_timer.timeout.connect(self.jobs["weather"].request)
 
-        # Timer to run regional weather script every hour
-        if debug is False:
-            # Run weather script on startup in a separate thread
-            threading.Thread(target=self.run_regional_weather_script, daemon=True).start()
-            self.regional_weather_timer = QTimer(self)
-            self.regional_weather_timer.timeout.connect(self.run_regional_weather_script_in_thread)
-            self.regional_weather_timer.start((weather_refresh * 60 * 1000)+60000)  # Every x minutes + 60 seconds (set in json) maybe there's a colission? 
+        # The slides start out showing the last good data on disk; the startup
+        # fetches wait for the first paint so they don't compete with building
+        # the GUI, then run one at a time in priority order
+        self.startup_jobs = list(STARTUP_JOBS) if debug is False else []
+        self.startup_timer = QTimer(self)
+        self.startup_timer.setSingleShot(True)
+        self.startup_timer.timeout.connect(self.start_next_startup_job)
+        if self.startup_jobs:
+            self.startup_timer.start(STARTUP_FIRST_JOB_MAX_WAIT_MS)
 
+        # Time to first (meaningful) paint, logged once
+        self.first_paint_sec = None
+        self.first_meaningful_paint_sec = None
+        for index in range(self.stack.count()):
+            self.stack.widget(index).installEventFilter(self)
 
+        # With the working store in RAM, copy it back to the SD card now and
+        # then (off the GUI thread) and once more on quit
+        self.checkpoint_timer = QTimer(self)
+        self.checkpoint_timer.timeout.connect(self.checkpoint_in_background)
+        if settings.working_store_dir:
+            self.checkpoint_timer.start(settings.checkpoint_interval_min * 60 * 1000)
+            QCoreApplication.instance().aboutToQuit.connect(working_store.checkpoint)
 
+        # Metrics from this process go to the shared registry; the endpoint serves every process's
+        metrics.start_flusher()
+        if settings.metrics_port:
+            try:
+                self.metrics_server = metrics.serve(settings.metrics_port)
+            except OSError as e:
+                print(f"Couldn't start the metrics endpoint on port {settings.metrics_port}: {e}")
 
-    def check_and_run_radar(self):
-        """Check if it's the 15-minute mark of the hour and run radar script."""
-        now = datetime.now()
-        if now.minute == 15 and now.second == 0:  # At the 15-minute mark
-            print("Running radar script at 15-minute mark...")
-            self.run_radar_script_in_thread()
+        # Pick up edits to settings.json without a restart
+        get_config_watcher().changed.connect(self.apply_settings)
 
-    def run_radar_script_in_thread(self):
-        """Run the radar script in a separate thread."""
-        threading.Thread(target=self.run_radar_script, daemon=True).start()
+        # The weather job's new snapshot lands after the job has finished and
+        # been planned, so plan again from the conditions it brings
+        get_data_source().subscribe("home_weather.json", self.on_home_weather)
 
-    def run_radar_script(self):
-        """Run the radar_getter/get_radar.py script."""
-        radar_script_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "get_radar.py")
-        try:
-            subprocess.run(["python3", radar_script_path], check=True)
-            print("Radar script executed successfully.")
-        except subprocess.CalledProcessError as e:
-            print(f"Error running radar script: {e}")
-        except Exception as e:
-            print(f"Unexpected error: {e}")
+    def apply_settings(self, old, new):
+        """Apply changed settings to the running timers.
 
-    def run_weather_script_in_thread(self):
-        """Run the weather script in a separate thread."""
-        threading.Thread(target=self.run_weather_script, daemon=True).start()
+        `debug` only takes effect on restart, since it decides the window
+        flags and whether the fetch timers exist at all; so does
+        `working_store_dir`, since every module resolved its paths at startup.
+        The metrics endpoint keeps the port it started on.
+        """
+        if new.cycle_interval != old.cycle_interval:
+            self.timer.setInterval(new.cycle_interval)
+        if new.slide_debug != old.slide_debug:
+            self.slide_debug = new.slide_debug
+            if new.debug and 1 <= self.slide_debug <= len(self.guis):
+                self.stack.setCurrentIndex(self.slide_debug - 1)
+                self.timer.stop()
+            elif self.slide_debug == -1 and not self.timer.isActive():
+                self.timer.start(new.cycle_interval)
+        if self.frame_stats is not None:
+            self.frame_stats_overlay.setVisible(new.debug_hud)
+            if new.debug_stats_log_sec != old.debug_stats_log_sec:
+                self.frame_stats.set_log_interval(new.debug_stats_log_sec)
+        if new.checkpoint_interval_min != old.checkpoint_interval_min and self.checkpoint_timer.isActive():
+            self.checkpoint_timer.start(new.checkpoint_interval_min * 60 * 1000)
+        for job, timer_name in (("radar", "radar_timer"), ("weather", "weather_timer")):
+            self.jobs[job].timeout_sec = getattr(new, f"{job}_job_timeout_sec")
+            if not hasattr(self, timer_name) or not getattr(self, timer_name).isActive():
+                continue  # Not running, or a run is in flight and will plan the next one
+            refresh_fields = ("adaptive_refresh", f"{job}_refresh_min",
+                              f"{job}_refresh_fastest_min", f"{job}_refresh_slowest_min")
+            if any(getattr(new, name) != getattr(old, name) for name in refresh_fields):
+                self.schedule_next(job)
 
-    def run_weather_script(self):
-        """Run the weather_getter/get_weather.py script."""
-        weather_script_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "get_weather.py")
-        try:
-            subprocess.run(["python3", weather_script_path], check=True)
-            print("Weather script executed successfully.")
-        except subprocess.CalledProcessError as e:
-            print(f"Error running weather script: {e}")
-        except Exception as e:
-            print(f"Unexpected error: {e}")
+    def show_when_loaded(self):
+        """Show the window once the loader thread has read the last good data, so the first
+        paint already has it; after STARTUP_LOAD_MAX_WAIT_MS at most."""
+        source = get_data_source()
+        if source.is_preloaded:
+            self.show()
+            return
+        source.preloaded.connect(self.show)
+        QTimer.singleShot(STARTUP_LOAD_MAX_WAIT_MS, self.show)
 
-    def run_regional_weather_script_in_thread(self):
-        """Run the weather script in a separate thread."""
-        threading.Thread(target=self.run_regional_weather_script, daemon=True).start()
+    def start_next_startup_job(self):
+        """Run the next startup fetch; the one after it follows when this one finishes."""
+        if not self.startup_jobs:
+            return
+        job = self.startup_jobs.pop(0)
+        print(f"Startup: running the {job} job {seconds_since_launch():.2f} s after launch.")
+        self.jobs[job].request()
+        if self.startup_jobs:
+            self.startup_timer.start(STARTUP_STAGE_MAX_WAIT_MS)
 
-    def run_regional_weather_script(self):
-        """Run the weather_getter/get_weather.py script."""
-        regional_weather_script_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "get_regional_weather.py")
-        try:
-            subprocess.run(["python3", regional_weather_script_path], check=True)
-            print("Weather script executed successfully.")
-        except subprocess.CalledProcessError as e:
-            print(f"Error running weather script: {e}")
-        except Exception as e:
-            print(f"Unexpected error: {e}")
+    def on_job_finished(self, job):
+        self.last_run[job] = time.time()
+        self.schedule_next(job)
+        if self.startup_jobs:
+            self.startup_timer.start(0)
 
+    def eventFilter(self, watched, event):
+        if event.type() == QEvent.Paint and watched is self.stack.currentWidget():
+            self.on_slide_painted(watched)
+        return super().eventFilter(watched, event)
+
+    def on_slide_painted(self, slide):
+        """Log the time to the first paint and to the first paint with real data."""
+        if self.first_paint_sec is None:
+            self.first_paint_sec = seconds_since_launch()
+            if self.startup_jobs:
+                self.startup_timer.start(0)
+        has_data = getattr(slide, "has_data", None)
+        if has_data is not None and not has_data():
+            return
+        self.first_meaningful_paint_sec = seconds_since_launch()
+        source = "fetched" if any(job.runs for job in self.jobs.values()) else "persisted"
+        print(f"First meaningful paint {self.first_meaningful_paint_sec:.2f} s after launch "
+              f"({type(slide).__module__}, {source} data; first paint {self.first_paint_sec:.2f} s).")
+        for index in range(self.stack.count()):
+            self.stack.widget(index).removeEventFilter(self)
+
+    def schedule_next(self, job):
+        """Plan the next run of a job and arm its timer."""
+        timer = getattr(self, f"{job}_timer", None)
+        if timer is None:
+            return
+        home = get_data_source().snapshot("home_weather.json")
+        conditions = home.data["conditions"] if home is not None else None
+        tendency = home.data.get("pressure_tendency_inhg") if home is not None else None
+        delay = self.scheduler.plan(job, conditions, tendency, self.last_run.get(job))
+        entry = self.scheduler.status()[job]
+        print(f"Next {job} refresh at {entry['next_run']} ({entry['level']}: {entry['reason']})")
+        timer.start(int(delay * 1000))
+
+    def on_home_weather(self, snapshot):
+        """New home conditions: re-plan the refreshes that are waiting to run."""
+        for job in self.jobs:
+            timer = getattr(self, f"{job}_timer", None)
+            if timer is not None and timer.isActive():
+                self.schedule_next(job)
+
+    def checkpoint_in_background(self):
+        threading.Thread(target=working_store.checkpoint, name="checkpoint", daemon=True).start()
+
+    def job_status(self):
+        """Status of every background job (see JobRunner.status)."""
+        return {name: job.status() for name, job in self.jobs.items()}
+
+    def check_and_run_radar(self):
+        """Check if it's the 15-minute mark of the hour and run radar script."""
+        now = datetime.now()
+        if now.minute == 15 and now.second == 0:  # At the 15-minute mark
+            print("Running radar script at 15-minute mark...")
+            self.jobs["radar"].request()
 
 
-    def load_settings(self):
-        """Load settings from settings.json file."""
-        settings_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "settings.json")
-        try:
-            with open(settings_path, "r") as file:
-                return json.load(file)
-        except FileNotFoundError:
-            print("settings.json not found. Using default settings.")
-            return {}
-        except json.JSONDecodeError:
-            print("Error decoding settings.json. Using default settings.")
-            return {}
 
     def find_slides(self):
         """Find all valid slide files in the current directory."""
@@ -160,10 +432,22 @@ class WeatherApp(QMainWindow):
                 module = __import__(gui_name)
                 gui_class = getattr(module, "SlideGUI")
                 gui_instance = gui_class()
+                gui_instance.paintEvent = self.timed_paint(gui_name, gui_instance.paintEvent)
                 self.stack.addWidget(gui_instance)
             except (ImportError, AttributeError) as e:
                 print(f"Error loading {gui_name}: {e}")
 
+    def timed_paint(self, gui_name, paint_event):
+        """Wrap a slide's paintEvent so its paint time goes to the metrics (and the debug stats)."""
+        def paint(event):
+            start = time.perf_counter()
+            paint_event(event)
+            elapsed = time.perf_counter() - start
+            metrics.observe("weather_paint_seconds", elapsed, slide=gui_name)
+            if self.frame_stats is not None:
+                self.frame_stats.paint(gui_name, elapsed)
+        return paint
+
     def next_gui(self):
         """Switch to the next GUI in the stack."""
         if self.slide_debug == -1:  # Only cycle if slide_debug is -1
@@ -171,8 +455,35 @@ class WeatherApp(QMainWindow):
             self.stack.setCurrentIndex(self.current_index)
         
 if __name__ == "__main__":
+    import signal
     import sys
+    settings = config.get_config()
+
+    # --framebuffer [DEVICE] (or framebuffer_device in settings) draws straight to the framebuffer
+    framebuffer_device = settings.framebuffer_device
+    if "--framebuffer" in sys.argv:
+        index = sys.argv.index("--framebuffer") + 1
+        framebuffer_device = sys.argv[index] if index < len(sys.argv) else "/dev/fb0"
+    if framebuffer_device:
+        os.environ["QT_QPA_PLATFORM"] = "offscreen"  # No X server or compositor
+
     app = QApplication(sys.argv)
     window = WeatherApp()
-    window.show()
+    if framebuffer_device:
+        # Slides still run as if shown, but Qt never paints a window for them
+        window.setAttribute(Qt.WA_DontShowOnScreen)
+        window.framebuffer = FramebufferBackend(
+            window, framebuffer_device, settings.framebuffer_bits_per_pixel,
+            settings.framebuffer_interval_ms, window)
+    window.show_when_loaded()
+
+    # systemd stops the app with SIGTERM; quit through Qt so aboutToQuit
+    # handlers (job shutdown, the working store checkpoint) still run
+    signal.signal(signal.SIGTERM, lambda signum, frame: app.quit())
+    # SIGUSR1 or `python3 profiler.py start` profiles the running app
+    profiler.install()
+    # Python only runs signal handlers when it gets control, so give it a turn now and then
+    signal_timer = QTimer()
+    signal_timer.timeout.connect(lambda: None)
+    signal_timer.start(500)
     sys.exit(app.exec_())
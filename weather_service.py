@@ -0,0 +1,171 @@
+import json
+import os
+import time
+import get_weather
+import get_regional_weather
+import api_budget
+import config
+import freshness
+import metrics
+import profiler
+import working_store
+from history_store import HistoryStore, pressure_trend
+
+# One job for the home location and every regional location. Locations whose
+# coordinates round to the same grid cell share one API call, and responses
+# are cached on disk for a while so back-to-back runs (or the standalone
+# get_weather.py / get_regional_weather.py scripts) don't refetch them.
+
+settings = config.get_config()
+
+CACHE_PATH = os.path.join(working_store.directory("weatherdata"), "cache", "observations.json")
+CACHE_TTL = settings.observation_cache_ttl_sec  # OWM current weather updates about every 10 minutes
+GRID_DECIMALS = settings.dedupe_grid_decimals  # 2 decimals is roughly a 1 km cell
+STALE_LIMIT = 6 * 60 * 60  # Expired responses are kept this long to stand in for deferred requests
+
+
+# Cache key for the grid cell a coordinate falls in
+def grid_key(lat, lon):
+    return f"{round(lat, GRID_DECIMALS):.{GRID_DECIMALS}f},{round(lon, GRID_DECIMALS):.{GRID_DECIMALS}f}"
+
+
+class ObservationCache:
+    """Raw current-weather responses keyed by grid cell, with a TTL, persisted as JSON."""
+
+    def __init__(self, path=CACHE_PATH, ttl=CACHE_TTL):
+        self.path = path
+        self.ttl = ttl
+        self.entries = {}  # grid key -> {"fetched_at": epoch seconds, "data": raw response}
+        self.hits = 0
+        self.misses = 0
+        try:
+            with open(self.path, 'r') as f:
+                self.entries = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            pass
+
+    def get(self, key):
+        """Return the cached response for `key` if it's still fresh, else None."""
+        entry = self.entries.get(key)
+        if entry is not None and time.time() - entry['fetched_at'] < self.ttl:
+            self.hits += 1
+            metrics.inc("weather_cache_requests_total", cache="observations", result="hit")
+            return entry['data']
+        self.misses += 1
+        metrics.inc("weather_cache_requests_total", cache="observations", result="miss")
+        return None
+
+    def get_stale(self, key):
+        """Return the cached response for `key` regardless of age, or None."""
+        entry = self.entries.get(key)
+        return entry['data'] if entry is not None else None
+
+    def fetched_at(self, key):
+        """When the response cached for `key` was fetched, or None."""
+        entry = self.entries.get(key)
+        return entry['fetched_at'] if entry is not None else None
+
+    def put(self, key, data):
+        self.entries[key] = {'fetched_at': time.time(), 'data': data}
+
+    def save(self):
+        """Drop entries too old to be useful and write the cache atomically."""
+        now = time.time()
+        self.entries = {
+            key: entry for key, entry in self.entries.items()
+            if now - entry['fetched_at'] < max(self.ttl, STALE_LIMIT)
+        }
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        temp_path = f"{self.path}.tmp"
+        with open(temp_path, 'w') as f:
+            json.dump(self.entries, f)
+        os.replace(temp_path, self.path)
+
+
+# Fetch current weather for every location, one request per grid cell.
+# Returns one entry per location, in order: raw data or the exception that stopped it.
+def fetch_observations(locations, cache):
+    # grid key -> first location in that cell. Home is listed first, so a
+    # cell it shares with a regional city is fetched at home priority.
+    cells = {}
+    for entry in locations:
+        cells.setdefault(grid_key(entry['lat'], entry['lon']), entry)
+
+    results_by_key = {}
+    to_fetch = []
+    for key, entry in cells.items():
+        data = cache.get(key)
+        if data is not None:
+            results_by_key[key] = data
+        else:
+            to_fetch.append((key, entry))
+
+    fetched = get_regional_weather.fetch_all_weather([entry for _, entry in to_fetch])
+    for (key, _), result in zip(to_fetch, fetched):
+        if isinstance(result, api_budget.BudgetDeferred) and cache.get_stale(key) is not None:
+            print(f"Using older cached data for {key}: {result}")
+            result = cache.get_stale(key)
+        elif not isinstance(result, Exception):
+            cache.put(key, result)
+        results_by_key[key] = result
+    cache.save()
+
+    print(f"{len(locations)} locations, {len(cells)} unique cells, "
+          f"{len(cells) - len(to_fetch)} from cache, {len(to_fetch)} fetched")
+    return [results_by_key[grid_key(entry['lat'], entry['lon'])] for entry in locations]
+
+
+# Provenance for an output built from these results: its oldest observation and oldest fetch
+def results_provenance(locations, results, cache):
+    observed = [result.get('dt') for result in results if isinstance(result, dict) and result.get('dt') is not None]
+    fetched = [cache.fetched_at(grid_key(entry['lat'], entry['lon'])) for entry, result in zip(locations, results)
+               if not isinstance(result, Exception)]
+    fetched = [fetched_at for fetched_at in fetched if fetched_at is not None]
+    return freshness.provenance(min(observed, default=None), min(fetched, default=None))
+
+
+# Fetch and write the requested outputs in one pass. Returns False if the home fetch failed.
+def run(home=True, regional=True):
+    config.require_api_key(settings)
+    locations = []
+    if home:
+        locations.append({'city': 'home', 'lat': get_weather.LAT, 'lon': get_weather.LON, 'priority': api_budget.HOME})
+    if regional:
+        locations.extend(get_regional_weather.LAT_LONS)
+
+    print("Fetching weather data...")
+    cache = ObservationCache()
+    results = fetch_observations(locations, cache)
+
+    ok = True
+    if home:
+        home_result = results.pop(0)
+        if isinstance(home_result, Exception):
+            print(f"Error fetching home weather: {home_result}")
+            ok = False
+        else:
+            # Record the observation; the trend is its 3-hour pressure tendency
+            history = HistoryStore("home")
+            history.append_response(home_result)
+            print("Parsing weather data...")
+            weather = get_weather.parse_weather(home_result, pressure_trend(history))
+            # For the GUI's refresh scheduler, so it doesn't read the history itself
+            weather['pressure_tendency_inhg'] = history.tendency("pressure_inhg", hours=3)
+            weather['provenance'] = results_provenance(locations[:1], [home_result], cache)
+            get_weather.save_weather(weather)
+
+    if regional:
+        output_data = get_regional_weather.build_regional_weather(get_regional_weather.LAT_LONS, results)
+        output_data['provenance'] = results_provenance(get_regional_weather.LAT_LONS, results, cache)
+        get_regional_weather.save_regional_weather(output_data)
+
+    return ok
+
+
+def main():
+    profiler.install()  # SIGUSR1 or `python3 profiler.py start` profiles this run
+    if not run():
+        exit(1)
+
+if __name__ == "__main__":
+    main()
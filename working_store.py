@@ -0,0 +1,249 @@
+"""
+Keeps weatherdata/ and weathertiles/ in RAM, checkpointed to the SD card.
+
+Every radar run writes and rewrites big PNGs and every layer GIF, and the
+weather jobs rewrite their JSON each refresh. On a display that boots from
+an SD card that wears the card out. With working_store_dir set to a tmpfs
+directory (e.g. /dev/shm/crt_weather), every module reads and writes the
+working copies there instead; call
+
+    directory("weatherdata")
+
+wherever a path under weatherdata/ (or weathertiles/) is built. The first
+process to ask after boot restores the working copies from the persistent
+ones next to this file. checkpoint() copies back only the files that
+changed and removes persistent files that were deleted; the GUI runs it
+every checkpoint_interval_min and on shutdown.
+
+With working_store_dir empty the persistent directories are used directly,
+as before. Restart the app after changing it.
+
+    python3 working_store.py status       checkpoint totals and SD card write counters
+    python3 working_store.py checkpoint   checkpoint now
+"""
+import fcntl
+import json
+import os
+import threading
+import time
+from datetime import datetime
+import config
+import snapshot_format
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+WORKING_DIRS = ("weatherdata", "weathertiles")
+
+# In the working root; it existing means the working copies were restored
+STATS_FILE = "working_store.json"
+LOCK_FILE = ".lock"
+
+# Transient files that are never copied either way
+SKIP_SUFFIXES = (".tmp", ".lock")
+
+_restored_root = None
+_checkpoint_lock = threading.Lock()
+
+
+def working_root():
+    """The working store directory, or "" when it's disabled."""
+    return config.get_config().working_store_dir
+
+
+def directory(name):
+    """The directory to read and write `name` ("weatherdata" or "weathertiles") in."""
+    root = working_root()
+    if not root:
+        return os.path.join(SCRIPT_DIR, name)
+    ensure_restored(root)
+    return os.path.join(root, name)
+
+
+def tree_files(top):
+    """Relative paths of the files under `top`, skipping transient ones."""
+    found = []
+    for dir_path, _, file_names in os.walk(top):
+        for file_name in file_names:
+            if not file_name.endswith(SKIP_SUFFIXES):
+                found.append(os.path.relpath(os.path.join(dir_path, file_name), top))
+    return found
+
+
+def unchanged(source, target):
+    """Whether `target` is already a copy of `source` (copies keep the mtime)."""
+    try:
+        source_stat = os.stat(source)
+        target_stat = os.stat(target)
+    except FileNotFoundError:
+        return False
+    return (source_stat.st_size, source_stat.st_mtime_ns) == (target_stat.st_size, target_stat.st_mtime_ns)
+
+
+def copy_file(source, target, durable):
+    """Copy a file, keeping its mtime. Returns the bytes written.
+
+    Durable copies (to the SD card) go through snapshot_format.write_atomic,
+    so a power cut mid-checkpoint leaves the previous copy intact.
+    """
+    with open(source, "rb") as f:
+        payload = f.read()
+    if durable:
+        snapshot_format.write_atomic(target, payload)
+    else:
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        with open(target, "wb") as f:
+            f.write(payload)
+    stat = os.stat(source)
+    os.utime(target, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+    return len(payload)
+
+
+def device_written_bytes(path=SCRIPT_DIR):
+    """(device name, bytes written to it since boot) for the block device holding `path`.
+
+    Read from /sys/dev/block/MAJ:MIN/stat, so it counts every writer on the
+    device, not just this app. (None, None) if it's unavailable.
+    """
+    stat = os.stat(path)
+    sys_path = f"/sys/dev/block/{os.major(stat.st_dev)}:{os.minor(stat.st_dev)}"
+    try:
+        with open(os.path.join(sys_path, "stat"), "r") as f:
+            sectors = int(f.read().split()[6])  # Sectors written, always 512 bytes
+    except (OSError, ValueError, IndexError):
+        return None, None
+    return os.path.basename(os.path.realpath(sys_path)), sectors * 512
+
+
+def load_stats(root):
+    try:
+        with open(os.path.join(root, STATS_FILE), "r") as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+
+
+def save_stats(root, stats):
+    snapshot_format.write_atomic(os.path.join(root, STATS_FILE), json.dumps(stats, indent=4).encode("utf-8"))
+
+
+def ensure_restored(root):
+    """Restore the working copies once per boot (the stats file lives in RAM too)."""
+    global _restored_root
+    if _restored_root == root:
+        return
+    os.makedirs(root, exist_ok=True)
+    # Fetch scripts may start alongside the GUI; only one of them restores
+    with open(os.path.join(root, LOCK_FILE), "a") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        if load_stats(root) is None:
+            restore(root)
+    _restored_root = root
+
+
+def restore(root):
+    """Copy the persistent directories into the working store."""
+    started = time.time()
+    files = restored_bytes = 0
+    for name in WORKING_DIRS:
+        persistent_dir = os.path.join(SCRIPT_DIR, name)
+        for relative in tree_files(persistent_dir):
+            restored_bytes += copy_file(os.path.join(persistent_dir, relative),
+                                        os.path.join(root, name, relative), durable=False)
+            files += 1
+        os.makedirs(os.path.join(root, name), exist_ok=True)
+    device, written = device_written_bytes()
+    save_stats(root, {
+        "restored_at": datetime.now().isoformat(timespec="seconds"),
+        "restored_files": files,
+        "restored_bytes": restored_bytes,
+        "checkpoints": 0,
+        "last_checkpoint": None,
+        "checkpoint_files": 0,
+        "checkpoint_bytes": 0,
+        "checkpoint_deletes": 0,
+        "device": device,
+        "device_written_bytes_at_restore": written,
+    })
+    print(f"Working store: restored {files} files ({restored_bytes / 1e6:.1f} MB) "
+          f"to {root} in {time.time() - started:.1f} s.")
+
+
+def checkpoint():
+    """Copy changed working files back to persistent storage and drop deleted ones.
+
+    Returns the updated stats, or None when the working store is disabled.
+    Safe to call from any thread; overlapping calls run one after the other.
+    """
+    root = working_root()
+    if not root:
+        return None
+    ensure_restored(root)
+    with _checkpoint_lock:
+        started = time.time()
+        files = written = deletes = 0
+        for name in WORKING_DIRS:
+            working_dir = os.path.join(root, name)
+            persistent_dir = os.path.join(SCRIPT_DIR, name)
+            if not os.path.isdir(working_dir):
+                continue  # Never mirror a missing directory as "everything was deleted"
+            working = tree_files(working_dir)
+            for relative in working:
+                source = os.path.join(working_dir, relative)
+                target = os.path.join(persistent_dir, relative)
+                if unchanged(source, target):
+                    continue
+                try:
+                    written += copy_file(source, target, durable=True)
+                except FileNotFoundError:
+                    continue  # Deleted since we listed it; the next checkpoint drops it
+                files += 1
+            for relative in set(tree_files(persistent_dir)) - set(working):
+                os.remove(os.path.join(persistent_dir, relative))
+                deletes += 1
+
+        stats = load_stats(root)
+        stats["checkpoints"] += 1
+        stats["last_checkpoint"] = datetime.now().isoformat(timespec="seconds")
+        stats["checkpoint_files"] += files
+        stats["checkpoint_bytes"] += written
+        stats["checkpoint_deletes"] += deletes
+        save_stats(root, stats)
+    print(f"Working store checkpoint: {files} files ({written / 1e6:.2f} MB) written, "
+          f"{deletes} deleted in {time.time() - started:.1f} s.")
+    return stats
+
+
+def main():
+    import argparse
+    parser = argparse.ArgumentParser(description="RAM working store for weatherdata/ and weathertiles/.")
+    parser.add_argument("command", nargs="?", default="status", choices=("status", "checkpoint"))
+    args = parser.parse_args()
+
+    root = working_root()
+    if not root:
+        print("The working store is off (working_store_dir is empty); files are written to the SD card directly.")
+    elif args.command == "checkpoint":
+        checkpoint()
+    else:
+        ensure_restored(root)
+        stats = load_stats(root)
+        print(f"Working store: {root}")
+        print(f"  restored {stats['restored_at']}: {stats['restored_files']} files, "
+              f"{stats['restored_bytes'] / 1e6:.1f} MB")
+        print(f"  checkpoints: {stats['checkpoints']} (last {stats['last_checkpoint']}), "
+              f"{stats['checkpoint_files']} files, {stats['checkpoint_bytes'] / 1e6:.2f} MB written, "
+              f"{stats['checkpoint_deletes']} deleted")
+
+    # Device-wide counter, to compare runs with the working store on and off
+    device, written = device_written_bytes()
+    if device is None:
+        print("No block device write counter for this directory.")
+        return
+    print(f"{device}: {written / 1e6:.1f} MB written since boot")
+    stats = load_stats(root) if root else None
+    if stats and stats["device"] == device and stats["device_written_bytes_at_restore"] is not None:
+        print(f"{device}: {(written - stats['device_written_bytes_at_restore']) / 1e6:.1f} MB "
+              f"written since the working store was restored")
+
+if __name__ == "__main__":
+    main()